@@ -1,6 +1,11 @@
+# Solo lo que necesitan todas las páginas se importa aquí: el motor, numpy y
+# plotly se importan dentro de las páginas que los usan, para que el arranque
+# en frío y las páginas sin gráficos no paguen su carga
+import time
+import uuid
 import streamlit as st
-import plotly.graph_objects as go
-from renta import calcular_renta_total
+from estilos import HOJA_ESTILOS
+from historial import HistorialCalculos
 from datetime import datetime
 
 st.set_page_config(
@@ -10,279 +15,34 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# CSS (mismo diseño oscuro minimalista)
-st.markdown("""
-<style>
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
-    
-    :root {
-        --bg-dark: #1a1d29;
-        --bg-medium: #252837;
-        --text-light: #e2e8f0;
-        --text-medium: #94a3b8;
-        --accent: #3b82f6;
-        --accent-hover: #2563eb;
-    }
-    
-    .main {
-        font-family: 'Inter', sans-serif;
-        background: var(--bg-dark);
-        color: var(--text-light);
-    }
-    
-    .block-container {
-        padding: 2rem;
-        max-width: 1400px;
-        background: var(--bg-dark);
-    }
-    
-    .hero-header {
-        background: var(--bg-medium);
-        padding: 3rem 2rem;
-        border-radius: 12px;
-        text-align: center;
-        color: var(--text-light);
-        margin-bottom: 2rem;
-        border: 1px solid rgba(59, 130, 246, 0.2);
-    }
-    
-    .hero-header h1 {
-        font-size: 2.5rem;
-        font-weight: 700;
-        margin-bottom: 0.5rem;
-        color: var(--text-light);
-    }
-    
-    .hero-header p {
-        font-size: 1.1rem;
-        color: var(--text-medium);
-    }
-    
-    [data-testid="stExpander"] {
-        background: transparent !important;
-        border: 1px solid rgba(59, 130, 246, 0.3);
-        border-radius: 8px;
-        margin-bottom: 1rem;
-    }
-    
-    .streamlit-expanderHeader {
-        background: var(--bg-medium) !important;
-        color: var(--text-light) !important;
-        border-radius: 8px;
-        font-weight: 600;
-        padding: 1rem;
-    }
-    
-    .streamlit-expanderHeader:hover {
-        background: rgba(59, 130, 246, 0.1) !important;
-    }
-    
-    .streamlit-expanderContent {
-        background: var(--bg-medium);
-        padding: 1.5rem;
-        border-radius: 0 0 8px 8px;
-    }
-    
-    .seccion-titulo {
-        font-size: 1.1rem;
-        font-weight: 600;
-        color: var(--text-light);
-        margin: 1.5rem 0 1rem 0;
-        padding-bottom: 0.5rem;
-        border-bottom: 1px solid rgba(59, 130, 246, 0.3);
-    }
-    
-    .resultado-hero {
-        background: var(--bg-medium);
-        padding: 3rem;
-        border-radius: 12px;
-        text-align: center;
-        color: var(--text-light);
-        margin: 2rem 0;
-        border: 1px solid rgba(59, 130, 246, 0.3);
-    }
-    
-    .resultado-monto {
-        font-size: 4rem;
-        font-weight: 800;
-        margin: 1rem 0;
-        color: var(--text-light);
-    }
-    
-    .resultado-badge {
-        display: inline-block;
-        padding: 0.75rem 2rem;
-        background: var(--accent);
-        border-radius: 8px;
-        font-size: 1.1rem;
-        font-weight: 600;
-        color: white;
-    }
-    
-    .stButton > button {
-        background: var(--accent);
-        color: white;
-        border: none;
-        padding: 0.875rem 2rem;
-        border-radius: 8px;
-        font-weight: 600;
-        font-size: 1rem;
-        transition: all 0.2s ease;
-        width: 100%;
-    }
-    
-    .stButton > button:hover {
-        background: var(--accent-hover);
-        transform: translateY(-1px);
-    }
-    
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 0.5rem;
-        background: transparent;
-        border-bottom: 1px solid rgba(59, 130, 246, 0.3);
-    }
-    
-    .stTabs [data-baseweb="tab"] {
-        padding: 0.875rem 1.5rem;
-        border-radius: 8px 8px 0 0;
-        font-weight: 500;
-        color: var(--text-medium);
-        background: transparent;
-    }
-    
-    .stTabs [aria-selected="true"] {
-        background: var(--accent);
-        color: white;
-    }
-    
-    [data-testid="stMetricValue"] {
-        font-size: 1.75rem;
-        font-weight: 700;
-        color: var(--text-light);
-    }
-    
-    [data-testid="stMetricLabel"] {
-        font-size: 0.875rem;
-        color: var(--text-medium);
-    }
-    
-    [data-testid="metric-container"] {
-        background: var(--bg-medium);
-        padding: 1rem;
-        border-radius: 8px;
-        border: 1px solid rgba(59, 130, 246, 0.2);
-    }
-    
-    .progress-container {
-        display: flex;
-        justify-content: space-between;
-        margin: 2rem 0;
-        padding: 1.5rem;
-        background: var(--bg-medium);
-        border-radius: 12px;
-        border: 1px solid rgba(59, 130, 246, 0.2);
-    }
-    
-    .progress-step {
-        flex: 1;
-        text-align: center;
-        color: var(--text-medium);
-        font-weight: 500;
-        position: relative;
-    }
-    
-    section[data-testid="stSidebar"] {
-        background: var(--bg-medium);
-        border-right: 1px solid rgba(59, 130, 246, 0.2);
-    }
-    
-    section[data-testid="stSidebar"] .stMarkdown {
-        color: var(--text-light);
-    }
-    
-    .stNumberInput input,
-    .stTextInput input,
-    .stTextArea textarea,
-    .stSelectbox select {
-        background: var(--bg-dark) !important;
-        border: 1px solid rgba(59, 130, 246, 0.3) !important;
-        border-radius: 8px !important;
-        color: var(--text-light) !important;
-        padding: 0.625rem !important;
-    }
-    
-    .stNumberInput input:focus,
-    .stTextInput input:focus,
-    .stSelectbox select:focus {
-        border-color: var(--accent) !important;
-        box-shadow: 0 0 0 2px rgba(59, 130, 246, 0.2) !important;
-    }
-    
-    label {
-        color: var(--text-light) !important;
-        font-weight: 500 !important;
-    }
-    
-    .stAlert {
-        background: var(--bg-medium) !important;
-        border-radius: 8px !important;
-        border-left: 3px solid var(--accent) !important;
-        color: var(--text-light) !important;
-        padding: 1rem !important;
-    }
-    
-    .stCheckbox label, .stRadio label {
-        color: var(--text-light) !important;
-    }
-    
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    
-    p, span, div {
-        color: var(--text-light);
-    }
-    
-    .caption, small {
-        color: var(--text-medium) !important;
-    }
-</style>
-""", unsafe_allow_html=True)
+# CSS (mismo diseño oscuro minimalista), preparado una vez por proceso en estilos.py
+st.markdown(HOJA_ESTILOS, unsafe_allow_html=True)
 
 # Funciones auxiliares
 def generar_html_pdf(resultado, datos):
-    cuota_dif = resultado['cuota_diferencial']
-    resumen = resultado['resumen']
-    
-    html = f"""
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <style>
-            body {{ font-family: 'Inter', Arial, sans-serif; margin: 40px; background: #1a1d29; color: #e2e8f0; }}
-            .header {{ background: #252837; color: #e2e8f0; padding: 40px; text-align: center; border-radius: 12px; }}
-            .resultado {{ font-size: 52px; font-weight: 800; margin: 20px 0; }}
-            table {{ width: 100%; border-collapse: collapse; margin: 20px 0; background: #252837; }}
-            th, td {{ border-bottom: 1px solid rgba(59, 130, 246, 0.3); padding: 16px; color: #e2e8f0; }}
-            th {{ background-color: #3b82f6; color: white; }}
-        </style>
-    </head>
-    <body>
-        <div class="header">
-            <h1>💼 TaxCalc Pro - Informe {datetime.now().year}</h1>
-            <div class="resultado">{cuota_dif['resultado']}: {cuota_dif['importe']:,.2f} €</div>
-        </div>
-        <table>
-            <tr><th>Concepto</th><th>Importe</th></tr>
-            <tr><td>Base Imponible</td><td>{resumen['base_imponible_general']:,.2f} €</td></tr>
-            <tr><td>Cuota Líquida</td><td>{resultado['cuotas_liquidas']['total']:,.2f} €</td></tr>
-            <tr><td>Retenciones</td><td>{cuota_dif['total_pagado']:,.2f} €</td></tr>
-            <tr><td><b>RESULTADO</b></td><td><b>{cuota_dif['importe']:,.2f} €</b></td></tr>
-        </table>
-    </body>
-    </html>
-    """
-    return html
+    # Misma plantilla compilada que la generación masiva (irpf informes)
+    from informes import informe_html
+    return informe_html(resultado)
+
+def ejes_barrido(datos):
+    """Campos que se pueden barrer en el Simulador: etiqueta -> (campo, valores)"""
+    import numpy as np
+    salario_max = max(datos.get('salario', 0) * 2, 100000)
+    return {
+        "💵 Salario": ('salario', np.linspace(0, salario_max, 200)),
+        "🏦 Plan pensiones": ('plan_pensiones', np.arange(0, 1501, 100)),
+        "🎁 Donaciones": ('donaciones', np.arange(0, 5001, 250)),
+        "🏠 Alquiler vivienda habitual": ('alquiler_vivienda_habitual_pagado', np.arange(0, 15001, 500)),
+        "👶 Guardería": ('gastos_guarderia', np.arange(0, 3001, 150)),
+        "📈 Dividendos": ('dividendos', np.arange(0, 20001, 1000))
+    }
+
+# Resultados que se pueden representar en el barrido: etiqueta -> (clave, unidad)
+RESULTADOS_BARRIDO = {
+    "Cuota diferencial": ('cuota_diferencial', '€'),
+    "Cuota líquida": ('cuota_liquida_total', '€'),
+    "Tipo medio": ('tipo_medio', '%')
+}
 
 def calcular_optimizaciones(datos, resultado):
     optimizaciones = []
@@ -314,8 +74,217 @@ def calcular_optimizaciones(datos, resultado):
     
     return optimizaciones, ahorro_total
 
+# ===== Cachés compartidas por todas las sesiones del servidor =====
+# Streamlit guarda el valor de cada función según sus argumentos. Una
+# declaración se identifica por (versión de las reglas, valores normalizados),
+# la misma clave que CacheResultados: los reruns y los usuarios que repiten
+# una declaración no vuelven a calcularla ni a construir sus gráficos.
+# cache_resource devuelve el mismo objeto a todas las sesiones: solo se usa
+# para el paquete de reglas, que nadie modifica, y para las cifras de cada
+# escenario, que se entregan en un ResultadoRenta propio de cada llamada.
+# Lo demás (resultados, rankings y figuras) va en cache_data, que devuelve
+# una copia a cada llamada.
+
+@st.cache_resource(show_spinner=False)
+def reglas_compartidas(ejercicio):
+    """Paquete de reglas compilado del ejercicio, uno por proceso para todas las sesiones"""
+    from reglas import reglas_ejercicio
+    return reglas_ejercicio(ejercicio)
+
+def clave_declaracion(datos):
+    """Clave normalizada de una declaración: (versión de las reglas, valores en el orden de CAMPOS)"""
+    from contribuyente import como_contribuyente
+    contribuyente = como_contribuyente(datos)
+    return reglas_compartidas(contribuyente.ejercicio).version, contribuyente.como_tupla()
+
+def datos_de_clave(clave):
+    """Dict del formulario (con todos los campos) de una clave de declaración"""
+    from contribuyente import DatosContribuyente
+    return DatosContribuyente(*clave[1]).a_dict()
+
+@st.cache_resource(max_entries=1024, show_spinner=False)
+def _escenario_compartido(clave):
+    from renta import calcular_renta_total
+    return calcular_renta_total(datos_de_clave(clave), detalle=False)
+
+def escenario_calculado(clave):
+    """
+    Cálculo sin detalle (ResultadoRenta) de una declaración: base del Simulador y de los gráficos
+
+    Las cifras se calculan una vez para todas las sesiones, pero cada
+    llamada recibe su propio ResultadoRenta (ResultadoRenta.copia), con sus
+    propias secciones.
+    """
+    return _escenario_compartido(clave).copia()
+
+@st.cache_data(max_entries=1024, show_spinner=False)
+def resultado_declaracion(clave):
+    """Resultado detallado (dict) de una declaración, a partir de su escenario"""
+    return escenario_calculado(clave).como_dict()
+
+@st.cache_data(max_entries=1024, show_spinner=False)
+def optimizaciones_declaracion(clave):
+    """calcular_optimizaciones de una declaración"""
+    return calcular_optimizaciones(datos_de_clave(clave), escenario_calculado(clave))
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def ranking_comunidades(clave):
+    """comparar_comunidades de una declaración"""
+    from renta import comparar_comunidades
+    return comparar_comunidades(datos_de_clave(clave))
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def figura_resumen(clave):
+    """Barras de ingresos, impuestos, deducciones y retenciones"""
+    import plotly.graph_objects as go
+    resultado = escenario_calculado(clave)
+    resumen = resultado['resumen']
+    fig = go.Figure()
+    valores = [
+        resumen['base_imponible_general'] + resumen['base_imponible_ahorro'],
+        resultado['cuotas_liquidas']['total'],
+        resultado['deducciones']['total_estatal'] + resultado['deducciones']['total_autonomica'],
+        resultado['cuota_diferencial']['total_pagado']
+    ]
+    
+    fig.add_trace(go.Bar(
+        x=['Ingresos', 'Impuestos', 'Deducciones', 'Ya Pagado'],
+        y=valores,
+        marker_color=['#3b82f6', '#ef4444', '#10b981', '#94a3b8'],
+        text=[f"{v:,.0f} €" for v in valores],
+        textposition='outside'
+    ))
+    
+    fig.update_layout(
+        height=400,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='#e2e8f0'),
+        showlegend=False,
+        yaxis=dict(gridcolor='rgba(59, 130, 246, 0.1)')
+    )
+    return fig
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def figura_tramos(clave):
+    """Base y cuota de cada tramo de la escala estatal general"""
+    import plotly.graph_objects as go
+    tramos_data = []
+    for tramo in escenario_calculado(clave)['cuotas_integras']['desglose_estatal_general']:
+        tramos_data.append({
+            'Tramo': f"{tramo['base']:,.0f} €",
+            'Base': tramo['base'],
+            'Cuota': tramo['cuota']
+        })
+    
+    fig2 = go.Figure()
+    fig2.add_trace(go.Bar(
+        name='Base',
+        x=[t['Tramo'] for t in tramos_data],
+        y=[t['Base'] for t in tramos_data],
+        marker_color='#3b82f6'
+    ))
+    
+    fig2.add_trace(go.Scatter(
+        name='Cuota',
+        x=[t['Tramo'] for t in tramos_data],
+        y=[t['Cuota'] for t in tramos_data],
+        mode='lines+markers',
+        line=dict(color='#ef4444', width=3),
+        yaxis='y2'
+    ))
+    
+    fig2.update_layout(
+        height=400,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='#e2e8f0'),
+        yaxis=dict(gridcolor='rgba(59, 130, 246, 0.1)', title='Base (€)'),
+        yaxis2=dict(title='Cuota (€)', overlaying='y', side='right', showgrid=False)
+    )
+    return fig2
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def figura_comunidades(clave):
+    """Cuota diferencial de la declaración en cada comunidad, con la propia resaltada"""
+    import plotly.graph_objects as go
+    ranking = ranking_comunidades(clave)
+    comunidad = datos_de_clave(clave)['comunidad']
+    fig4 = go.Figure()
+    fig4.add_trace(go.Bar(
+        x=[fila['cuota_diferencial'] for fila in ranking],
+        y=[fila['comunidad'] for fila in ranking],
+        orientation='h',
+        marker_color=['#f59e0b' if fila['comunidad'] == comunidad else '#3b82f6' for fila in ranking],
+        text=[f"{fila['cuota_diferencial']:,.0f} €" for fila in ranking],
+        textposition='outside'
+    ))
+    
+    fig4.update_layout(
+        height=600,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='#e2e8f0'),
+        showlegend=False,
+        xaxis=dict(gridcolor='rgba(59, 130, 246, 0.1)', title='Cuota diferencial (€)'),
+        yaxis=dict(autorange='reversed')
+    )
+    return fig4
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def figura_barrido(clave, etiqueta_x, etiqueta_y, etiqueta_resultado):
+    """
+    Mapa de calor del barrido de dos campos de una declaración
+
+    Returns:
+        figura de plotly
+    """
+    import plotly.graph_objects as go
+    from renta_vectorizada import barrido_renta
+    
+    datos_base = datos_de_clave(clave)
+    ejes = ejes_barrido(datos_base)
+    
+    # Toda la rejilla en una sola llamada al motor vectorial
+    rejilla = barrido_renta(datos_base, ejes[etiqueta_x], ejes[etiqueta_y])
+    
+    clave_resultado, unidad = RESULTADOS_BARRIDO[etiqueta_resultado]
+    campo_x, valores_x = ejes[etiqueta_x]
+    campo_y, valores_y = ejes[etiqueta_y]
+    
+    fig_barrido = go.Figure(go.Heatmap(
+        z=rejilla[clave_resultado],
+        x=valores_x,
+        y=valores_y,
+        colorscale='RdYlGn_r',
+        colorbar=dict(title=unidad),
+        hovertemplate=f"{etiqueta_x}: %{{x:,.0f}} €<br>{etiqueta_y}: %{{y:,.0f}} €<br>"
+                      f"{etiqueta_resultado}: %{{z:,.2f}} {unidad}<extra></extra>"
+    ))
+    fig_barrido.add_trace(go.Scatter(
+        x=[datos_base.get(campo_x, 0)],
+        y=[datos_base.get(campo_y, 0)],
+        mode='markers',
+        marker=dict(color='#e2e8f0', size=12, symbol='x'),
+        name='Escenario base',
+        hoverinfo='skip'
+    ))
+    fig_barrido.update_layout(
+        height=450,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='#e2e8f0'),
+        showlegend=False,
+        xaxis=dict(title=etiqueta_x),
+        yaxis=dict(title=etiqueta_y)
+    )
+    return fig_barrido
+
+# Historial compacto y acotado; con IRPF_HISTORIAL se guarda en ese fichero SQLite,
+# con las entradas de cada sesión separadas de las de las demás
 if 'historial_calculos' not in st.session_state:
-    st.session_state.historial_calculos = []
+    st.session_state.historial_calculos = HistorialCalculos.desde_entorno(uuid.uuid4().hex)
+
 
 # SIDEBAR
 with st.sidebar:
@@ -461,7 +430,7 @@ if menu == "🏠 Calculadora":
             col12, col13, col14 = st.columns(3)
             with col12:
                 ibi = st.number_input("IBI (€)", 0.0, value=0.0, step=100.0)
-                comunidad = st.number_input("Comunidad (€)", 0.0, value=0.0, step=50.0)
+                gastos_comunidad = st.number_input("Comunidad (€)", 0.0, value=0.0, step=50.0)
             with col13:
                 seguro_hogar = st.number_input("Seguro (€)", 0.0, value=0.0, step=50.0)
                 reparaciones = st.number_input("Reparaciones (€)", 0.0, value=0.0, step=100.0)
@@ -476,7 +445,7 @@ if menu == "🏠 Calculadora":
             
             arrendatario_menor_30 = st.checkbox("El inquilino tiene menos de 30 años (reducción 70%)")
         else:
-            ibi = comunidad = seguro_hogar = reparaciones = 0
+            ibi = gastos_comunidad = seguro_hogar = reparaciones = 0
             intereses_hipoteca = alquiler_gastos = valor_construccion_alquiler = 0
             arrendatario_menor_30 = False
         
@@ -586,7 +555,7 @@ if menu == "🏠 Calculadora":
                 'pagos_fraccionados_autonomo': pagos_fraccionados_autonomo,
                 'alquiler_ingresos': alquiler_ingresos,
                 'ibi': ibi,
-                'comunidad': comunidad,
+                'gastos_comunidad': gastos_comunidad,
                 'seguro_hogar': seguro_hogar,
                 'reparaciones': reparaciones,
                 'intereses_hipoteca': intereses_hipoteca,
@@ -616,13 +585,10 @@ if menu == "🏠 Calculadora":
             st.session_state['datos_calculados'] = datos
             
             with st.spinner('🔮 Calculando declaración completa...'):
-                resultado = calcular_renta_total(datos)
+                clave = clave_declaracion(datos)
+                resultado = resultado_declaracion(clave)
                 st.session_state['resultado_calculado'] = resultado
-                st.session_state.historial_calculos.append({
-                    'fecha': datetime.now(),
-                    'datos': datos,
-                    'resultado': resultado
-                })
+                st.session_state.historial_calculos.anotar(datos, resultado)
             
             cuota_dif = resultado['cuota_diferencial']
             simbolo = "💸" if cuota_dif['diferencial'] > 0 else "💰"
@@ -643,7 +609,7 @@ if menu == "🏠 Calculadora":
             # Optimizador
             st.markdown('<div class="seccion-titulo">💡 Optimizador Fiscal</div>', unsafe_allow_html=True)
             
-            optimizaciones, ahorro_total = calcular_optimizaciones(datos, resultado)
+            optimizaciones, ahorro_total = optimizaciones_declaracion(clave)
             
             if len(optimizaciones) > 0:
                 st.info(f"🎯 **Ahorro potencial detectado:** {ahorro_total:,.0f} €")
@@ -668,71 +634,14 @@ if menu == "🏠 Calculadora":
             resumen = resultado['resumen']
             cuotas = resultado['cuotas_integras']
             
-            tab1, tab2, tab3 = st.tabs(["📊 Resumen", "📈 Tramos", "💰 Desglose"])
+            tab1, tab2, tab3, tab4 = st.tabs(["📊 Resumen", "📈 Tramos", "💰 Desglose", "🗺️ Comunidades"])
             
             with tab1:
-                fig = go.Figure()
-                valores = [
-                    resumen['base_imponible_general'] + resumen['base_imponible_ahorro'],
-                    resultado['cuotas_liquidas']['total'],
-                    resultado['deducciones']['total_estatal'] + resultado['deducciones']['total_autonomica'],
-                    cuota_dif['total_pagado']
-                ]
-                
-                fig.add_trace(go.Bar(
-                    x=['Ingresos', 'Impuestos', 'Deducciones', 'Ya Pagado'],
-                    y=valores,
-                    marker_color=['#3b82f6', '#ef4444', '#10b981', '#94a3b8'],
-                    text=[f"{v:,.0f} €" for v in valores],
-                    textposition='outside'
-                ))
-                
-                fig.update_layout(
-                    height=400,
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    font=dict(color='#e2e8f0'),
-                    showlegend=False,
-                    yaxis=dict(gridcolor='rgba(59, 130, 246, 0.1)')
-                )
-                st.plotly_chart(fig, use_container_width=True)
+                st.plotly_chart(figura_resumen(clave), use_container_width=True)
             
             with tab2:
                 if cuotas['estatal_general'] > 0:
-                    tramos_data = []
-                    for tramo in cuotas['desglose_estatal_general']:
-                        tramos_data.append({
-                            'Tramo': f"{tramo['base']:,.0f} €",
-                            'Base': tramo['base'],
-                            'Cuota': tramo['cuota']
-                        })
-                    
-                    fig2 = go.Figure()
-                    fig2.add_trace(go.Bar(
-                        name='Base',
-                        x=[t['Tramo'] for t in tramos_data],
-                        y=[t['Base'] for t in tramos_data],
-                        marker_color='#3b82f6'
-                    ))
-                    
-                    fig2.add_trace(go.Scatter(
-                        name='Cuota',
-                        x=[t['Tramo'] for t in tramos_data],
-                        y=[t['Cuota'] for t in tramos_data],
-                        mode='lines+markers',
-                        line=dict(color='#ef4444', width=3),
-                        yaxis='y2'
-                    ))
-                    
-                    fig2.update_layout(
-                        height=400,
-                        plot_bgcolor='rgba(0,0,0,0)',
-                        paper_bgcolor='rgba(0,0,0,0)',
-                        font=dict(color='#e2e8f0'),
-                        yaxis=dict(gridcolor='rgba(59, 130, 246, 0.1)', title='Base (€)'),
-                        yaxis2=dict(title='Cuota (€)', overlaying='y', side='right', showgrid=False)
-                    )
-                    st.plotly_chart(fig2, use_container_width=True)
+                    st.plotly_chart(figura_tramos(clave), use_container_width=True)
                     
                     col_i1, col_i2 = st.columns(2)
                     with col_i1:
@@ -796,6 +705,28 @@ if menu == "🏠 Calculadora":
                     with col_d12:
                         st.metric("Neto", f"{gp['ganancias_final']:,.0f} €")
             
+            with tab4:
+                st.subheader("Tu declaración en cada comunidad")
+                ranking = ranking_comunidades(clave)
+                st.plotly_chart(figura_comunidades(clave), use_container_width=True)
+                
+                st.dataframe(
+                    [{
+                        'Posición': fila['posicion'],
+                        'Comunidad': fila['comunidad'],
+                        'Cuota íntegra (€)': round(fila['cuota_integra'], 2),
+                        'Deducciones autonómicas (€)': round(fila['deducciones_autonomicas'], 2),
+                        'Cuota líquida (€)': round(fila['cuota_liquida'], 2),
+                        'Cuota diferencial (€)': round(fila['cuota_diferencial'], 2),
+                        'Tipo medio (%)': round(fila['tipo_medio'], 2),
+                        'Tipo marginal (%)': round(fila['tipo_marginal'], 2),
+                        'Diferencia (€)': round(fila['diferencia'], 2)
+                    } for fila in ranking],
+                    hide_index=True,
+                    use_container_width=True
+                )
+                st.caption(f"Diferencia respecto a {comunidad}: negativa si allí pagarías menos")
+            
             # Métricas clave
             st.markdown('<div class="seccion-titulo">📋 Métricas Clave</div>', unsafe_allow_html=True)
             
@@ -822,6 +753,8 @@ elif menu == "📊 Simulador":
     if 'datos_calculados' not in st.session_state:
         st.info("⚠️ Primero calcula tu declaración en 'Calculadora'")
     else:
+        from renta import recalcular_renta
+        
         datos_base = st.session_state['datos_calculados']
         resultado_base = st.session_state['resultado_calculado']
         cuota_base = resultado_base['cuota_diferencial']
@@ -847,25 +780,47 @@ elif menu == "📊 Simulador":
             st.markdown("### 📉 Deducciones")
             pension_sim = st.slider("🏦 Plan pensiones", 0, 1500, int(datos_base.get('plan_pensiones', 0)), 100)
         
-        if st.button("🔄 SIMULAR"):
-            datos_sim = datos_base.copy()
-            datos_sim['salario'] = salario_sim
-            datos_sim['plan_pensiones'] = pension_sim
-            
-            with st.spinner('🔮 Simulando...'):
-                resultado_sim = calcular_renta_total(datos_sim)
-            
-            cuota_sim = resultado_sim['cuota_diferencial']
-            diferencia = cuota_sim['importe'] - cuota_base['importe']
-            
-            col_comp1, col_comp2, col_comp3 = st.columns(3)
-            
-            with col_comp1:
-                st.metric("Base", f"{cuota_base['importe']:,.0f} €")
-            with col_comp2:
-                st.metric("Simulado", f"{cuota_sim['importe']:,.0f} €")
-            with col_comp3:
-                st.metric("Diferencia", f"{abs(diferencia):,.0f} €", delta=f"{diferencia:,.0f} €")
+        clave_base = clave_declaracion(datos_base)
+        
+        # Cada cambio de un slider solo repite las etapas que dependen de él
+        resultado_sim = recalcular_renta(
+            escenario_calculado(clave_base), {'salario': salario_sim, 'plan_pensiones': pension_sim}
+        )
+        
+        cuota_sim = resultado_sim['cuota_diferencial']
+        diferencia = cuota_sim['importe'] - cuota_base['importe']
+        
+        col_comp1, col_comp2, col_comp3 = st.columns(3)
+        
+        with col_comp1:
+            st.metric("Base", f"{cuota_base['importe']:,.0f} €")
+        with col_comp2:
+            st.metric("Simulado", f"{cuota_sim['importe']:,.0f} €")
+        with col_comp3:
+            st.metric("Diferencia", f"{abs(diferencia):,.0f} €", delta=f"{diferencia:,.0f} €")
+        
+        st.markdown("---")
+        st.subheader("🗺️ Barrido de escenarios")
+        
+        ejes = ejes_barrido(datos_base)
+        col_bar1, col_bar2, col_bar3 = st.columns(3)
+        with col_bar1:
+            etiqueta_x = st.selectbox("Eje X", list(ejes), index=0)
+        with col_bar2:
+            opciones_y = [etiqueta for etiqueta in ejes if etiqueta != etiqueta_x]
+            etiqueta_y = st.selectbox("Eje Y", opciones_y, index=0)
+        with col_bar3:
+            etiqueta_resultado = st.selectbox("Resultado", list(RESULTADOS_BARRIDO))
+        
+        # Tiempo de esta ejecución: el cálculo de la rejilla o, si ya estaba, la lectura de la caché
+        inicio_barrido = time.perf_counter()
+        figura = figura_barrido(clave_base, etiqueta_x, etiqueta_y, etiqueta_resultado)
+        segundos_barrido = time.perf_counter() - inicio_barrido
+        st.plotly_chart(figura, use_container_width=True)
+        valores_x, valores_y = ejes[etiqueta_x][1], ejes[etiqueta_y][1]
+        st.caption(
+            f"{len(valores_x)} × {len(valores_y)} escenarios en {segundos_barrido * 1000:,.1f} ms"
+        )
 
 elif menu == "📈 Historial":
     st.markdown("""
@@ -875,24 +830,30 @@ elif menu == "📈 Historial":
     </div>
     """, unsafe_allow_html=True)
     
-    if len(st.session_state.historial_calculos) == 0:
+    historial = st.session_state.historial_calculos
+    
+    if len(historial) == 0:
         st.info("🔍 Aún no has realizado cálculos")
     else:
-        st.info(f"📊 {len(st.session_state.historial_calculos)} cálculo(s) guardado(s)")
+        comunidades = historial.comunidades()
+        filtro_comunidad = "Todas"
+        if len(comunidades) > 1:
+            filtro_comunidad = st.selectbox("📍 Comunidad", ["Todas"] + comunidades)
+        entradas = historial.entradas(None if filtro_comunidad == "Todas" else filtro_comunidad)
+        
+        st.info(f"📊 {len(entradas)} cálculo(s) guardado(s)")
         
-        for calculo in reversed(st.session_state.historial_calculos):
-            fecha = calculo['fecha'].strftime('%d/%m/%Y %H:%M')
-            resultado = calculo['resultado']
-            cuota = resultado['cuota_diferencial']
+        for entrada in entradas:
+            fecha = entrada.fecha.strftime('%d/%m/%Y %H:%M')
             
-            with st.expander(f"🗓️ {fecha} - {cuota['resultado']}: {cuota['importe']:,.2f} €"):
+            with st.expander(f"🗓️ {fecha} - {entrada.comunidad} - {entrada.resultado}: {entrada.importe:,.2f} €"):
                 col_h1, col_h2, col_h3 = st.columns(3)
                 with col_h1:
-                    st.metric("Resultado", f"{cuota['importe']:,.2f} €")
+                    st.metric("Resultado", f"{entrada.importe:,.2f} €")
                 with col_h2:
-                    st.metric("Base", f"{resultado['resumen']['base_imponible_general']:,.2f} €")
+                    st.metric("Base", f"{entrada.base_imponible_general:,.2f} €")
                 with col_h3:
-                    st.metric("Tipo Medio", f"{resultado['resumen']['tipo_medio']:.2f}%")
+                    st.metric("Tipo Medio", f"{entrada.tipo_medio:.2f}%")
 
 elif menu == "💡 Guía":
     st.markdown("""
@@ -0,0 +1,196 @@
+"""
+Presupuesto de arranque de la aplicación
+Ejecuta app.py con el AppTest de Streamlit en un proceso nuevo bajo
+`python -X importtime`, como tras un reinicio del contenedor, y mide para
+cada escenario el tiempo de importación de lo que carga la propia aplicación,
+la primera ejecución y un rerun. Comprueba que cada escenario cabe en su
+presupuesto y que las páginas sin gráficos no cargan el motor ni construyen
+figuras de plotly.
+
+Uso:
+    python -m renta arranque
+    python -m renta arranque --margen 1.5 --guardar arranque.json
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+
+
+DIRECTORIO_APP = os.path.dirname(os.path.abspath(__file__))
+
+# Línea que separa en stderr las importaciones del arnés de las de app.py
+MARCA_APP = '--- app.py ---'
+
+# Escenarios: nombre -> (página, ¿calcular antes la declaración?)
+ESCENARIOS = {
+    'calculadora': ("🏠 Calculadora", False),
+    'simulador': ("📊 Simulador", False),
+    'historial': ("📈 Historial", False),
+    'guia': ("💡 Guía", False),
+    'calculadora_resultado': ("🏠 Calculadora", True),
+    'simulador_resultado': ("📊 Simulador", True),
+}
+
+# Presupuesto de cada escenario en ms: importaciones de app.py en frío
+# (Streamlit ya cargado), primera ejecución completa y rerun
+PRESUPUESTO = {
+    'calculadora': {'importaciones': 10, 'primera': 400, 'rerun': 150},
+    'simulador': {'importaciones': 10, 'primera': 500, 'rerun': 150},
+    'historial': {'importaciones': 10, 'primera': 500, 'rerun': 150},
+    'guia': {'importaciones': 10, 'primera': 500, 'rerun': 150},
+    'calculadora_resultado': {'importaciones': 600, 'primera': 2500, 'rerun': 500},
+    'simulador_resultado': {'importaciones': 600, 'primera': 3000, 'rerun': 500},
+}
+
+# Módulos que no debe cargar un escenario sin declaración calculada
+MODULOS_PESADOS = ('renta', 'renta_vectorizada', 'plotly.graph_objs._figure')
+
+# Programa que se ejecuta en el proceso medido
+_PROGRAMA = '''
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+
+pagina, calcular, repeticiones = sys.argv[1], sys.argv[2] == '1', int(sys.argv[3])
+
+def ejecutar(accion):
+    inicio = time.perf_counter()
+    accion.run()
+    return time.perf_counter() - inicio
+
+app = AppTest.from_file('app.py', default_timeout=120)
+print(%(marca)r, file=sys.stderr, flush=True)
+primera = ejecutar(app)
+if calcular:
+    app.selectbox[0].set_value('Madrid')
+    app.selectbox[1].set_value('Soltero/a')
+    [n for n in app.number_input if n.label.startswith('Salario')][0].set_value(35000.0)
+    boton = [b for b in app.button if 'CALCULAR' in b.label][0]
+    primera += ejecutar(boton.click())
+if pagina != app.sidebar.radio[0].value:
+    primera += ejecutar(app.sidebar.radio[0].set_value(pagina))
+
+reruns = []
+for _ in range(repeticiones):
+    if calcular and pagina == app.sidebar.radio[0].options[0]:
+        boton = [b for b in app.button if 'CALCULAR' in b.label][0]
+        reruns.append(ejecutar(boton.click()))
+    else:
+        reruns.append(ejecutar(app))
+
+print(json.dumps({
+    'primera': primera,
+    'rerun': min(reruns),
+    'excepcion': [str(e.value) for e in app.exception]
+}))
+''' % {'marca': MARCA_APP}
+
+_LINEA_IMPORTTIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)\s*$')
+
+
+def leer_importtime(texto):
+    """
+    Interpreta la salida de `python -X importtime`
+
+    Args:
+        texto (str): stderr del proceso
+
+    Returns:
+        list de tuplas (modulo, propio_us, acumulado_us, nivel), en el orden
+        en que terminó cada importación; nivel 0 son las importaciones
+        hechas directamente por el código y no por otro módulo
+    """
+    importaciones = []
+    for linea in texto.splitlines():
+        encontrada = _LINEA_IMPORTTIME.match(linea)
+        if encontrada:
+            propio, acumulado, sangria, modulo = encontrada.groups()
+            importaciones.append((modulo, int(propio), int(acumulado), (len(sangria) - 1) // 2))
+    return importaciones
+
+
+def medir_escenario(nombre, repeticiones=5):
+    """
+    Mide un escenario en un proceso de Python nuevo
+
+    Args:
+        nombre (str): clave de ESCENARIOS
+        repeticiones (int): reruns medidos (se queda el mínimo)
+
+    Returns:
+        dict con 'importaciones', 'primera' y 'rerun' en ms, 'modulos'
+        (lista de módulos que cargó la aplicación) y 'excepcion'
+
+    Raises:
+        RuntimeError: si el proceso medido falla
+    """
+    pagina, calcular = ESCENARIOS[nombre]
+    proceso = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _PROGRAMA, pagina, '1' if calcular else '0', str(repeticiones)],
+        cwd=DIRECTORIO_APP, capture_output=True, text=True, encoding='utf-8'
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(f"{nombre}: el proceso medido falló:\n{proceso.stderr[-2000:]}")
+
+    _, _, despues = proceso.stderr.partition(MARCA_APP)
+    importaciones = leer_importtime(despues)
+    tiempos = json.loads(proceso.stdout.strip().splitlines()[-1])
+    return {
+        'importaciones': sum(acumulado for _, _, acumulado, nivel in importaciones if nivel == 0) / 1000,
+        'primera': tiempos['primera'] * 1000,
+        'rerun': tiempos['rerun'] * 1000,
+        'modulos': [modulo for modulo, _, _, _ in importaciones],
+        'excepcion': tiempos['excepcion']
+    }
+
+
+def comprobar(nombre, medida, margen=1.0):
+    """
+    Compara la medida de un escenario con su presupuesto
+
+    Args:
+        nombre (str): clave de ESCENARIOS
+        medida (dict): resultado de medir_escenario
+        margen (float): factor aplicado al presupuesto (máquinas más lentas)
+
+    Returns:
+        list de textos, uno por incumplimiento
+    """
+    fallos = [f"{nombre}: excepción en la aplicación: {texto}" for texto in medida['excepcion']]
+    for clave, limite in PRESUPUESTO[nombre].items():
+        if medida[clave] > limite * margen:
+            fallos.append(f"{nombre}: {clave} {medida[clave]:,.1f} ms > {limite * margen:,.1f} ms")
+    if not ESCENARIOS[nombre][1]:
+        cargados = sorted(set(MODULOS_PESADOS) & set(medida['modulos']))
+        if cargados:
+            fallos.append(f"{nombre}: carga {', '.join(cargados)} sin haber calculado nada")
+    return fallos
+
+
+def ejecutar_arranque(args):
+    """Comando `arranque` de la línea de comandos"""
+    nombres = [nombre for nombre in ESCENARIOS if not args.filtro or args.filtro in nombre]
+    medidas = {}
+    fallos = []
+    print(f"{'escenario':<24} {'importar ms':>12} {'primera ms':>12} {'rerun ms':>10}")
+    for nombre in nombres:
+        medida = medidas[nombre] = medir_escenario(nombre, args.repeticiones)
+        fallos_escenario = comprobar(nombre, medida, args.margen)
+        fallos.extend(fallos_escenario)
+        print(
+            f"{nombre:<24} {medida['importaciones']:>12,.1f} {medida['primera']:>12,.1f} "
+            f"{medida['rerun']:>10,.1f} {'FUERA DE PRESUPUESTO' if fallos_escenario else ''}"
+        )
+
+    if args.guardar:
+        with open(args.guardar, 'w', encoding='utf-8') as fichero:
+            json.dump(medidas, fichero, ensure_ascii=False, indent=2)
+        print(f"Medidas guardadas en {args.guardar}", file=sys.stderr)
+
+    print()
+    for fallo in fallos:
+        print(fallo)
+    print(f"{len(fallos)} incumplimiento(s) en {len(nombres)} escenarios")
+    return 1 if fallos else 0
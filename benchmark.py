@@ -0,0 +1,351 @@
+"""
+Benchmarks del motor de cálculo
+Mide calcular_renta_total, calcular_cuota_escala y
+calcular_minimo_personal_familiar sobre perfiles representativos, cada
+comunidad de ESCALAS_AUTONOMICAS y lotes de 1 a 1.000.000 registros. Guarda
+los tiempos en una línea base JSON y compara una ejecución con otra para
+detectar regresiones. Solo usa la biblioteca estándar y el propio proyecto.
+
+Uso:
+    python -m renta bench --guardar base.json
+    python -m renta bench --comparar base.json --umbral 0.10
+
+linea_base_original.json guarda los tiempos del motor original en los
+casos renta_total/* y renta_resumen/*, para comparar con él los dos modos
+de calcular_renta_total:
+    python -m renta bench --filtro renta_ --comparar linea_base_original.json
+"""
+
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+
+# Perfiles representativos (dicts del formulario)
+PERFILES = {
+    'asalariado': {
+        'comunidad': 'Madrid',
+        'edad': 35,
+        'salario': 32000,
+        'retenciones': 5200,
+        'plan_pensiones': 1000
+    },
+    'autonomo': {
+        'comunidad': 'Cataluña',
+        'edad': 42,
+        'es_autonomo': True,
+        'regimen_autonomo': 'estimacion_directa_simplificada',
+        'ingresos_autonomo': 65000,
+        'gastos_autonomo': 18000,
+        'pagos_fraccionados_autonomo': 8000,
+        'mutualidad': 2400
+    },
+    'arrendador': {
+        'comunidad': 'Andalucía',
+        'edad': 55,
+        'salario': 28000,
+        'retenciones': 4100,
+        'alquiler_ingresos': 12000,
+        'ibi': 450,
+        'gastos_comunidad': 600,
+        'seguro_hogar': 200,
+        'reparaciones': 800,
+        'intereses_hipoteca': 1500,
+        'valor_construccion_alquiler': 120000,
+        'valor_compra_inmueble': 180000,
+        'arrendatario_menor_30': True,
+        'tiene_segunda_vivienda': True,
+        'valor_catastral_segunda': 90000
+    },
+    'familia_numerosa': {
+        'comunidad': 'Comunidad Valenciana',
+        'edad': 40,
+        'estado_civil': 'casado',
+        'salario': 38000,
+        'retenciones': 5500,
+        'familia_numerosa': True,
+        'hijos_menores_3': 1,
+        'hijos_mayores_3': 3,
+        'nacimiento_ultimo_ano': True,
+        'maternidad': True,
+        'gastos_guarderia': 2400,
+        'alquiler_vivienda_habitual_pagado': 9000,
+        'ascendientes_mayores_75_a_cargo': 1
+    },
+    'ahorro_alto': {
+        'comunidad': 'Madrid',
+        'edad': 60,
+        'salario': 180000,
+        'retenciones': 65000,
+        'dividendos': 40000,
+        'intereses': 15000,
+        'ganancias': 250000,
+        'perdidas_patrimoniales': 20000,
+        'perdidas_pendientes_anos_anteriores': 5000,
+        'plan_pensiones': 1500,
+        'donaciones': 3000,
+        'donacion_plurianual': True
+    }
+}
+
+# Tamaños de lote de los benchmarks por lotes
+TAMANOS_LOTE = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+# El motor escalar recorre el lote registro a registro: por encima de este
+# tamaño solo se mide el motor vectorial
+MAXIMO_LOTE_ESCALAR = 10000
+
+VERSION_FORMATO = 1
+
+
+def medir(funcion, objetivo=0.2, repeticiones=5):
+    """
+    Mide el tiempo por llamada de `funcion` (sin argumentos)
+
+    Cada repetición ejecuta la función tantas veces como haga falta para
+    durar unos `objetivo` segundos; se quedan el mínimo y la mediana.
+
+    Returns:
+        dict: segundos (mínimo por llamada), mediana, llamadas y repeticiones
+    """
+    inicio = time.perf_counter()
+    funcion()
+    una = time.perf_counter() - inicio
+    llamadas = max(1, int(objetivo / una)) if una > 0 else 1000
+    if una >= objetivo:
+        repeticiones = min(repeticiones, 3)
+
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        for _ in range(llamadas):
+            funcion()
+        tiempos.append((time.perf_counter() - inicio) / llamadas)
+    return {
+        'segundos': min(tiempos),
+        'mediana': statistics.median(tiempos),
+        'llamadas': llamadas,
+        'repeticiones': repeticiones
+    }
+
+
+def casos(filtro=None, tamano_maximo=TAMANOS_LOTE[-1]):
+    """
+    Genera los casos del benchmark
+
+    Los datos de cada lote se construyen solo si el caso pasa el filtro.
+
+    Args:
+        filtro (str): si se indica, solo los casos cuyo nombre lo contiene
+        tamano_maximo (int): mayor tamaño de lote a medir
+
+    Yields:
+        (nombre, funcion, registros) donde `registros` es el número de
+        declaraciones que calcula cada llamada
+    """
+    from deducciones_autonomicas import ESCALAS_AUTONOMICAS
+    from escalas import compilar_escala
+    from renta import (
+        calcular_renta_total,
+        calcular_cuota_escala,
+        calcular_minimo_personal_familiar,
+        ESCALA_ESTATAL_GENERAL
+    )
+
+    incluir = (lambda nombre: filtro in nombre) if filtro else (lambda nombre: True)
+
+    for nombre, datos in PERFILES.items():
+        base = calcular_renta_total(datos, detalle=False)['resumen']['base_liquidable_general']
+        escala = ESCALAS_AUTONOMICAS.get(datos['comunidad'], ESCALA_ESTATAL_GENERAL)
+        por_perfil = (
+            (f'renta_total/{nombre}', lambda d=datos: calcular_renta_total(d)),
+            (f'renta_resumen/{nombre}', lambda d=datos: calcular_renta_total(d, detalle=False)),
+            (f'cuota_escala/{nombre}', lambda b=base, e=escala: calcular_cuota_escala(b, e)),
+            # Escala ya compilada y sin desglose: lo que usan los llamadores en caliente
+            (f'cuota_escala_compilada/{nombre}',
+             lambda b=base, e=compilar_escala(escala): calcular_cuota_escala(b, e, desglose=False)),
+            (f'minimo_personal_familiar/{nombre}', lambda d=datos: calcular_minimo_personal_familiar(d))
+        )
+        for caso, funcion in por_perfil:
+            if incluir(caso):
+                yield caso, funcion, 1
+
+    for comunidad in ESCALAS_AUTONOMICAS:
+        for nombre, datos in PERFILES.items():
+            caso = f'comunidad/{comunidad}/{nombre}'
+            if incluir(caso):
+                datos = dict(datos, comunidad=comunidad)
+                yield caso, lambda d=datos: calcular_renta_total(d, detalle=False), 1
+
+    registros = _registros_lote()
+    for tamano in TAMANOS_LOTE:
+        if tamano > tamano_maximo:
+            break
+        caso = f'lote_escalar/{tamano}'
+        if tamano <= MAXIMO_LOTE_ESCALAR and incluir(caso):
+            lote = [registros[i % len(registros)] for i in range(tamano)]
+            yield caso, lambda l=lote: _lote_escalar(l), tamano
+        # El motor en céntimos (renta_centimos.py) con las mismas columnas que el vectorial
+        vectoriales = [
+            (caso, funcion)
+            for caso, funcion in ((f'lote_vectorial/{tamano}', _lote_vectorial),
+                                  (f'lote_centimos/{tamano}', _lote_centimos))
+            if incluir(caso)
+        ]
+        if vectoriales:
+            columnas = _columnas_lote(registros, tamano)
+            if columnas is not None:
+                for caso, funcion in vectoriales:
+                    yield caso, lambda c=columnas, f=funcion: f(c), tamano
+            # Libera las columnas del lote antes de construir el siguiente
+            columnas = None
+
+
+def _registros_lote():
+    # Cada perfil en cada comunidad, como DatosContribuyente
+    from contribuyente import como_contribuyente
+    from deducciones_autonomicas import ESCALAS_AUTONOMICAS
+
+    return [
+        como_contribuyente(dict(datos, comunidad=comunidad))
+        for comunidad in ESCALAS_AUTONOMICAS
+        for datos in PERFILES.values()
+    ]
+
+
+def _lote_escalar(lote):
+    from renta import calcular_renta_total
+    for datos in lote:
+        calcular_renta_total(datos, detalle=False)
+
+
+def _columnas_lote(registros, tamano):
+    # Columnas de `tamano` filas repitiendo los registros (None sin NumPy)
+    try:
+        import numpy as np
+        from renta_vectorizada import columnas_desde_registros
+    except ImportError:
+        return None
+    return {
+        campo: np.resize(np.asarray(valores), tamano)
+        for campo, valores in columnas_desde_registros(registros).items()
+    }
+
+
+def _lote_vectorial(columnas):
+    from renta_vectorizada import calcular_renta_batch
+    calcular_renta_batch(columnas)
+
+
+def _lote_centimos(columnas):
+    from renta_centimos import calcular_renta_batch_centimos
+    calcular_renta_batch_centimos(columnas)
+
+
+def ejecutar(filtro=None, tamano_maximo=TAMANOS_LOTE[-1], objetivo=0.2, informe=None):
+    """
+    Ejecuta los benchmarks
+
+    Args:
+        filtro (str): si se indica, solo los casos cuyo nombre lo contiene
+        tamano_maximo (int): mayor tamaño de lote a medir
+        objetivo (float): segundos aproximados de cada repetición
+        informe: fichero de texto opcional donde ir escribiendo cada resultado
+
+    Returns:
+        dict con la línea base: metadatos y 'resultados' {caso: medida}
+    """
+    from renta import VERSION_REGLAS
+
+    resultados = {}
+    for nombre, funcion, registros in casos(filtro, tamano_maximo):
+        medida = medir(funcion, objetivo)
+        medida['registros'] = registros
+        resultados[nombre] = medida
+        if informe is not None:
+            print(f"{nombre:<55} {_formatear(medida)}", file=informe, flush=True)
+
+    return {
+        'version_formato': VERSION_FORMATO,
+        'version_reglas': VERSION_REGLAS,
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'resultados': resultados
+    }
+
+
+def _formatear(medida):
+    por_registro = medida['segundos'] / medida['registros']
+    texto = f"{medida['segundos'] * 1e6:>14,.1f} µs"
+    if medida['registros'] > 1:
+        texto += f"  ({por_registro * 1e6:,.3f} µs/registro)"
+    return texto
+
+
+def comparar(base, actual, umbral=0.10):
+    """
+    Compara dos ejecuciones caso a caso
+
+    Args:
+        base (dict): línea base guardada
+        actual (dict): ejecución nueva
+        umbral (float): aumento relativo a partir del cual hay regresión (0.10 = 10%)
+
+    Returns:
+        list de dicts {caso, base, actual, cambio, regresion}, solo de los
+        casos presentes en ambas ejecuciones
+    """
+    filas = []
+    for caso, medida in actual['resultados'].items():
+        anterior = base['resultados'].get(caso)
+        if anterior is None:
+            continue
+        cambio = medida['segundos'] / anterior['segundos'] - 1
+        filas.append({
+            'caso': caso,
+            'base': anterior['segundos'],
+            'actual': medida['segundos'],
+            'cambio': cambio,
+            'regresion': cambio > umbral
+        })
+    return filas
+
+
+def ejecutar_benchmark(args):
+    """Comando `bench` de la línea de comandos"""
+    base = None
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as fichero:
+            base = json.load(fichero)
+
+    if args.actual:
+        with open(args.actual, encoding='utf-8') as fichero:
+            actual = json.load(fichero)
+    else:
+        actual = ejecutar(args.filtro, args.tamano_maximo, args.objetivo, informe=sys.stdout)
+
+    if args.guardar:
+        with open(args.guardar, 'w', encoding='utf-8') as fichero:
+            json.dump(actual, fichero, ensure_ascii=False, indent=2)
+        print(f"Línea base guardada en {args.guardar}", file=sys.stderr)
+
+    if base is None:
+        return 0
+
+    if base.get('version_reglas') != actual.get('version_reglas'):
+        print(f"Reglas distintas: {base.get('version_reglas')} -> {actual.get('version_reglas')}")
+    filas = comparar(base, actual, args.umbral)
+    regresiones = [fila for fila in filas if fila['regresion']]
+    print()
+    for fila in filas:
+        marca = 'REGRESIÓN' if fila['regresion'] else ''
+        print(
+            f"{fila['caso']:<55} {fila['base'] * 1e6:>12,.1f} -> {fila['actual'] * 1e6:>12,.1f} µs"
+            f" {fila['cambio']:>+8.1%} {marca}"
+        )
+    print(f"\n{len(regresiones)} regresión(es) por encima del {args.umbral:.0%} en {len(filas)} casos")
+    return 1 if regresiones else 0
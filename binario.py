@@ -0,0 +1,485 @@
+"""
+Formato binario de registros
+Guarda los datos de entrada de una población en registros de ancho fijo
+(un campo de `datos` por columna, con tipo fijo) tras una cabecera con la
+versión del formato y del esquema, de modo que un fichero convertido una
+vez se vuelve a calcular sin leer ni validar texto: el lector proyecta el
+fichero en memoria con np.memmap y pasa al motor vectorial vistas de cada
+tramo de registros, sin copiarlos.
+
+Los campos de texto (comunidad, estado civil, régimen de autónomo) se
+guardan como códigos de un byte; sus valores están en la cabecera.
+
+Uso:
+    python -m irpf convertir campana.csv campana.irpfbin
+    python -m irpf batch campana.irpfbin resultados.parquet -j 8
+"""
+
+import json
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+from contribuyente import CAMPOS
+from instrumentacion import medir_etapas
+from lotes import (
+    ESTANDAR, MOTORES_ESCALARES, NOMBRES_CAMPOS, EstadisticasLote, InformeProgreso, abrir_entrada,
+    calcular_filas, convertir_valores, detectar_formato, en_bloques, filas_vectoriales, leer_registros,
+    registros_de_columnas
+)
+
+
+# Identifica los ficheros de este formato
+MAGIA = b'IRPFBIN\x00'
+
+# Versión de la disposición del fichero (preámbulo, cabecera y registros)
+VERSION_FORMATO = 1
+
+# Versión de las reglas que dan el tipo de cada campo (ver esquema_campos)
+VERSION_ESQUEMA = 1
+
+# Bytes reservados para la cabecera: los registros empiezan a continuación
+ESPACIO_CABECERA = 65536
+
+# Bytes del campo 'id' cuando los identificadores son textos
+ANCHO_ID = 32
+
+# Valores distintos que admite cada campo de texto (códigos de un byte)
+MAXIMO_CATEGORIAS = 256
+
+# Magia, versión del formato y longitud de la cabecera JSON que le sigue
+_PREAMBULO = struct.Struct('<8sII')
+
+# Tipo NumPy de cada tipo de campo de DatosContribuyente
+_TIPOS = {float: '<f8', int: '<i4', bool: '|b1', str: '|u1'}
+_TIPOS_CAMPO = {'ejercicio': '<i2'}
+
+# Posición en CAMPOS de los campos de texto
+_INDICES_TEXTO = tuple(
+    (indice, nombre) for indice, (nombre, tipo, _) in enumerate(CAMPOS) if tipo is str
+)
+
+# Registros proyectados en este proceso: ruta -> (firma, cabecera, registros)
+_ABIERTOS = {}
+
+
+# ===== Esquema =====
+
+def esquema_campos(tipo_id=None):
+    """
+    Campos de un registro binario, de mayor a menor tamaño
+
+    Además de los de CAMPOS, 'numero' (número del registro en el fichero de
+    origen) y, si se indica su tipo, 'id'.
+
+    Args:
+        tipo_id (str): tipo NumPy del campo 'id' ('<i8' o 'S<ancho>'), o None
+
+    Returns:
+        list de [nombre, tipo NumPy]
+    """
+    campos = [['numero', '<i8']]
+    if tipo_id is not None:
+        campos.append(['id', tipo_id])
+    campos.extend(
+        [nombre, _TIPOS_CAMPO.get(nombre, _TIPOS[tipo])] for nombre, tipo, _ in CAMPOS
+    )
+    return sorted(campos, key=lambda campo: -np.dtype(campo[1]).itemsize)
+
+
+def tipo_registro(campos):
+    """
+    dtype estructurado de un registro, sin huecos y con tamaño múltiplo de 8
+
+    Args:
+        campos (list): [nombre, tipo NumPy] en el orden del fichero
+
+    Returns:
+        np.dtype
+    """
+    nombres, formatos, desplazamientos = [], [], []
+    posicion = 0
+    for nombre, formato in campos:
+        nombres.append(nombre)
+        formatos.append(formato)
+        desplazamientos.append(posicion)
+        posicion += np.dtype(formato).itemsize
+    return np.dtype({
+        'names': nombres, 'formats': formatos, 'offsets': desplazamientos,
+        'itemsize': -(-posicion // 8) * 8
+    })
+
+
+def _campos_texto(campos):
+    return [nombre for nombre, formato in campos if formato == _TIPOS[str]]
+
+
+# ===== Conversión =====
+
+class EscritorBinario:
+    """
+    Escribe registros en el formato binario a medida que se convierten
+
+    El tipo del campo 'id' se decide con el primer bloque: entero si todos
+    sus identificadores lo son, texto de `ancho_id` bytes si no, y sin campo
+    si no traen 'id'. La cabecera se escribe al cerrar, así que `fichero`
+    debe admitir seek.
+
+    Args:
+        fichero: fichero binario abierto para escribir
+        ancho_id (int): bytes del campo 'id' de texto
+    """
+
+    def __init__(self, fichero, ancho_id=ANCHO_ID):
+        from renta_vectorizada import COMUNIDADES
+
+        self.fichero = fichero
+        self.ancho_id = ancho_id
+        self.registros = 0
+        self.campos = None
+        self._tipo = None
+        # Las comunidades conocidas conservan el código que usa el motor
+        self.categorias = {'comunidad': list(COMUNIDADES)}
+        self._codigos = {}
+        fichero.write(b'\x00' * ESPACIO_CABECERA)
+
+    def escribir(self, inicio, bloque):
+        """
+        Convierte y escribe un bloque de registros leídos
+
+        Args:
+            inicio (int): número de registro del primer elemento del bloque
+            bloque (list): registros leídos (dicts, o str con un error de lectura)
+
+        Returns:
+            list de errores {'registro', 'error'} de los registros no escritos
+        """
+        if self.campos is None:
+            self._preparar(bloque)
+        numeros, identificadores, registros, errores = [], [], [], []
+        for numero, valores in enumerate(bloque, start=inicio):
+            if isinstance(valores, str):
+                errores.append({'registro': numero, 'error': valores})
+                continue
+            identificador = valores.get('id', numero)
+            try:
+                registro = convertir_valores(valores)
+                self._validar(identificador, 'id' in valores, registro)
+            except ValueError as error:
+                errores.append({'registro': identificador, 'error': str(error)})
+                continue
+            numeros.append(numero)
+            identificadores.append(identificador)
+            registros.append(registro)
+
+        datos = np.zeros(len(registros), dtype=self._tipo)
+        datos['numero'] = numeros
+        if 'id' in self._tipo.names:
+            if self._tipo['id'].kind == 'S':
+                identificadores = [str(identificador).encode('utf-8') for identificador in identificadores]
+            datos['id'] = identificadores
+        for nombre, valores in zip(NOMBRES_CAMPOS, zip(*registros)):
+            codigos = self._codigos.get(nombre)
+            datos[nombre] = valores if codigos is None else [codigos[valor] for valor in valores]
+        self.fichero.write(datos.tobytes())
+        self.registros += len(registros)
+        return errores
+
+    def cerrar(self):
+        """Escribe la cabecera (también si no se ha escrito ningún registro)"""
+        if self.campos is None:
+            self._preparar([])
+        cabecera = json.dumps({
+            'version_esquema': VERSION_ESQUEMA,
+            'campos': self.campos,
+            'categorias': self.categorias,
+            'registros': self.registros,
+            'tamano_registro': self._tipo.itemsize
+        }, ensure_ascii=False).encode('utf-8')
+        if _PREAMBULO.size + len(cabecera) > ESPACIO_CABECERA:
+            raise ValueError(f"La cabecera ocupa más de {ESPACIO_CABECERA} bytes")
+        self.fichero.seek(0)
+        self.fichero.write(_PREAMBULO.pack(MAGIA, VERSION_FORMATO, len(cabecera)) + cabecera)
+        self.fichero.seek(0, os.SEEK_END)
+        self.fichero.flush()
+
+    def _preparar(self, bloque):
+        identificadores = [valores['id'] for valores in bloque if isinstance(valores, dict) and 'id' in valores]
+        if not identificadores:
+            tipo_id = None
+        elif all(type(identificador) is int for identificador in identificadores):
+            tipo_id = '<i8'
+        else:
+            tipo_id = f'S{self.ancho_id}'
+        self.campos = esquema_campos(tipo_id)
+        self._tipo = tipo_registro(self.campos)
+        for nombre in _campos_texto(self.campos):
+            valores = self.categorias.setdefault(nombre, [])
+            self._codigos[nombre] = {valor: codigo for codigo, valor in enumerate(valores)}
+
+    def _validar(self, identificador, con_id, registro):
+        # Comprueba lo que el formato no puede guardar antes de escribir nada
+        if 'id' in self._tipo.names:
+            if self._tipo['id'].kind == 'i':
+                if type(identificador) is not int or not -2**63 <= identificador < 2**63:
+                    raise ValueError(f"'id' debe ser un entero de 64 bits como en los primeros registros: {identificador!r}")
+            elif len(str(identificador).encode('utf-8')) > self.ancho_id:
+                raise ValueError(f"'id' ocupa más de {self.ancho_id} bytes: {identificador!r}")
+        elif con_id:
+            raise ValueError("Los primeros registros no tienen 'id': no se puede guardar")
+
+        for indice, nombre in _INDICES_TEXTO:
+            codigos = self._codigos[nombre]
+            valor = registro[indice]
+            if valor not in codigos:
+                if len(codigos) >= MAXIMO_CATEGORIAS:
+                    raise ValueError(f"Más de {MAXIMO_CATEGORIAS} valores distintos de '{nombre}': {valor!r}")
+                codigos[valor] = len(codigos)
+                self.categorias[nombre].append(valor)
+
+
+def convertir_a_binario(entrada, salida, formato_entrada, tamano_bloque=5000, ancho_id=ANCHO_ID,
+                        errores=None, progreso=None):
+    """
+    Convierte un fichero de registros CSV/JSONL al formato binario
+
+    Los registros que no se pueden convertir no se escriben (van a `errores`).
+
+    Args:
+        entrada: fichero de texto abierto con los registros
+        salida: fichero binario abierto para escribir (debe admitir seek)
+        formato_entrada (str): 'csv' o 'jsonl'
+        tamano_bloque (int): registros que se convierten de una vez
+        ancho_id (int): bytes del campo 'id' si los identificadores son textos
+        errores: fichero opcional donde escribir los registros fallidos (JSONL)
+        progreso: función opcional llamada con las EstadisticasLote tras cada bloque
+
+    Returns:
+        EstadisticasLote
+    """
+    estadisticas = EstadisticasLote()
+    escritor = EscritorBinario(salida, ancho_id)
+    for inicio, bloque in en_bloques(leer_registros(entrada, formato_entrada), tamano_bloque):
+        fallidos = escritor.escribir(inicio, bloque)
+        estadisticas.registros += len(bloque)
+        estadisticas.fallidos += len(fallidos)
+        if errores is not None:
+            for fallido in fallidos:
+                errores.write(json.dumps(fallido, ensure_ascii=False) + '\n')
+        if progreso is not None:
+            progreso(estadisticas)
+    escritor.cerrar()
+
+    estadisticas.fin = time.perf_counter()
+    return estadisticas
+
+
+# ===== Lectura =====
+
+def leer_cabecera(ruta):
+    """
+    Lee la cabecera de un fichero binario de registros
+
+    Returns:
+        dict con 'version_esquema', 'campos', 'categorias', 'registros' y
+        'tamano_registro'
+
+    Raises:
+        ValueError: si el fichero no es de este formato o de otra versión
+    """
+    with open(ruta, 'rb') as fichero:
+        preambulo = fichero.read(_PREAMBULO.size)
+        if len(preambulo) < _PREAMBULO.size or preambulo[:len(MAGIA)] != MAGIA:
+            raise ValueError(f"'{ruta}' no es un fichero binario de registros")
+        _, version, longitud = _PREAMBULO.unpack(preambulo)
+        if version != VERSION_FORMATO:
+            raise ValueError(f"'{ruta}' tiene la versión {version} del formato (se admite la {VERSION_FORMATO})")
+        if longitud == 0:
+            raise ValueError(f"'{ruta}' está incompleto: la conversión no terminó")
+        return json.loads(fichero.read(longitud))
+
+
+def abrir_registros(ruta):
+    """
+    Proyecta en memoria los registros de un fichero binario
+
+    La proyección se reutiliza mientras el fichero no cambie, así que cada
+    proceso del pool la abre una sola vez para todos sus tramos.
+
+    Returns:
+        tuple: (cabecera, registros) con registros como array estructurado
+               de solo lectura respaldado por el fichero
+    """
+    estado = os.stat(ruta)
+    firma = (estado.st_mtime_ns, estado.st_size)
+    abierto = _ABIERTOS.get(ruta)
+    if abierto is not None and abierto[0] == firma:
+        return abierto[1], abierto[2]
+
+    cabecera = leer_cabecera(ruta)
+    tipo = tipo_registro(cabecera['campos'])
+    n = cabecera['registros']
+    if tipo.itemsize != cabecera['tamano_registro'] or estado.st_size < ESPACIO_CABECERA + n * tipo.itemsize:
+        raise ValueError(f"'{ruta}' no coincide con su cabecera: ¿está truncado?")
+    if n:
+        registros = np.memmap(ruta, dtype=tipo, mode='r', offset=ESPACIO_CABECERA, shape=(n,)).view(np.ndarray)
+    else:
+        registros = np.zeros(0, dtype=tipo)
+    _ABIERTOS[ruta] = (firma, cabecera, registros)
+    return cabecera, registros
+
+
+def leer_tramo(ruta, desde, hasta):
+    """
+    Columnas de entrada del motor para los registros [desde, hasta) de un fichero binario
+
+    Los campos numéricos y booleanos son vistas del fichero proyectado
+    (sin copia). La comunidad va como código de COMUNIDADES; los campos que
+    el fichero no tiene toman su valor por defecto en el motor.
+
+    Returns:
+        tuple: (identificadores, columnas, comunidades) con identificadores
+               como array de enteros (o list de str si 'id' es texto),
+               columnas como dict campo -> array y comunidades como array
+               con el nombre de la comunidad de cada fila
+    """
+    from renta_vectorizada import COMUNIDADES
+
+    cabecera, registros = abrir_registros(ruta)
+    tramo = registros[desde:hasta]
+    categorias = cabecera['categorias']
+    columnas = {}
+    for nombre in NOMBRES_CAMPOS:
+        if nombre not in tramo.dtype.names:
+            continue
+        if nombre == 'comunidad':
+            traduccion = np.array(
+                [COMUNIDADES.index(valor) if valor in COMUNIDADES else len(COMUNIDADES)
+                 for valor in categorias[nombre]],
+                dtype=np.intp
+            )
+            codigos = tramo[nombre]
+            identidad = np.array_equal(traduccion, np.arange(len(traduccion)))
+            columnas[nombre] = codigos if identidad else traduccion.take(codigos)
+        elif nombre in categorias:
+            columnas[nombre] = _como_objetos(categorias[nombre]).take(tramo[nombre])
+        else:
+            columnas[nombre] = tramo[nombre]
+
+    if 'comunidad' in tramo.dtype.names:
+        comunidades = _como_objetos(categorias['comunidad']).take(tramo['comunidad'])
+    else:
+        comunidades = None
+
+    if 'id' not in tramo.dtype.names:
+        identificadores = tramo['numero']
+    elif tramo.dtype['id'].kind == 'S':
+        identificadores = [identificador.decode('utf-8') for identificador in tramo['id'].tolist()]
+    else:
+        identificadores = tramo['id']
+    return identificadores, columnas, comunidades
+
+
+def _como_objetos(valores):
+    # np.array convertiría ['Madrid', None] en un array de texto con 'None'
+    objetos = np.empty(len(valores), dtype=object)
+    objetos[:] = valores
+    return objetos
+
+
+def tramos(ruta, tamano_bloque):
+    """
+    Divide un fichero binario en tramos para repartir_bloques
+
+    Yields:
+        (número del primer registro, (ruta, desde, hasta))
+    """
+    n = abrir_registros(ruta)[0]['registros']
+    for desde in range(0, n, tamano_bloque):
+        yield desde + 1, (ruta, desde, min(desde + tamano_bloque, n))
+
+
+def procesar_tramo(inicio, tramo, motor='vectorial', etapas=False):
+    """
+    Calcula un tramo de un fichero binario (se ejecuta en los procesos del pool)
+
+    Args:
+        inicio (int): número del primer registro del tramo
+        tramo (tuple): (ruta, desde, hasta) como los de tramos()
+        motor (str): uno de lotes.MOTORES
+        etapas (bool): si es True, mide el tiempo de cada etapa del cálculo
+
+    Returns:
+        tuple: (filas, errores, etapas) como procesar_bloque (sin errores:
+               los registros se validaron al convertir)
+    """
+    if etapas:
+        with medir_etapas() as medidor:
+            filas, errores, _ = procesar_tramo(inicio, tramo, motor)
+        return filas, errores, medidor.exportar()
+
+    identificadores, columnas, comunidades = leer_tramo(*tramo)
+    if motor in MOTORES_ESCALARES:
+        n = len(identificadores)
+        registros = registros_de_columnas(columnas, n, comunidades)
+        identificadores = identificadores.tolist() if isinstance(identificadores, np.ndarray) else identificadores
+        return calcular_filas(identificadores, registros, motor), [], None
+    return filas_vectoriales(identificadores, columnas, comunidades, motor), [], None
+
+
+def calcular_columnas_tramo(inicio, tramo, motor='vectorial', etapas=False):
+    """
+    Como procesar_tramo, pero devuelve columnas planas como calcular_columnas
+    """
+    if etapas:
+        with medir_etapas() as medidor:
+            columnas, errores, _ = calcular_columnas_tramo(inicio, tramo, motor)
+        return columnas, errores, medidor.exportar()
+
+    from exportacion import columnas_planas
+
+    identificadores, columnas, comunidades = leer_tramo(*tramo)
+    return columnas_planas(identificadores, columnas, motor, comunidades), [], None
+
+
+# ===== Línea de comandos =====
+
+def ejecutar_conversion(args):
+    """Comando `convertir` de la línea de comandos"""
+    try:
+        return _ejecutar_conversion(args)
+    except (OSError, ValueError) as error:
+        # Errores de uso (formatos, ficheros que no existen...): el mensaje, sin traza, como `irpf calc`
+        print(error, file=sys.stderr)
+        return 2
+
+
+def _ejecutar_conversion(args):
+    formato_entrada = detectar_formato(args.entrada, args.formato_entrada)
+    if formato_entrada not in ('csv', 'jsonl'):
+        raise ValueError(f"Solo se convierten ficheros csv o jsonl, no {formato_entrada}")
+    if args.ancho_id < 1:
+        raise ValueError("--ancho-id debe ser >= 1")
+    if args.salida == ESTANDAR:
+        raise ValueError("El fichero binario no puede ir a la salida estándar: la cabecera se escribe al final")
+    progreso = InformeProgreso(args.progreso) if args.progreso > 0 else None
+
+    errores = open(args.errores, 'w', encoding='utf-8') if args.errores else None
+    try:
+        with abrir_entrada(args.entrada) as entrada, open(args.salida, 'wb') as salida:
+            estadisticas = convertir_a_binario(
+                entrada, salida, formato_entrada,
+                tamano_bloque=args.bloque,
+                ancho_id=args.ancho_id,
+                errores=errores,
+                progreso=progreso
+            )
+    finally:
+        if errores is not None:
+            errores.close()
+
+    print(estadisticas.resumen(), file=sys.stderr)
+    return 1 if estadisticas.fallidos else 0
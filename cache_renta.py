@@ -0,0 +1,87 @@
+"""
+Caché de resultados de calcular_renta_total
+Guarda las cifras calculadas de cada perfil bajo una clave canónica (versión
+de las reglas + valores normalizados del registro) con expulsión LRU, para
+que repetir un escenario ya visto no vuelva a ejecutar el cálculo.
+"""
+
+from collections import OrderedDict
+
+
+class CacheResultados:
+    """
+    Caché LRU acotada con contadores de aciertos, fallos y expulsiones
+
+    Es opcional: se pasa a calcular_renta_total(datos, cache=...). Las
+    entradas de una versión de reglas anterior nunca coinciden con una clave
+    nueva, así que dejan de usarse y acaban expulsadas.
+
+    Atributos:
+        capacidad (int): número máximo de entradas
+        aciertos (int): consultas resueltas desde la caché
+        fallos (int): consultas que obligaron a calcular
+        expulsiones (int): entradas descartadas por falta de espacio
+    """
+
+    def __init__(self, capacidad=1024):
+        if capacidad < 1:
+            raise ValueError("La capacidad de la caché debe ser >= 1")
+        self.capacidad = capacidad
+        self._entradas = OrderedDict()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def __contains__(self, clave):
+        return clave in self._entradas
+
+    def obtener(self, clave):
+        """
+        Devuelve el valor guardado para `clave` (o None) y lo marca como reciente
+        """
+        valor = self._entradas.get(clave)
+        if valor is None:
+            self.fallos += 1
+            return None
+        self._entradas.move_to_end(clave)
+        self.aciertos += 1
+        return valor
+
+    def guardar(self, clave, valor):
+        """Guarda `valor` bajo `clave`, expulsando la entrada menos usada si no cabe"""
+        entradas = self._entradas
+        entradas[clave] = valor
+        entradas.move_to_end(clave)
+        while len(entradas) > self.capacidad:
+            entradas.popitem(last=False)
+            self.expulsiones += 1
+
+    def limpiar(self):
+        """Vacía la caché y pone los contadores a cero"""
+        self._entradas.clear()
+        self.aciertos = self.fallos = self.expulsiones = 0
+
+    def estadisticas(self):
+        """
+        Returns:
+            dict: aciertos, fallos, expulsiones, tamano, capacidad y tasa_aciertos (0-1)
+        """
+        consultas = self.aciertos + self.fallos
+        return {
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'expulsiones': self.expulsiones,
+            'tamano': len(self._entradas),
+            'capacidad': self.capacidad,
+            'tasa_aciertos': self.aciertos / consultas if consultas else 0.0
+        }
+
+    def __repr__(self):
+        e = self.estadisticas()
+        return (
+            f"CacheResultados(tamano={e['tamano']}/{e['capacidad']}, aciertos={e['aciertos']}, "
+            f"fallos={e['fallos']}, expulsiones={e['expulsiones']})"
+        )
@@ -0,0 +1,115 @@
+"""
+Cálculo de una declaración desde la línea de comandos
+Lee un registro `datos` en JSON (fichero o entrada estándar), lo calcula con
+calcular_renta_total y escribe el resultado en JSON. Solo carga el motor y
+la conversión de registros de lotes.py, nunca Streamlit ni plotly, así que
+el coste de cada llamada es prácticamente el arranque del intérprete.
+
+Uso:
+    echo '{"comunidad": "Madrid", "salario": 32000}' | python -m irpf calc
+    python -m irpf calc perfil.json --campos resumen.tipo_medio,cuota_diferencial.importe
+    python -m irpf calc perfil.json --campos cuota_diferencial.importe   # valor suelto
+"""
+
+import json
+import sys
+from collections.abc import Mapping
+
+from lotes import ESTANDAR, abrir_entrada, abrir_salida, convertir_registro
+
+
+def leer_datos(fichero):
+    """
+    Lee un registro `datos` en JSON
+
+    Args:
+        fichero: fichero de texto con un objeto JSON
+
+    Returns:
+        DatosContribuyente
+
+    Raises:
+        ValueError: si no es un objeto JSON o algún valor no es válido
+    """
+    try:
+        valores = json.load(fichero)
+    except json.JSONDecodeError as error:
+        raise ValueError(f"JSON no válido: {error}") from None
+    if not isinstance(valores, dict):
+        raise ValueError("La entrada debe ser un objeto JSON con los campos de la declaración")
+    return convertir_registro(valores)
+
+
+def extraer_campo(resultado, ruta):
+    """
+    Devuelve el valor de una ruta con puntos del resultado
+
+    Los números de la ruta indexan listas, p. ej.
+    'cuotas_integras.desglose_estatal_general.0.cuota'.
+
+    Args:
+        resultado: dict (o ResultadoRenta) de calcular_renta_total
+        ruta (str): claves separadas por puntos
+
+    Returns:
+        el valor en esa ruta
+
+    Raises:
+        KeyError: si la ruta no existe en el resultado
+    """
+    valor = resultado
+    recorrido = []
+    for clave in ruta.split('.'):
+        recorrido.append(clave)
+        if isinstance(valor, Mapping) and clave in valor:
+            valor = valor[clave]
+        elif isinstance(valor, list) and clave.lstrip('-').isdigit() and -len(valor) <= int(clave) < len(valor):
+            valor = valor[int(clave)]
+        else:
+            disponibles = ', '.join(valor) if isinstance(valor, Mapping) else f"{type(valor).__name__} sin '{clave}'"
+            raise KeyError(f"No existe '{'.'.join(recorrido)}' en el resultado (disponibles: {disponibles})")
+    return valor
+
+
+def _rutas(campos):
+    # --campos se puede repetir y cada uno admite varias rutas separadas por comas
+    return [ruta.strip() for grupo in campos for ruta in grupo.split(',') if ruta.strip()]
+
+
+def ejecutar_calculo(args):
+    """Comando `calc` de la línea de comandos"""
+    from renta import calcular_renta_total
+
+    try:
+        with abrir_entrada(args.entrada) as entrada:
+            datos = leer_datos(entrada)
+    except (OSError, ValueError) as error:
+        print(f"{args.entrada if args.entrada != ESTANDAR else 'stdin'}: {error}", file=sys.stderr)
+        return 2
+
+    try:
+        # Sin detalle: con --campos solo se construyen las secciones pedidas
+        resultado = calcular_renta_total(datos, detalle=False, ejercicio=args.ejercicio)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+
+    rutas = _rutas(args.campos or [])
+    try:
+        if not rutas:
+            salida = resultado.como_dict()
+        elif len(rutas) == 1:
+            salida = extraer_campo(resultado, rutas[0])
+        else:
+            salida = {ruta: extraer_campo(resultado, ruta) for ruta in rutas}
+    except KeyError as error:
+        print(error.args[0], file=sys.stderr)
+        return 2
+
+    with abrir_salida(args.salida) as fichero:
+        if len(rutas) == 1 and isinstance(salida, str):
+            # Un texto suelto va sin comillas, para usarlo directamente en el shell
+            fichero.write(salida + '\n')
+        else:
+            fichero.write(json.dumps(salida, ensure_ascii=False, indent=args.indentar) + '\n')
+    return 0
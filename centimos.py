@@ -0,0 +1,92 @@
+"""
+Aritmética en céntimos
+Los motores en céntimos (renta_centimos.py) llevan los importes como enteros
+de céntimos y los tipos y porcentajes como enteros escalados por
+ESCALA_TIPOS, así que sumas, restas, máximos y mínimos son exactos y solo
+se redondea donde se decide: al pasar un importe en euros a céntimos y al
+aplicar un tipo o dividir. Siempre al céntimo más próximo, con las mitades
+lejos del cero. Cada función tiene su versión para Python (int) y para
+arrays de NumPy (int64), con el mismo resultado.
+"""
+
+import math
+
+
+# Un tipo t se guarda como el entero t * ESCALA_TIPOS (admite 6 decimales)
+ESCALA_TIPOS = 1000000
+
+# Límite «infinito» en céntimos (el último tramo de las escalas): cabe en
+# int64 con margen para sumarle importes
+INFINITO = 2 ** 62
+
+# Con los importes en euros con 2 decimales, x * 100 cae a menos de un par
+# de ulp del entero; el ajuste hace que las mitades que el binario deja
+# justo por debajo (0,285 € -> 28,4999...) se redondeen como mitades. Va
+# incluido en el factor de conversión: una sola multiplicación por importe
+_CENTIMOS_POR_EURO = 100 * (1 + 2 ** -50)
+
+
+def a_centimos(euros):
+    """
+    Importe en euros (int o float) a céntimos, redondeado al céntimo
+
+    Los infinitos pasan a ±INFINITO.
+    """
+    if euros == math.inf or euros == -math.inf:
+        return INFINITO if euros > 0 else -INFINITO
+    centimos = euros * _CENTIMOS_POR_EURO
+    # int() trunca hacia el cero: sumando ±0,5 antes, las mitades se alejan del cero
+    return int(centimos + math.copysign(0.5, centimos))
+
+
+def a_centimos_array(euros):
+    """Como a_centimos, para un array de importes finitos (devuelve int64)"""
+    import numpy as np
+    centimos = np.multiply(euros, _CENTIMOS_POR_EURO, dtype=np.float64)
+    centimos += np.copysign(0.5, centimos)
+    return centimos.astype(np.int64)
+
+
+def tipo_entero(tipo):
+    """
+    Tipo o porcentaje (p. ej. 0.095) como entero escalado por ESCALA_TIPOS
+
+    Raises:
+        ValueError: si el tipo tiene más decimales de los que admite ESCALA_TIPOS
+    """
+    escalado = tipo * ESCALA_TIPOS
+    entero = round(escalado)
+    if abs(escalado - entero) > 1e-6:
+        raise ValueError(f"El tipo {tipo!r} tiene más de {len(str(ESCALA_TIPOS)) - 1} decimales")
+    return int(entero)
+
+
+def dividir(numerador, denominador):
+    """numerador / denominador (enteros, denominador > 0) redondeado a entero"""
+    redondeado = (abs(numerador) + denominador // 2) // denominador
+    return -redondeado if numerador < 0 else redondeado
+
+
+def dividir_array(numeradores, denominador):
+    """Como dividir, para un array de numeradores"""
+    import numpy as np
+    numeradores = np.asarray(numeradores)
+    redondeado = np.abs(numeradores)
+    redondeado += denominador // 2
+    redondeado //= denominador
+    return np.negative(redondeado, out=redondeado, where=numeradores < 0)
+
+
+def aplicar_tipo(centimos, tipo):
+    """Importe por un tipo entero (tipo_entero), redondeado al céntimo"""
+    return dividir(centimos * tipo, ESCALA_TIPOS)
+
+
+def aplicar_tipo_array(centimos, tipo):
+    """Como aplicar_tipo; importes y tipos pueden ser arrays o escalares"""
+    return dividir_array(centimos * tipo, ESCALA_TIPOS)
+
+
+def a_euros(centimos):
+    """Céntimos (int o array) a euros en coma flotante"""
+    return centimos / 100
@@ -0,0 +1,224 @@
+"""
+Registro tipado de los datos del contribuyente
+Sustituye al dict libre `datos`: los valores por defecto se resuelven una
+sola vez al construir el registro y el motor lee atributos de un layout fijo.
+
+Construir el registro congelado cuesta un object.__setattr__ por campo; para
+las entradas que llegan como dict o como valores sueltos, el motor usa una
+VistaContribuyente, que lee los mismos atributos de una copia del dict.
+"""
+
+from dataclasses import FrozenInstanceError, dataclass, fields, replace
+from operator import attrgetter
+
+from reglas import EJERCICIO_POR_DEFECTO
+
+
+@dataclass(slots=True, frozen=True)
+class DatosContribuyente:
+    """
+    Datos de entrada de una declaración (mismas claves que el dict del formulario)
+
+    Es inmutable: el motor puede compartir y cachear registros.
+    """
+
+    # Ejercicio fiscal (elige el paquete de reglas)
+    ejercicio: int = EJERCICIO_POR_DEFECTO
+
+    # Datos personales
+    comunidad: str = 'Madrid'
+    estado_civil: str = None
+    edad: int = 30
+    discapacidad: bool = False
+    grado_discapacidad: int = 33
+    familia_numerosa: bool = False
+    familia_numerosa_especial: bool = False
+    hijos_menores_3: int = 0
+    hijos_mayores_3: int = 0
+    hijos_con_discapacidad: int = 0
+    nacimiento_ultimo_ano: bool = False
+    ascendientes_mayores_65_a_cargo: int = 0
+    ascendientes_mayores_75_a_cargo: int = 0
+
+    # Rendimientos del trabajo
+    salario: float = 0
+    retenciones: float = 0
+
+    # Actividades económicas (autónomos)
+    es_autonomo: bool = False
+    regimen_autonomo: str = None
+    ingresos_autonomo: float = 0
+    gastos_autonomo: float = 0
+    pagos_fraccionados_autonomo: float = 0
+    mutualidad: float = 0
+
+    # Capital inmobiliario
+    alquiler_ingresos: float = 0
+    alquiler_gastos: float = 0
+    ibi: float = 0
+    gastos_comunidad: float = 0
+    seguro_hogar: float = 0
+    reparaciones: float = 0
+    intereses_hipoteca: float = 0
+    valor_construccion_alquiler: float = 0
+    valor_compra_inmueble: float = 0
+    arrendatario_menor_30: bool = False
+    tiene_segunda_vivienda: bool = False
+    valor_catastral_segunda: float = 0
+    valor_catastral_revisado: bool = False
+
+    # Capital mobiliario y ganancias patrimoniales
+    dividendos: float = 0
+    intereses: float = 0
+    ganancias: float = 0
+    perdidas_patrimoniales: float = 0
+    perdidas_pendientes_anos_anteriores: float = 0
+
+    # Reducciones y deducciones
+    plan_pensiones: float = 0
+    pensiones_compensatorias: float = 0
+    vivienda_habitual: bool = False
+    vivienda_importe: float = 0
+    donaciones: float = 0
+    donacion_plurianual: bool = False
+    maternidad: bool = False
+    alquiler_vivienda_habitual_pagado: float = 0
+    gastos_guarderia: float = 0
+
+    @classmethod
+    def desde_dict(cls, datos):
+        """
+        Construye el registro a partir del dict del formulario
+
+        Args:
+            datos (dict): campos del formulario; los ausentes toman su valor
+                          por defecto y las claves desconocidas se ignoran
+
+        Returns:
+            DatosContribuyente
+        """
+        get = datos.get
+        return cls(*[get(nombre, defecto) for nombre, _, defecto in CAMPOS])
+
+    def a_dict(self):
+        """Devuelve el registro como dict con todas las claves del formulario"""
+        return {nombre: getattr(self, nombre) for nombre, _, _ in CAMPOS}
+
+    def como_tupla(self):
+        """
+        Devuelve los valores del registro en el orden de CAMPOS
+
+        Dos registros con los mismos datos dan tuplas iguales (y el mismo
+        hash), así que sirve como clave canónica del perfil.
+        """
+        return _VALORES(self)
+
+    def reemplazar(self, **cambios):
+        """
+        Devuelve una copia del registro con los campos indicados cambiados
+
+        Raises:
+            TypeError: si algún campo no existe
+        """
+        return replace(self, **cambios)
+
+
+class VistaContribuyente:
+    """
+    Vista de solo lectura de unos datos del contribuyente
+
+    Tiene los atributos y los métodos de lectura de DatosContribuyente, con
+    los valores por defecto ya resueltos, pero los guarda en un dict propio:
+    crearla es copiar el dict del formulario sobre VALORES_POR_DEFECTO. Las
+    vistas se obtienen con como_contribuyente o vista_desde_valores.
+    """
+
+    def __setattr__(self, nombre, valor):
+        raise FrozenInstanceError(f"cannot assign to field {nombre!r}")
+
+    def __delattr__(self, nombre):
+        raise FrozenInstanceError(f"cannot delete field {nombre!r}")
+
+    def __eq__(self, otro):
+        if isinstance(otro, (VistaContribuyente, DatosContribuyente)):
+            return _VALORES(self) == _VALORES(otro)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(_VALORES(self))
+
+    def __repr__(self):
+        campos = ', '.join(f"{nombre}={valor!r}" for nombre, valor in self.a_dict().items())
+        return f"{type(self).__name__}({campos})"
+
+    a_dict = DatosContribuyente.a_dict
+    como_tupla = DatosContribuyente.como_tupla
+
+    def reemplazar(self, **cambios):
+        """
+        Devuelve una vista con los campos indicados cambiados
+
+        Raises:
+            TypeError: si algún campo no existe
+        """
+        for campo in cambios:
+            if campo not in VALORES_POR_DEFECTO:
+                raise TypeError(f"Campo desconocido: {campo!r}")
+        return _vista({**self.__dict__, **cambios})
+
+    def registro(self):
+        """Devuelve los mismos datos como DatosContribuyente"""
+        return DatosContribuyente(*_VALORES(self))
+
+
+# Esquema (nombre, tipo, valor por defecto) de cada campo, en orden de declaración
+CAMPOS = tuple((campo.name, campo.type, campo.default) for campo in fields(DatosContribuyente))
+
+_VALORES = attrgetter(*(nombre for nombre, _, _ in CAMPOS))
+
+# Valores por defecto por nombre de campo
+VALORES_POR_DEFECTO = {nombre: defecto for nombre, _, defecto in CAMPOS}
+
+_NOMBRES = tuple(VALORES_POR_DEFECTO)
+
+# Una clave del dict con el nombre de un método lo taparía en la vista
+_METODOS_VISTA = frozenset(('a_dict', 'como_tupla', 'reemplazar', 'registro'))
+
+
+def _vista(valores):
+    vista = object.__new__(VistaContribuyente)
+    object.__setattr__(vista, '__dict__', valores)
+    return vista
+
+
+def vista_desde_valores(valores):
+    """
+    Vista de solo lectura de unos valores en el orden de CAMPOS
+
+    Args:
+        valores: secuencia con un valor por campo (como_tupla, convertir_valores)
+
+    Returns:
+        VistaContribuyente
+    """
+    return _vista(dict(zip(_NOMBRES, valores)))
+
+
+def como_contribuyente(datos):
+    """
+    Devuelve `datos` como registro de solo lectura, sin copiar si ya lo es
+
+    Un dict del formulario se lee a través de una VistaContribuyente, sin
+    construir el DatosContribuyente congelado.
+
+    Args:
+        datos: dict del formulario, DatosContribuyente o VistaContribuyente
+
+    Returns:
+        DatosContribuyente o VistaContribuyente
+    """
+    if isinstance(datos, (DatosContribuyente, VistaContribuyente)):
+        return datos
+    if not datos.keys().isdisjoint(_METODOS_VISTA):
+        return DatosContribuyente.desde_dict(datos)
+    return _vista({**VALORES_POR_DEFECTO, **datos})
@@ -0,0 +1,343 @@
+"""
+Deducciones autonómicas compiladas
+Las deducciones específicas de cada comunidad son dicts con nombres y formatos
+distintos según la comunidad (importes sueltos o por tipo, varias claves
+posibles para el alquiler...). Se compilan una sola vez en una lista plana de
+reglas tipadas: cada regla sabe a qué apartado suma, cuándo se aplica y con
+qué parámetros. El motor escalar recorre la lista de la comunidad y el
+vectorial evalúa cada tipo de regla una sola vez para todo el lote.
+
+Cada regla tiene también su versión en céntimos (parametros_centimos,
+importe_centimos e importe_centimos_array) para los motores de
+renta_centimos.py: los importes en céntimos y los porcentajes como enteros
+escalados, con el importe redondeado al céntimo.
+"""
+
+from centimos import a_centimos, aplicar_tipo, aplicar_tipo_array, tipo_entero
+
+# Edad desde la que ya no se aplican las deducciones de alquiler para jóvenes
+EDAD_ALQUILER_JOVEN = 35
+
+# Claves de la deducción por alquiler, en orden de preferencia
+CLAVES_ALQUILER = ("alquiler_vivienda_habitual", "alquiler_menores_35", "alquiler_menores_36", "alquiler_vivienda")
+
+
+class DeduccionNacimiento:
+    """Nacimiento o adopción en el ejercicio: importe según el número de hijo"""
+
+    apartado = 'nacimiento_adopcion'
+    __slots__ = ('primero', 'segundo', 'resto')
+
+    def __init__(self, primero, segundo, resto):
+        self.primero = primero
+        self.segundo = segundo
+        self.resto = resto
+
+    @property
+    def parametros(self):
+        return (self.primero, self.segundo, self.resto)
+
+    def aplica(self, datos):
+        return datos.nacimiento_ultimo_ano
+
+    def importe(self, datos):
+        return self.importe_hijo(datos.hijos_menores_3 + datos.hijos_mayores_3)
+
+    def importe_hijo(self, numero_hijo):
+        if numero_hijo == 1:
+            return self.primero
+        if numero_hijo == 2:
+            return self.segundo
+        return self.resto
+
+    @staticmethod
+    def importe_array(num, bool_, primero, segundo, resto):
+        import numpy as np
+        numero_hijo = num('hijos_menores_3') + num('hijos_mayores_3')
+        importe = np.where(numero_hijo == 1, primero, np.where(numero_hijo == 2, segundo, resto))
+        return np.where(bool_('nacimiento_ultimo_ano'), importe, 0)
+
+    @property
+    def parametros_centimos(self):
+        return tuple(a_centimos(importe) for importe in self.parametros)
+
+    def importe_centimos(self, datos):
+        return a_centimos(self.importe(datos))
+
+    # Importes fijos: con los parámetros en céntimos, la fórmula es la misma
+    importe_centimos_array = importe_array
+
+    def __repr__(self):
+        return f"DeduccionNacimiento({self.primero!r}, {self.segundo!r}, {self.resto!r})"
+
+
+class DeduccionFamiliaNumerosa:
+    """Familia numerosa: importe según sea de categoría general o especial"""
+
+    apartado = 'familia_numerosa_autonomica'
+    __slots__ = ('general', 'especial')
+
+    def __init__(self, general, especial):
+        self.general = general
+        self.especial = especial
+
+    @property
+    def parametros(self):
+        return (self.general, self.especial)
+
+    def aplica(self, datos):
+        return datos.familia_numerosa
+
+    def importe(self, datos):
+        return self.especial if datos.familia_numerosa_especial else self.general
+
+    @staticmethod
+    def importe_array(num, bool_, general, especial):
+        import numpy as np
+        importe = np.where(bool_('familia_numerosa_especial'), especial, general)
+        return np.where(bool_('familia_numerosa'), importe, 0)
+
+    @property
+    def parametros_centimos(self):
+        return tuple(a_centimos(importe) for importe in self.parametros)
+
+    def importe_centimos(self, datos):
+        return a_centimos(self.importe(datos))
+
+    importe_centimos_array = importe_array
+
+    def __repr__(self):
+        return f"DeduccionFamiliaNumerosa({self.general!r}, {self.especial!r})"
+
+
+class DeduccionAlquiler:
+    """
+    Alquiler de la vivienda habitual: porcentaje del alquiler pagado hasta un límite
+
+    Los menores de EDAD_ALQUILER_JOVEN años pueden tener límite y porcentaje
+    propios; `limite` y `porcentaje` son None si la comunidad solo la
+    concede a jóvenes.
+    """
+
+    apartado = 'alquiler_vivienda_habitual'
+    __slots__ = ('limite_joven', 'porcentaje_joven', 'limite', 'porcentaje')
+
+    def __init__(self, limite_joven, porcentaje_joven, limite=None, porcentaje=None):
+        self.limite_joven = limite_joven
+        self.porcentaje_joven = porcentaje_joven
+        self.limite = limite
+        self.porcentaje = porcentaje
+
+    @property
+    def parametros(self):
+        if self.porcentaje is None:
+            return (self.limite_joven, self.porcentaje_joven, 0, 0)
+        return (self.limite_joven, self.porcentaje_joven, self.limite, self.porcentaje)
+
+    def parametros_edad(self, edad):
+        """(límite, porcentaje) aplicables a esa edad, o None"""
+        if edad < EDAD_ALQUILER_JOVEN:
+            return self.limite_joven, self.porcentaje_joven
+        if self.porcentaje is None:
+            return None
+        return self.limite, self.porcentaje
+
+    def aplica(self, datos):
+        return datos.alquiler_vivienda_habitual_pagado > 0
+
+    def importe(self, datos):
+        parametros = self.parametros_edad(datos.edad)
+        if parametros is None:
+            return 0
+        limite, porcentaje = parametros
+        return min(datos.alquiler_vivienda_habitual_pagado, limite) * porcentaje
+
+    @staticmethod
+    def importe_array(num, bool_, limite_joven, porcentaje_joven, limite, porcentaje):
+        import numpy as np
+        alquiler_pagado = num('alquiler_vivienda_habitual_pagado')
+        joven = num('edad') < EDAD_ALQUILER_JOVEN
+        limite = np.where(joven, limite_joven, limite)
+        porcentaje = np.where(joven, porcentaje_joven, porcentaje)
+        return np.where(alquiler_pagado > 0, np.minimum(alquiler_pagado, limite) * porcentaje, 0)
+
+    @property
+    def parametros_centimos(self):
+        limite_joven, porcentaje_joven, limite, porcentaje = self.parametros
+        return (
+            a_centimos(limite_joven), tipo_entero(porcentaje_joven), a_centimos(limite), tipo_entero(porcentaje)
+        )
+
+    def importe_centimos(self, datos):
+        parametros = self.parametros_edad(datos.edad)
+        if parametros is None:
+            return 0
+        limite, porcentaje = parametros
+        alquiler_pagado = a_centimos(datos.alquiler_vivienda_habitual_pagado)
+        return aplicar_tipo(min(alquiler_pagado, a_centimos(limite)), tipo_entero(porcentaje))
+
+    @staticmethod
+    def importe_centimos_array(num, bool_, limite_joven, porcentaje_joven, limite, porcentaje):
+        import numpy as np
+        alquiler_pagado = num('alquiler_vivienda_habitual_pagado')
+        joven = num('edad') < EDAD_ALQUILER_JOVEN
+        limite = np.where(joven, limite_joven, limite)
+        porcentaje = np.where(joven, porcentaje_joven, porcentaje)
+        importe = aplicar_tipo_array(np.minimum(alquiler_pagado, limite), porcentaje)
+        return np.where(alquiler_pagado > 0, importe, 0)
+
+    def __repr__(self):
+        return (
+            f"DeduccionAlquiler({self.limite_joven!r}, {self.porcentaje_joven!r}, "
+            f"{self.limite!r}, {self.porcentaje!r})"
+        )
+
+
+class DeduccionGuarderia:
+    """Gastos de guardería: porcentaje de los gastos hasta un límite"""
+
+    apartado = 'cuidado_menores'
+    __slots__ = ('limite', 'porcentaje')
+
+    def __init__(self, limite, porcentaje):
+        self.limite = limite
+        self.porcentaje = porcentaje
+
+    @property
+    def parametros(self):
+        return (self.limite, self.porcentaje)
+
+    def aplica(self, datos):
+        return datos.gastos_guarderia > 0
+
+    def importe(self, datos):
+        return min(datos.gastos_guarderia, self.limite) * self.porcentaje
+
+    @staticmethod
+    def importe_array(num, bool_, limite, porcentaje):
+        import numpy as np
+        gastos_guarderia = num('gastos_guarderia')
+        return np.where(gastos_guarderia > 0, np.minimum(gastos_guarderia, limite) * porcentaje, 0)
+
+    @property
+    def parametros_centimos(self):
+        return (a_centimos(self.limite), tipo_entero(self.porcentaje))
+
+    def importe_centimos(self, datos):
+        gastos_guarderia = a_centimos(datos.gastos_guarderia)
+        return aplicar_tipo(min(gastos_guarderia, a_centimos(self.limite)), tipo_entero(self.porcentaje))
+
+    @staticmethod
+    def importe_centimos_array(num, bool_, limite, porcentaje):
+        import numpy as np
+        gastos_guarderia = num('gastos_guarderia')
+        importe = aplicar_tipo_array(np.minimum(gastos_guarderia, limite), porcentaje)
+        return np.where(gastos_guarderia > 0, importe, 0)
+
+    def __repr__(self):
+        return f"DeduccionGuarderia({self.limite!r}, {self.porcentaje!r})"
+
+
+# Tipos de regla en el orden en que se suman al total autonómico
+TIPOS_DEDUCCION = (DeduccionNacimiento, DeduccionFamiliaNumerosa, DeduccionAlquiler, DeduccionGuarderia)
+
+
+def compilar_deducciones(deducciones):
+    """
+    Compila las deducciones específicas de una comunidad en reglas tipadas
+
+    Args:
+        deducciones (dict): deducciones de la comunidad, como en DEDUCCIONES_ESPECIFICAS
+
+    Returns:
+        tuple de reglas (en el orden de TIPOS_DEDUCCION), sin las que nunca
+        deducen nada
+    """
+    reglas = []
+
+    nacimiento = deducciones.get("nacimiento_adopcion")
+    if isinstance(nacimiento, dict):
+        nacimiento = DeduccionNacimiento(
+            nacimiento.get("primer_hijo", 0),
+            nacimiento.get("segundo", nacimiento.get("segundo_hijo", 0)),
+            nacimiento.get("tercero_mas", nacimiento.get("tercer_hijo", 0))
+        )
+    elif nacimiento is not None:
+        nacimiento = DeduccionNacimiento(nacimiento, nacimiento, nacimiento)
+    if nacimiento is not None and any(nacimiento.parametros):
+        reglas.append(nacimiento)
+
+    familia_numerosa = deducciones.get("familia_numerosa")
+    if isinstance(familia_numerosa, dict):
+        familia_numerosa = DeduccionFamiliaNumerosa(
+            familia_numerosa.get("general", 0), familia_numerosa.get("especial", 0)
+        )
+    elif familia_numerosa is not None:
+        familia_numerosa = DeduccionFamiliaNumerosa(familia_numerosa, familia_numerosa)
+    if familia_numerosa is not None and any(familia_numerosa.parametros):
+        reglas.append(familia_numerosa)
+
+    # Alquiler: los jóvenes toman la primera clave con parámetros; el resto,
+    # la primera que no exige ser menor de EDAD_ALQUILER_JOVEN años
+    candidatas = [
+        (clave, deducciones[clave]) for clave in CLAVES_ALQUILER
+        if isinstance(deducciones.get(clave), dict)
+    ]
+    if candidatas:
+        joven = candidatas[0][1]
+        general = next((alquiler for clave, alquiler in candidatas if "menores" not in clave), None)
+        reglas.append(DeduccionAlquiler(
+            joven.get("limite", float('inf')), joven.get("porcentaje", 0),
+            None if general is None else general.get("limite", float('inf')),
+            None if general is None else general.get("porcentaje", 0)
+        ))
+
+    guarderia = deducciones.get("gastos_guarderia")
+    if isinstance(guarderia, dict):
+        reglas.append(DeduccionGuarderia(guarderia.get("limite", float('inf')), guarderia.get("porcentaje", 0)))
+
+    return tuple(reglas)
+
+
+def deducciones_autonomicas_array(reglas_comunidades, indice_comunidad, num, bool_, apartados=None,
+                                  centimos=False):
+    """
+    Suma las deducciones autonómicas de un lote (sin limitar a cuota)
+
+    Cada tipo de regla se evalúa una sola vez para todo el lote: sus
+    parámetros se reúnen en una tabla por comunidad (ceros en las que no la
+    tienen) y cada fila toma los de su comunidad.
+
+    Args:
+        reglas_comunidades: reglas compiladas de cada comunidad del lote
+        indice_comunidad (np.ndarray): índice en `reglas_comunidades` de cada fila
+        num, bool_: funciones que devuelven la columna numérica o booleana de un campo
+        apartados (dict): si se indica, se anota en él el importe de cada
+                          apartado ('cuidado_menores'...) que tenga alguna regla
+        centimos (bool): si es True, `num` da los importes en céntimos y el
+                         total sale en céntimos (int64), con importe_centimos_array
+
+    Returns:
+        np.ndarray con el total autonómico de cada fila
+    """
+    import numpy as np
+
+    tipo_valores = np.int64 if centimos else np.float64
+    total = np.zeros(len(indice_comunidad), dtype=tipo_valores)
+    for tipo in TIPOS_DEDUCCION:
+        tabla = None
+        for i, reglas in enumerate(reglas_comunidades):
+            for regla in reglas:
+                if type(regla) is tipo:
+                    parametros = regla.parametros_centimos if centimos else regla.parametros
+                    if tabla is None:
+                        tabla = np.zeros((len(reglas_comunidades), len(parametros)), dtype=tipo_valores)
+                    tabla[i] = parametros
+        if tabla is not None:
+            calcular = tipo.importe_centimos_array if centimos else tipo.importe_array
+            # Una columna contigua por parámetro, con el valor de la comunidad de cada fila
+            importe = calcular(num, bool_, *(parametro[indice_comunidad] for parametro in tabla.T))
+            if apartados is not None:
+                apartados[tipo.apartado] = importe
+            total = total + importe
+    return total
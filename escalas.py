@@ -0,0 +1,333 @@
+"""
+Escalas impositivas compiladas
+Cada escala progresiva [(límite, tipo), ...] se compila una sola vez en
+límites ordenados con la cuota acumulada al inicio de cada tramo, de modo
+que la cuota de cualquier base es una búsqueda binaria y una multiplicación.
+Varias escalas que gravan la misma base (estatal + autonómica) se pueden
+combinar en una sola función lineal a trozos.
+
+Para los motores en céntimos, cada escala compilada tiene su versión en
+aritmética entera (EscalaCentimos).
+"""
+
+from bisect import bisect_left
+
+from centimos import ESCALA_TIPOS, a_centimos, dividir, dividir_array, tipo_entero
+
+
+class EscalaCompilada:
+    """
+    Escala progresiva precompilada
+
+    Atributos:
+        limites (tuple): límite superior de cada tramo (el último, infinito)
+        tipos (tuple): tipo aplicable en cada tramo
+        inicios (tuple): límite inferior de cada tramo
+        acumulado (tuple): cuota acumulada hasta el inicio de cada tramo
+    """
+
+    __slots__ = ('limites', 'tipos', 'inicios', 'acumulado', '_ultimo', '_completos', '_arrays', '_centimos')
+
+    def __init__(self, escala):
+        limites = []
+        tipos = []
+        for limite, tipo in escala:
+            if limites and limite <= limites[-1]:
+                raise ValueError(f"Los límites de la escala deben ser crecientes: {limite} <= {limites[-1]}")
+            limites.append(limite)
+            tipos.append(tipo)
+        if not limites:
+            raise ValueError("La escala no tiene tramos")
+
+        inicios = [0] + limites[:-1]
+        acumulado = [0]
+        for i in range(len(limites) - 1):
+            acumulado.append(acumulado[-1] + (limites[i] - inicios[i]) * tipos[i])
+
+        self.limites = tuple(limites)
+        self.tipos = tuple(tipos)
+        self.inicios = tuple(inicios)
+        self.acumulado = tuple(acumulado)
+        self._ultimo = len(limites) - 1
+        # (base, tipo, cuota) de cada tramo recorrido entero, para desglose()
+        self._completos = tuple(
+            (limites[i] - inicios[i], tipos[i], (limites[i] - inicios[i]) * tipos[i])
+            for i in range(len(limites) - 1)
+        )
+        self._arrays = None
+        self._centimos = None
+
+    def __len__(self):
+        return len(self.limites)
+
+    def __iter__(self):
+        return iter(zip(self.limites, self.tipos))
+
+    def tramo(self, base):
+        """Índice del primer tramo cuyo límite es >= base"""
+        return min(bisect_left(self.limites, base), self._ultimo)
+
+    def cuota(self, base):
+        """Cuota de una base: una búsqueda binaria y una multiplicación-suma"""
+        if base <= 0:
+            return 0
+        i = self.tramo(base)
+        return self.acumulado[i] + (base - self.inicios[i]) * self.tipos[i]
+
+    def tipo(self, base):
+        """Tipo marginal de la escala para una base"""
+        return self.tipos[self.tramo(base)]
+
+    def desglose(self, base):
+        """
+        Desglose por tramos de la cuota de una base
+
+        Returns:
+            list: dicts {'base', 'tipo', 'cuota'} de cada tramo alcanzado
+        """
+        if base <= 0:
+            return []
+        i = self.tramo(base)
+        desglose = [
+            {'base': tramo_base, 'tipo': tipo, 'cuota': cuota}
+            for tramo_base, tipo, cuota in self._completos[:i]
+        ]
+        tramo_base = min(base, self.limites[i]) - self.inicios[i]
+        desglose.append({'base': tramo_base, 'tipo': self.tipos[i], 'cuota': tramo_base * self.tipos[i]})
+        return desglose
+
+    def arrays(self):
+        """
+        Tablas de la escala como arrays NumPy (se construyen en el primer uso)
+
+        Returns:
+            tuple: (limites, tipos, inicios, acumulado) como np.ndarray float64
+        """
+        if self._arrays is None:
+            import numpy as np
+            self._arrays = tuple(
+                np.array(valores, dtype=np.float64)
+                for valores in (self.limites, self.tipos, self.inicios, self.acumulado)
+            )
+        return self._arrays
+
+    def tramo_array(self, bases):
+        """Índice de tramo de cada base de un array"""
+        import numpy as np
+        limites = self.arrays()[0]
+        return np.minimum(np.searchsorted(limites, bases, side='left'), self._ultimo)
+
+    def cuota_array(self, bases):
+        """Cuota de cada base de un array, con las mismas tablas que cuota()"""
+        import numpy as np
+        _, tipos, inicios, acumulado = self.arrays()
+        bases = np.asarray(bases, dtype=np.float64)
+        i = self.tramo_array(bases)
+        cuota = acumulado[i] + (bases - inicios[i]) * tipos[i]
+        return np.where(bases > 0, cuota, 0.0)
+
+    def tipo_array(self, bases):
+        """Tipo marginal de cada base de un array"""
+        return self.arrays()[1][self.tramo_array(bases)]
+
+    def centimos(self):
+        """La escala en aritmética entera (EscalaCentimos), construida en el primer uso"""
+        if self._centimos is None:
+            self._centimos = EscalaCentimos(self)
+        return self._centimos
+
+
+class EscalaCombinada(EscalaCompilada):
+    """
+    Suma de varias escalas progresivas como una sola escala compilada
+
+    Sus límites son la unión de los de todas las partes y su tipo en cada
+    tramo, la suma de los tipos de las partes; así la cuota y el tipo
+    marginal conjuntos salen de una sola búsqueda binaria. cuota_partes()
+    devuelve además la cuota de cada parte con esa misma búsqueda.
+
+    Atributos:
+        partes (tuple): EscalaCompilada de cada escala sumada
+    """
+
+    __slots__ = ('partes', '_indices')
+
+    def __init__(self, *escalas):
+        partes = tuple(compilar_escala(escala) for escala in escalas)
+        if not partes:
+            raise ValueError("No hay escalas que combinar")
+        limites = sorted(set().union(*(parte.limites for parte in partes)))
+        # Índice del tramo de cada parte en cada tramo combinado
+        indices = tuple(tuple(parte.tramo(limite) for limite in limites) for parte in partes)
+        tipos = [0] * len(limites)
+        for parte, indices_parte in zip(partes, indices):
+            for i, j in enumerate(indices_parte):
+                tipos[i] += parte.tipos[j]
+        super().__init__(list(zip(limites, tipos)))
+        self.partes = partes
+        self._indices = indices
+
+    def cuota_partes(self, base):
+        """Cuota de cada parte para una base (tupla en el orden de las partes)"""
+        if base <= 0:
+            return (0,) * len(self.partes)
+        i = self.tramo(base)
+        cuotas = []
+        for parte, indices in zip(self.partes, self._indices):
+            j = indices[i]
+            cuotas.append(parte.acumulado[j] + (base - parte.inicios[j]) * parte.tipos[j])
+        return tuple(cuotas)
+
+    def tipo_medio(self, base):
+        """Tipo medio (cuota / base) de la escala combinada"""
+        return self.cuota(base) / base if base > 0 else 0.0
+
+    def cuota_partes_array(self, bases):
+        """Cuota de cada parte para un array de bases (tupla de arrays)"""
+        import numpy as np
+        bases = np.asarray(bases, dtype=np.float64)
+        i = self.tramo_array(bases)
+        positivas = bases > 0
+        resultado = []
+        for parte, indices in zip(self.partes, self._indices):
+            _, tipos, inicios, acumulado = parte.arrays()
+            j = np.asarray(indices, dtype=np.intp)[i]
+            resultado.append(np.where(positivas, acumulado[j] + (bases - inicios[j]) * tipos[j], 0.0))
+        return tuple(resultado)
+
+
+class EscalaCentimos:
+    """
+    Escala progresiva en aritmética entera (ver centimos.py)
+
+    Los límites van en céntimos, los tipos escalados por ESCALA_TIPOS y la
+    cuota acumulada al inicio de cada tramo en céntimos × ESCALA_TIPOS, sin
+    redondear: la cuota de una base es exacta hasta el final y se redondea
+    una sola vez al céntimo. Los tramos son los de la escala en euros (una
+    base igual a un límite queda en el tramo que ese límite cierra).
+
+    Obtén las instancias con EscalaCompilada.centimos().
+
+    Atributos:
+        limites, tipos, inicios, acumulado (tuple): como en EscalaCompilada
+    """
+
+    __slots__ = ('limites', 'tipos', 'inicios', 'acumulado', '_ultimo', '_arrays')
+
+    def __init__(self, escala):
+        limites = [a_centimos(limite) for limite in escala.limites]
+        tipos = [tipo_entero(tipo) for tipo in escala.tipos]
+        inicios = [0] + limites[:-1]
+        acumulado = [0]
+        for i in range(len(limites) - 1):
+            acumulado.append(acumulado[-1] + (limites[i] - inicios[i]) * tipos[i])
+
+        self.limites = tuple(limites)
+        self.tipos = tuple(tipos)
+        self.inicios = tuple(inicios)
+        self.acumulado = tuple(acumulado)
+        self._ultimo = len(limites) - 1
+        self._arrays = None
+
+    def tramo(self, base):
+        """Índice del primer tramo cuyo límite es >= base (en céntimos)"""
+        return min(bisect_left(self.limites, base), self._ultimo)
+
+    def cuota(self, base):
+        """Cuota en céntimos de una base en céntimos"""
+        if base <= 0:
+            return 0
+        i = self.tramo(base)
+        return dividir(self.acumulado[i] + (base - self.inicios[i]) * self.tipos[i], ESCALA_TIPOS)
+
+    def tipo(self, base):
+        """Tipo marginal (escalado por ESCALA_TIPOS) de una base en céntimos"""
+        return self.tipos[self.tramo(base)]
+
+    def arrays(self):
+        """
+        Tablas de la escala como arrays NumPy int64 (se construyen en el primer uso)
+
+        Returns:
+            tuple: (limites, tipos, inicios, acumulado)
+        """
+        if self._arrays is None:
+            import numpy as np
+            self._arrays = tuple(
+                np.array(valores, dtype=np.int64)
+                for valores in (self.limites, self.tipos, self.inicios, self.acumulado)
+            )
+        return self._arrays
+
+    def tramo_array(self, bases):
+        """Índice de tramo de cada base de un array en céntimos"""
+        import numpy as np
+        limites = self.arrays()[0]
+        return np.minimum(np.searchsorted(limites, bases, side='left'), self._ultimo)
+
+    def cuota_array(self, bases):
+        """Cuota en céntimos de cada base de un array int64 en céntimos"""
+        import numpy as np
+        _, tipos, inicios, acumulado = self.arrays()
+        i = self.tramo_array(bases)
+        cuota = dividir_array(acumulado[i] + (bases - inicios[i]) * tipos[i], ESCALA_TIPOS)
+        return np.where(bases > 0, cuota, 0)
+
+    def tipo_array(self, bases):
+        """Tipo marginal (escalado por ESCALA_TIPOS) de cada base de un array en céntimos"""
+        return self.arrays()[1][self.tramo_array(bases)]
+
+
+_ESCALAS_COMPILADAS = {}
+_ESCALAS_COMBINADAS = {}
+
+
+def compilar_escala(escala):
+    """
+    Devuelve la escala compilada, compilándola solo la primera vez
+
+    Args:
+        escala: lista de tuplas (límite, tipo) o EscalaCompilada
+
+    Returns:
+        EscalaCompilada
+    """
+    if isinstance(escala, EscalaCompilada):
+        return escala
+    clave = tuple(escala)
+    compilada = _ESCALAS_COMPILADAS.get(clave)
+    if compilada is None:
+        compilada = _ESCALAS_COMPILADAS[clave] = EscalaCompilada(clave)
+    return compilada
+
+
+def calcular_cuota_array(bases, escala):
+    """
+    Calcula la cuota de una escala progresiva para un array de bases
+
+    Args:
+        bases: array-like de bases liquidables
+        escala: lista de tuplas (límite, tipo) o EscalaCompilada
+
+    Returns:
+        np.ndarray con la cuota de cada base
+    """
+    return compilar_escala(escala).cuota_array(bases)
+
+
+def combinar_escalas(*escalas):
+    """
+    Devuelve la suma de varias escalas como EscalaCombinada, construyéndola
+    solo la primera vez
+
+    Args:
+        *escalas: listas de tuplas (límite, tipo) o EscalaCompilada
+
+    Returns:
+        EscalaCombinada
+    """
+    clave = tuple(compilar_escala(escala) for escala in escalas)
+    combinada = _ESCALAS_COMBINADAS.get(clave)
+    if combinada is None:
+        combinada = _ESCALAS_COMBINADAS[clave] = EscalaCombinada(*clave)
+    return combinada
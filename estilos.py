@@ -0,0 +1,255 @@
+"""
+Hoja de estilos de la aplicación (diseño oscuro minimalista)
+Streamlit vuelve a ejecutar app.py entero en cada interacción, pero los
+módulos importados se quedan en memoria: la hoja se compacta una sola vez por
+proceso y cada rerun solo envía HOJA_ESTILOS ya preparada.
+"""
+
+import re
+
+
+CSS = """
+@import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
+
+:root {
+    --bg-dark: #1a1d29;
+    --bg-medium: #252837;
+    --text-light: #e2e8f0;
+    --text-medium: #94a3b8;
+    --accent: #3b82f6;
+    --accent-hover: #2563eb;
+}
+
+.main {
+    font-family: 'Inter', sans-serif;
+    background: var(--bg-dark);
+    color: var(--text-light);
+}
+
+.block-container {
+    padding: 2rem;
+    max-width: 1400px;
+    background: var(--bg-dark);
+}
+
+.hero-header {
+    background: var(--bg-medium);
+    padding: 3rem 2rem;
+    border-radius: 12px;
+    text-align: center;
+    color: var(--text-light);
+    margin-bottom: 2rem;
+    border: 1px solid rgba(59, 130, 246, 0.2);
+}
+
+.hero-header h1 {
+    font-size: 2.5rem;
+    font-weight: 700;
+    margin-bottom: 0.5rem;
+    color: var(--text-light);
+}
+
+.hero-header p {
+    font-size: 1.1rem;
+    color: var(--text-medium);
+}
+
+[data-testid="stExpander"] {
+    background: transparent !important;
+    border: 1px solid rgba(59, 130, 246, 0.3);
+    border-radius: 8px;
+    margin-bottom: 1rem;
+}
+
+.streamlit-expanderHeader {
+    background: var(--bg-medium) !important;
+    color: var(--text-light) !important;
+    border-radius: 8px;
+    font-weight: 600;
+    padding: 1rem;
+}
+
+.streamlit-expanderHeader:hover {
+    background: rgba(59, 130, 246, 0.1) !important;
+}
+
+.streamlit-expanderContent {
+    background: var(--bg-medium);
+    padding: 1.5rem;
+    border-radius: 0 0 8px 8px;
+}
+
+.seccion-titulo {
+    font-size: 1.1rem;
+    font-weight: 600;
+    color: var(--text-light);
+    margin: 1.5rem 0 1rem 0;
+    padding-bottom: 0.5rem;
+    border-bottom: 1px solid rgba(59, 130, 246, 0.3);
+}
+
+.resultado-hero {
+    background: var(--bg-medium);
+    padding: 3rem;
+    border-radius: 12px;
+    text-align: center;
+    color: var(--text-light);
+    margin: 2rem 0;
+    border: 1px solid rgba(59, 130, 246, 0.3);
+}
+
+.resultado-monto {
+    font-size: 4rem;
+    font-weight: 800;
+    margin: 1rem 0;
+    color: var(--text-light);
+}
+
+.resultado-badge {
+    display: inline-block;
+    padding: 0.75rem 2rem;
+    background: var(--accent);
+    border-radius: 8px;
+    font-size: 1.1rem;
+    font-weight: 600;
+    color: white;
+}
+
+.stButton > button {
+    background: var(--accent);
+    color: white;
+    border: none;
+    padding: 0.875rem 2rem;
+    border-radius: 8px;
+    font-weight: 600;
+    font-size: 1rem;
+    transition: all 0.2s ease;
+    width: 100%;
+}
+
+.stButton > button:hover {
+    background: var(--accent-hover);
+    transform: translateY(-1px);
+}
+
+.stTabs [data-baseweb="tab-list"] {
+    gap: 0.5rem;
+    background: transparent;
+    border-bottom: 1px solid rgba(59, 130, 246, 0.3);
+}
+
+.stTabs [data-baseweb="tab"] {
+    padding: 0.875rem 1.5rem;
+    border-radius: 8px 8px 0 0;
+    font-weight: 500;
+    color: var(--text-medium);
+    background: transparent;
+}
+
+.stTabs [aria-selected="true"] {
+    background: var(--accent);
+    color: white;
+}
+
+[data-testid="stMetricValue"] {
+    font-size: 1.75rem;
+    font-weight: 700;
+    color: var(--text-light);
+}
+
+[data-testid="stMetricLabel"] {
+    font-size: 0.875rem;
+    color: var(--text-medium);
+}
+
+[data-testid="metric-container"] {
+    background: var(--bg-medium);
+    padding: 1rem;
+    border-radius: 8px;
+    border: 1px solid rgba(59, 130, 246, 0.2);
+}
+
+.progress-container {
+    display: flex;
+    justify-content: space-between;
+    margin: 2rem 0;
+    padding: 1.5rem;
+    background: var(--bg-medium);
+    border-radius: 12px;
+    border: 1px solid rgba(59, 130, 246, 0.2);
+}
+
+.progress-step {
+    flex: 1;
+    text-align: center;
+    color: var(--text-medium);
+    font-weight: 500;
+    position: relative;
+}
+
+section[data-testid="stSidebar"] {
+    background: var(--bg-medium);
+    border-right: 1px solid rgba(59, 130, 246, 0.2);
+}
+
+section[data-testid="stSidebar"] .stMarkdown {
+    color: var(--text-light);
+}
+
+.stNumberInput input,
+.stTextInput input,
+.stTextArea textarea,
+.stSelectbox select {
+    background: var(--bg-dark) !important;
+    border: 1px solid rgba(59, 130, 246, 0.3) !important;
+    border-radius: 8px !important;
+    color: var(--text-light) !important;
+    padding: 0.625rem !important;
+}
+
+.stNumberInput input:focus,
+.stTextInput input:focus,
+.stSelectbox select:focus {
+    border-color: var(--accent) !important;
+    box-shadow: 0 0 0 2px rgba(59, 130, 246, 0.2) !important;
+}
+
+label {
+    color: var(--text-light) !important;
+    font-weight: 500 !important;
+}
+
+.stAlert {
+    background: var(--bg-medium) !important;
+    border-radius: 8px !important;
+    border-left: 3px solid var(--accent) !important;
+    color: var(--text-light) !important;
+    padding: 1rem !important;
+}
+
+.stCheckbox label, .stRadio label {
+    color: var(--text-light) !important;
+}
+
+#MainMenu {visibility: hidden;}
+footer {visibility: hidden;}
+header {visibility: hidden;}
+
+p, span, div {
+    color: var(--text-light);
+}
+
+.caption, small {
+    color: var(--text-medium) !important;
+}
+"""
+
+
+def _compactar(css):
+    """Quita comentarios, sangrías y líneas vacías sin tocar las reglas"""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    return '\n'.join(linea.strip() for linea in css.splitlines() if linea.strip())
+
+
+# Bloque listo para st.markdown(..., unsafe_allow_html=True)
+HOJA_ESTILOS = f"<style>\n{_compactar(CSS)}\n</style>"
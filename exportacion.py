@@ -0,0 +1,336 @@
+"""
+Exportación columnar de resultados (Arrow IPC y Parquet)
+Cada cifra del resultado anidado de calcular_renta_total es una columna con
+su ruta como nombre ('deducciones.cuidado_menores',
+'cuotas_integras.autonomica_ahorro'...), de modo que una campaña entera se
+puede consultar directamente desde las herramientas de análisis. Quedan
+fuera las listas (errores, avisos, desgloses por tramos) y los datos de
+entrada, que ya están en el fichero de registros.
+
+Con el motor vectorial las columnas son los arrays de NumPy del lote, que
+pasan a Arrow sin crear un objeto de Python por fila; cada bloque es un lote
+de registros (Arrow) o un grupo de filas (Parquet). pyarrow solo se importa
+al escribir.
+
+Uso:
+    python -m irpf batch campana.csv resultados.parquet --bloque 100000
+    python -m irpf batch campana.csv resultados.arrow
+"""
+
+import numpy as np
+
+from contribuyente import VALORES_POR_DEFECTO, vista_desde_valores
+from instrumentacion import medir_etapas
+from lotes import NOMBRES_CAMPOS, convertir_bloque, registros_de_columnas
+
+
+# Columnas de identificación de cada fila (como en COLUMNAS_SALIDA)
+COLUMNAS_IDENTIFICACION = ('registro', 'ejercicio', 'comunidad')
+
+# Cifras del resultado, en el orden de sus secciones; todas son float64
+# salvo 'cuota_diferencial.resultado' ('A PAGAR' / 'A DEVOLVER')
+COLUMNAS_PLANAS = (
+    'rendimiento_trabajo.bruto',
+    'rendimiento_trabajo.reduccion',
+    'rendimiento_trabajo.neto',
+    'rendimiento_actividades.ingresos',
+    'rendimiento_actividades.gastos',
+    'rendimiento_actividades.neto',
+    'rendimiento_capital_inmobiliario.ingresos',
+    'rendimiento_capital_inmobiliario.gastos_detallados.ibi',
+    'rendimiento_capital_inmobiliario.gastos_detallados.comunidad',
+    'rendimiento_capital_inmobiliario.gastos_detallados.seguro',
+    'rendimiento_capital_inmobiliario.gastos_detallados.reparaciones',
+    'rendimiento_capital_inmobiliario.gastos_detallados.intereses_hipoteca',
+    'rendimiento_capital_inmobiliario.gastos_detallados.amortizacion',
+    'rendimiento_capital_inmobiliario.gastos_detallados.otros',
+    'rendimiento_capital_inmobiliario.gastos_totales',
+    'rendimiento_capital_inmobiliario.neto_previo',
+    'rendimiento_capital_inmobiliario.reduccion_porcentaje',
+    'rendimiento_capital_inmobiliario.reduccion_importe',
+    'rendimiento_capital_inmobiliario.neto_final',
+    'imputacion_rentas.valor_catastral',
+    'imputacion_rentas.porcentaje',
+    'imputacion_rentas.importe',
+    'rendimiento_capital_mobiliario.dividendos',
+    'rendimiento_capital_mobiliario.intereses',
+    'rendimiento_capital_mobiliario.total',
+    'ganancias_patrimoniales.ganancias_brutas',
+    'ganancias_patrimoniales.perdidas_ejercicio',
+    'ganancias_patrimoniales.ganancias_netas',
+    'ganancias_patrimoniales.perdidas_anos_anteriores',
+    'ganancias_patrimoniales.ganancias_final',
+    'ganancias_patrimoniales.perdidas_pendientes_compensar',
+    'reducciones_base.plan_pensiones',
+    'reducciones_base.mutualidad',
+    'reducciones_base.pensiones_compensatorias',
+    'reducciones_base.total',
+    'minimo_personal_familiar.contribuyente',
+    'minimo_personal_familiar.descendientes',
+    'minimo_personal_familiar.total_hijos',
+    'minimo_personal_familiar.ascendientes',
+    'minimo_personal_familiar.total',
+    'cuotas_integras.estatal_general',
+    'cuotas_integras.estatal_ahorro',
+    'cuotas_integras.estatal_total',
+    'cuotas_integras.autonomica_general',
+    'cuotas_integras.autonomica_ahorro',
+    'cuotas_integras.autonomica_total',
+    'cuotas_integras.total',
+    'deducciones.vivienda_habitual',
+    'deducciones.donaciones',
+    'deducciones.maternidad',
+    'deducciones.familia_numerosa_estatal',
+    'deducciones.nacimiento_adopcion',
+    'deducciones.familia_numerosa_autonomica',
+    'deducciones.alquiler_vivienda_habitual',
+    'deducciones.cuidado_menores',
+    'deducciones.discapacidad_a_cargo',
+    'deducciones.otras_autonomicas',
+    'deducciones.total_estatal',
+    'deducciones.total_autonomica',
+    'cuotas_liquidas.estatal',
+    'cuotas_liquidas.autonomica',
+    'cuotas_liquidas.total',
+    'cuota_diferencial.cuota_liquida',
+    'cuota_diferencial.retenciones',
+    'cuota_diferencial.pagos_fraccionados',
+    'cuota_diferencial.total_pagado',
+    'cuota_diferencial.diferencial',
+    'cuota_diferencial.resultado',
+    'cuota_diferencial.importe',
+    'resumen.base_imponible_general',
+    'resumen.base_imponible_ahorro',
+    'resumen.base_liquidable_general',
+    'resumen.base_gravamen_general',
+    'resumen.tipo_medio',
+    'resumen.tipo_marginal',
+    'resumen.tipo_marginal_ahorro'
+)
+
+# Valores posibles de 'cuota_diferencial.resultado' (código = diferencial > 0)
+RESULTADOS = ('A DEVOLVER', 'A PAGAR')
+
+_RESULTADO = 'cuota_diferencial.resultado'
+_NUMERICAS = tuple(columna for columna in COLUMNAS_PLANAS if columna != _RESULTADO)
+
+# Ruta de cada columna numérica: (sección, claves dentro de la sección)
+_RUTAS = tuple((columna.split('.')[0], tuple(columna.split('.')[1:])) for columna in _NUMERICAS)
+
+
+def aplanar_resultado(resultado):
+    """
+    Cifras de un resultado de calcular_renta_total en el orden de las columnas numéricas
+
+    Las secciones que el resultado no tiene (imputacion_rentas sin segunda
+    vivienda) valen 0.
+
+    Args:
+        resultado: dict (o ResultadoRenta) de calcular_renta_total
+
+    Returns:
+        list de float
+    """
+    valores = []
+    for seccion, claves in _RUTAS:
+        if seccion not in resultado:
+            valores.append(0.0)
+            continue
+        valor = resultado[seccion]
+        for clave in claves:
+            valor = valor[clave]
+        valores.append(valor)
+    return valores
+
+
+def calcular_columnas(inicio, bloque, motor='vectorial', etapas=False):
+    """
+    Calcula un bloque de registros en columnas planas (se ejecuta en los procesos del pool)
+
+    Args:
+        inicio (int): número de registro del primer elemento del bloque
+        bloque (list): registros leídos (dicts, o str con un error de lectura)
+        motor (str): 'vectorial' (calcular_renta_batch) o 'escalar'
+        etapas (bool): si es True, mide el tiempo de cada etapa del cálculo
+
+    Returns:
+        tuple: (columnas, errores, etapas) como procesar_bloque, con columnas
+               como dict {nombre: valores} de COLUMNAS_IDENTIFICACION y COLUMNAS_PLANAS
+    """
+    if etapas:
+        with medir_etapas() as medidor:
+            columnas, errores, _ = calcular_columnas(inicio, bloque, motor)
+        return columnas, errores, medidor.exportar()
+
+    identificadores, registros, errores = convertir_bloque(inicio, bloque)
+    entrada = dict(zip(NOMBRES_CAMPOS, zip(*registros))) if registros else {}
+    return columnas_planas(identificadores, entrada, motor), errores, None
+
+
+def columnas_planas(identificadores, entrada, motor='vectorial', comunidades=None):
+    """
+    Calcula registros que ya están en columnas y devuelve sus columnas planas
+
+    Args:
+        identificadores: valor de la columna 'registro' de cada fila (lista,
+                         o array de NumPy de enteros)
+        entrada (dict): campo -> columna, como las de calcular_renta_batch
+        motor (str): 'vectorial' o 'escalar'
+        comunidades: nombre de la comunidad de cada fila (por defecto, la
+                     columna 'comunidad'; hace falta si esta trae índices)
+
+    Returns:
+        dict {nombre: valores} de COLUMNAS_IDENTIFICACION y COLUMNAS_PLANAS
+
+    Raises:
+        ValueError: con un motor en céntimos, que no calcula el desglose por apartados
+    """
+    if motor not in ('vectorial', 'escalar'):
+        raise ValueError(f"Las columnas planas se calculan con el motor vectorial o el escalar, no {motor}")
+    n = len(identificadores)
+    if comunidades is None:
+        comunidades = entrada.get('comunidad', [VALORES_POR_DEFECTO['comunidad']] * n)
+    if motor == 'escalar':
+        cifras = _cifras_escalares(registros_de_columnas(entrada, n, comunidades))
+    else:
+        cifras = _cifras_vectoriales(entrada, n)
+
+    columnas = {
+        'registro': identificadores,
+        'ejercicio': np.asarray(entrada.get('ejercicio', [VALORES_POR_DEFECTO['ejercicio']] * n), dtype=np.int16),
+        'comunidad': comunidades if isinstance(comunidades, np.ndarray) else list(comunidades)
+    }
+    for nombre in COLUMNAS_PLANAS:
+        if nombre == _RESULTADO:
+            columnas[nombre] = (cifras['cuota_diferencial.diferencial'] > 0).astype(np.int8)
+        else:
+            columnas[nombre] = cifras[nombre]
+    return columnas
+
+
+def _cifras_escalares(registros):
+    from renta import calcular_renta_total
+
+    filas = [
+        aplanar_resultado(calcular_renta_total(vista_desde_valores(registro), detalle=False))
+        for registro in registros
+    ]
+    matriz = np.array(filas, dtype=np.float64).reshape(len(filas), len(_NUMERICAS))
+    # Una columna contigua por cifra, como las del motor vectorial
+    return dict(zip(_NUMERICAS, np.ascontiguousarray(matriz.T)))
+
+
+def _cifras_vectoriales(entrada, n):
+    if not n:
+        return {nombre: np.zeros(0) for nombre in _NUMERICAS}
+    from renta_vectorizada import calcular_renta_batch
+
+    return calcular_renta_batch(entrada, desglose=True)
+
+
+# ===== Arrow =====
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise RuntimeError("La exportación a Arrow/Parquet necesita pyarrow (pip install pyarrow)") from None
+    return pyarrow
+
+
+def lote_arrow(columnas, esquema=None):
+    """
+    Convierte las columnas de calcular_columnas en un RecordBatch de Arrow
+
+    Las cifras pasan a Arrow sin copiar ni crear objetos por fila; la
+    columna 'registro' es int64 si todos los identificadores son números de
+    registro y texto si hay algún 'id' propio.
+
+    Args:
+        columnas (dict): columnas de calcular_columnas
+        esquema: pyarrow.Schema al que ajustarse (el de los lotes anteriores)
+
+    Returns:
+        pyarrow.RecordBatch
+
+    Raises:
+        ValueError: si la columna 'registro' no encaja con `esquema`
+    """
+    pa = _pyarrow()
+
+    identificadores = columnas['registro']
+    if esquema is not None:
+        tipo_registro = esquema.field('registro').type
+    elif isinstance(identificadores, np.ndarray) and identificadores.dtype.kind in 'iu':
+        tipo_registro = pa.int64()
+    elif all(type(identificador) is int for identificador in identificadores):
+        tipo_registro = pa.int64()
+    else:
+        tipo_registro = pa.string()
+    if tipo_registro == pa.string():
+        identificadores = [str(identificador) for identificador in identificadores]
+    try:
+        registro = pa.array(identificadores, type=tipo_registro)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+        raise ValueError(
+            "Los identificadores de registro cambian de tipo entre bloques: "
+            "usa un 'id' en todos los registros o en ninguno"
+        ) from None
+
+    arrays = [
+        registro,
+        pa.array(columnas['ejercicio'], type=pa.int16()),
+        pa.array(columnas['comunidad'], type=pa.string())
+    ]
+    nombres = list(COLUMNAS_IDENTIFICACION)
+    for nombre in COLUMNAS_PLANAS:
+        valores = columnas[nombre]
+        if nombre == _RESULTADO:
+            arrays.append(pa.DictionaryArray.from_arrays(valores, pa.array(RESULTADOS)))
+        else:
+            arrays.append(pa.array(valores, type=pa.float64()))
+        nombres.append(nombre)
+    return pa.RecordBatch.from_arrays(arrays, names=nombres)
+
+
+class EscritorColumnar:
+    """
+    Escribe bloques de columnas en Arrow IPC (un lote de registros por
+    bloque) o Parquet (un grupo de filas por bloque)
+
+    El esquema se fija con el primer bloque. Hay que llamar a cerrar() al
+    terminar: ambos formatos escriben su pie al final.
+
+    Args:
+        fichero: fichero binario abierto para escribir
+        formato (str): 'arrow' o 'parquet'
+    """
+
+    def __init__(self, fichero, formato):
+        self.fichero = fichero
+        self.formato = formato
+        self._escritor = None
+        self._esquema = None
+
+    def escribir(self, columnas):
+        """Escribe las columnas de un bloque y devuelve su número de filas"""
+        lote = lote_arrow(columnas, self._esquema)
+        if self._escritor is None:
+            self._abrir(lote.schema)
+        self._escritor.write_batch(lote)
+        return lote.num_rows
+
+    def cerrar(self):
+        if self._escritor is None:
+            # Sin ningún bloque: fichero válido con el esquema y sin filas
+            self._abrir(lote_arrow(calcular_columnas(1, [])[0]).schema)
+        self._escritor.close()
+
+    def _abrir(self, esquema):
+        pa = _pyarrow()
+        self._esquema = esquema
+        if self.formato == 'parquet':
+            import pyarrow.parquet as pq
+            self._escritor = pq.ParquetWriter(self.fichero, esquema)
+        else:
+            self._escritor = pa.ipc.new_file(self.fichero, esquema)
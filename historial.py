@@ -0,0 +1,298 @@
+"""
+Historial de cálculos
+Cada cálculo se guarda de forma compacta: los datos normalizados (solo los
+campos distintos de su valor por defecto), las cifras clave del resultado y
+una huella de los datos que sirve para no repetir entradas. El historial
+tiene una capacidad máxima y expulsa las entradas más antiguas; si se le da
+una ruta, además las guarda en un fichero SQLite local indexado por fecha y
+comunidad, de modo que la página de historial solo lee lo que muestra.
+
+Varias sesiones pueden usar el mismo fichero: cada entrada lleva la sesión
+que la anotó y cada historial solo ve (y expulsa) las suyas. Las entradas de
+sesión caducan pasado CADUCIDAD_SESIONES; las del historial compartido
+(sesión SESION_COMPARTIDA) se conservan.
+
+La variable de entorno IRPF_HISTORIAL indica el fichero SQLite de la
+aplicación (sin ella, el historial solo vive en la sesión) e
+IRPF_HISTORIAL_CAPACIDAD, su capacidad. Con IRPF_HISTORIAL_COMPARTIDO=1
+todas las sesiones comparten un único historial, que sobrevive a los
+reinicios: solo para instalaciones de un único usuario.
+"""
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+
+# Entradas que se conservan por defecto
+CAPACIDAD_HISTORIAL = 50
+
+# Sesión de las entradas del historial compartido por todas las sesiones
+SESION_COMPARTIDA = ''
+
+# Antigüedad a partir de la cual se borran las entradas de una sesión (que
+# ya habrá terminado) del fichero
+CADUCIDAD_SESIONES = timedelta(days=1)
+
+# Cifras clave de cada entrada: nombre -> (sección, clave) del resultado
+CIFRAS = {
+    'resultado': ('cuota_diferencial', 'resultado'),
+    'importe': ('cuota_diferencial', 'importe'),
+    'cuota_diferencial': ('cuota_diferencial', 'diferencial'),
+    'cuota_liquida': ('cuota_diferencial', 'cuota_liquida'),
+    'total_pagado': ('cuota_diferencial', 'total_pagado'),
+    'base_imponible_general': ('resumen', 'base_imponible_general'),
+    'base_imponible_ahorro': ('resumen', 'base_imponible_ahorro'),
+    'tipo_medio': ('resumen', 'tipo_medio'),
+    'tipo_marginal': ('resumen', 'tipo_marginal')
+}
+
+# Columnas de la tabla SQLite, en el orden de EntradaHistorial.__slots__
+_COLUMNAS = ('huella', 'fecha', 'ejercicio', 'comunidad', 'datos') + tuple(CIFRAS)
+
+_ESQUEMA = f"""
+CREATE TABLE IF NOT EXISTS historial (
+    sesion TEXT NOT NULL,
+    huella TEXT NOT NULL,
+    fecha TEXT NOT NULL,
+    ejercicio INTEGER NOT NULL,
+    comunidad TEXT,
+    datos TEXT NOT NULL,
+    resultado TEXT NOT NULL,
+    {', '.join(f'{cifra} REAL NOT NULL' for cifra in tuple(CIFRAS)[1:])},
+    PRIMARY KEY (sesion, huella)
+);
+CREATE INDEX IF NOT EXISTS historial_sesion_fecha ON historial (sesion, fecha);
+CREATE INDEX IF NOT EXISTS historial_sesion_comunidad_fecha ON historial (sesion, comunidad, fecha);
+"""
+
+# Los ficheros anteriores a las sesiones tienen una tabla sin la columna
+# 'sesion': sus entradas pasan al historial compartido, que es lo que eran
+_MIGRACION = f"""
+DROP INDEX IF EXISTS historial_fecha;
+DROP INDEX IF EXISTS historial_comunidad_fecha;
+ALTER TABLE historial RENAME TO historial_anterior;
+{_ESQUEMA}
+INSERT INTO historial (sesion, {', '.join(_COLUMNAS)})
+    SELECT '{SESION_COMPARTIDA}', {', '.join(_COLUMNAS)} FROM historial_anterior;
+DROP TABLE historial_anterior;
+"""
+
+
+class EntradaHistorial:
+    """
+    Un cálculo del historial
+
+    Atributos:
+        huella (str): huella de los datos normalizados (identifica la entrada)
+        fecha (datetime): último momento en que se calculó
+        ejercicio (int), comunidad (str): del registro calculado
+        datos (dict): campos del registro distintos de su valor por defecto
+        resultado ... tipo_marginal: cifras clave del resultado (ver CIFRAS)
+    """
+
+    __slots__ = _COLUMNAS
+
+    def __init__(self, *valores):
+        for atributo, valor in zip(_COLUMNAS, valores):
+            setattr(self, atributo, valor)
+
+    def __repr__(self):
+        return (
+            f"EntradaHistorial({self.fecha:%Y-%m-%d %H:%M}, {self.comunidad!r}, "
+            f"{self.resultado}: {self.importe:,.2f})"
+        )
+
+    def _fila(self):
+        valores = [getattr(self, columna) for columna in _COLUMNAS]
+        valores[1] = self.fecha.isoformat(timespec='microseconds')
+        valores[4] = json.dumps(self.datos, ensure_ascii=False, sort_keys=True)
+        return valores
+
+    @classmethod
+    def _desde_fila(cls, fila):
+        valores = list(fila)
+        valores[1] = datetime.fromisoformat(valores[1])
+        valores[4] = json.loads(valores[4])
+        return cls(*valores)
+
+
+def crear_entrada(datos, resultado, fecha=None):
+    """
+    Construye la entrada compacta de un cálculo
+
+    Args:
+        datos: dict del formulario o DatosContribuyente
+        resultado: dict (o ResultadoRenta) de calcular_renta_total para esos datos
+        fecha (datetime): momento del cálculo (por defecto, ahora)
+
+    Returns:
+        EntradaHistorial
+    """
+    from contribuyente import CAMPOS, como_contribuyente
+
+    contribuyente = como_contribuyente(datos)
+    valores = contribuyente.como_tupla()
+    normalizados = {
+        nombre: valor for (nombre, _, defecto), valor in zip(CAMPOS, valores) if valor != defecto
+    }
+    huella = hashlib.sha256(repr(valores).encode('utf-8')).hexdigest()[:16]
+    cifras = [resultado[seccion][clave] for seccion, clave in CIFRAS.values()]
+    return EntradaHistorial(
+        huella, fecha or datetime.now(), contribuyente.ejercicio, contribuyente.comunidad, normalizados,
+        cifras[0], *(float(cifra) for cifra in cifras[1:])
+    )
+
+
+class HistorialCalculos:
+    """
+    Historial acotado de cálculos, opcionalmente persistido en SQLite
+
+    Volver a calcular los mismos datos no añade otra entrada: la existente
+    pasa a ser la más reciente. Al superar la capacidad se expulsa la
+    entrada más antigua. Con `ruta`, cada anotación se escribe en el
+    fichero y las consultas se hacen sobre él; varias sesiones pueden
+    compartir el fichero, y cada una solo ve sus entradas. Sin ruta, todo
+    queda en memoria.
+
+    Args:
+        capacidad (int): número máximo de entradas (de la sesión)
+        ruta (str): fichero SQLite (None = solo en memoria)
+        sesion (str): identificador de la sesión dueña de las entradas en
+                      el fichero (SESION_COMPARTIDA = el historial compartido)
+    """
+
+    def __init__(self, capacidad=CAPACIDAD_HISTORIAL, ruta=None, sesion=SESION_COMPARTIDA):
+        if capacidad < 1:
+            raise ValueError("La capacidad del historial debe ser >= 1")
+        self.capacidad = capacidad
+        self.ruta = ruta
+        self.sesion = sesion
+        self._entradas = OrderedDict()
+        if ruta is not None:
+            with self._conexion() as conexion:
+                columnas = {fila[1] for fila in conexion.execute("PRAGMA table_info(historial)")}
+                conexion.executescript(_MIGRACION if columnas and 'sesion' not in columnas else _ESQUEMA)
+
+    @classmethod
+    def desde_entorno(cls, sesion):
+        """
+        Historial configurado con IRPF_HISTORIAL, IRPF_HISTORIAL_CAPACIDAD e IRPF_HISTORIAL_COMPARTIDO
+
+        Args:
+            sesion (str): identificador de la sesión (no se usa si el
+                          historial es compartido)
+        """
+        capacidad = int(os.environ.get('IRPF_HISTORIAL_CAPACIDAD') or CAPACIDAD_HISTORIAL)
+        if os.environ.get('IRPF_HISTORIAL_COMPARTIDO', '').strip().lower() in ('1', 'true', 'si', 'sí'):
+            sesion = SESION_COMPARTIDA
+        return cls(capacidad, os.environ.get('IRPF_HISTORIAL') or None, sesion)
+
+    def __len__(self):
+        if self.ruta is None:
+            return len(self._entradas)
+        with self._conexion() as conexion:
+            return conexion.execute(
+                "SELECT COUNT(*) FROM historial WHERE sesion = ?", (self.sesion,)
+            ).fetchone()[0]
+
+    def anotar(self, datos, resultado, fecha=None):
+        """
+        Añade un cálculo (o renueva el de los mismos datos)
+
+        Args:
+            datos: dict del formulario o DatosContribuyente
+            resultado: resultado de calcular_renta_total para esos datos
+            fecha (datetime): momento del cálculo (por defecto, ahora)
+
+        Returns:
+            EntradaHistorial anotada
+        """
+        entrada = crear_entrada(datos, resultado, fecha)
+        if self.ruta is None:
+            self._entradas.pop(entrada.huella, None)
+            self._entradas[entrada.huella] = entrada
+            while len(self._entradas) > self.capacidad:
+                self._entradas.popitem(last=False)
+            return entrada
+
+        with self._conexion() as conexion:
+            conexion.execute(
+                f"INSERT OR REPLACE INTO historial (sesion, {', '.join(_COLUMNAS)}) "
+                f"VALUES ({', '.join('?' * (len(_COLUMNAS) + 1))})",
+                [self.sesion, *entrada._fila()]
+            )
+            # Expulsa todo lo de la sesión que no esté entre las `capacidad` más recientes
+            conexion.execute(
+                "DELETE FROM historial WHERE sesion = ? AND huella NOT IN ("
+                "SELECT huella FROM historial WHERE sesion = ? ORDER BY fecha DESC LIMIT ?)",
+                (self.sesion, self.sesion, self.capacidad)
+            )
+            # y las entradas de sesiones que ya han caducado
+            caducadas = (datetime.now() - CADUCIDAD_SESIONES).isoformat(timespec='microseconds')
+            conexion.execute(
+                "DELETE FROM historial WHERE sesion != ? AND fecha < ?", (SESION_COMPARTIDA, caducadas)
+            )
+        return entrada
+
+    def entradas(self, comunidad=None, limite=None):
+        """
+        Entradas de la más reciente a la más antigua
+
+        Args:
+            comunidad (str): solo las de esa comunidad (None = todas)
+            limite (int): como mucho estas entradas (None = todas)
+
+        Returns:
+            list de EntradaHistorial
+        """
+        if self.ruta is None:
+            entradas = [
+                entrada for entrada in reversed(self._entradas.values())
+                if comunidad is None or entrada.comunidad == comunidad
+            ]
+            return entradas[:limite]
+
+        consulta = f"SELECT {', '.join(_COLUMNAS)} FROM historial WHERE sesion = ?"
+        parametros = [self.sesion]
+        if comunidad is not None:
+            consulta += " AND comunidad = ?"
+            parametros.append(comunidad)
+        consulta += " ORDER BY fecha DESC LIMIT ?"
+        parametros.append(-1 if limite is None else limite)
+        with self._conexion() as conexion:
+            return [EntradaHistorial._desde_fila(fila) for fila in conexion.execute(consulta, parametros)]
+
+    def comunidades(self):
+        """Comunidades con alguna entrada, ordenadas alfabéticamente"""
+        if self.ruta is None:
+            return sorted({entrada.comunidad for entrada in self._entradas.values() if entrada.comunidad})
+        with self._conexion() as conexion:
+            return [fila[0] for fila in conexion.execute(
+                "SELECT DISTINCT comunidad FROM historial WHERE sesion = ? AND comunidad IS NOT NULL "
+                "ORDER BY comunidad",
+                (self.sesion,)
+            )]
+
+    def limpiar(self):
+        """Borra todas las entradas (también del fichero, solo las de la sesión)"""
+        self._entradas.clear()
+        if self.ruta is not None:
+            with self._conexion() as conexion:
+                conexion.execute("DELETE FROM historial WHERE sesion = ?", (self.sesion,))
+
+    @contextmanager
+    def _conexion(self):
+        # Una conexión por operación: Streamlit ejecuta cada sesión en su hilo
+        # y sqlite3 no comparte conexiones entre hilos. La transacción se
+        # confirma (o se deshace si hay error) al salir del bloque.
+        import sqlite3
+        conexion = sqlite3.connect(self.ruta, timeout=5.0)
+        try:
+            with conexion:
+                yield conexion
+        finally:
+            conexion.close()
@@ -0,0 +1,328 @@
+"""
+Generación masiva de informes
+Calcula un fichero de registros por bloques (como `irpf batch`), rellena con
+cada fila la plantilla HTML del informe, compilada una sola vez por proceso,
+y va escribiendo los documentos en un archivo ZIP a medida que salen: en
+memoria solo están los bloques en vuelo, nunca el archivo entero. Los
+bloques se pueden repartir entre un pool de procesos.
+
+La misma plantilla genera el informe que se descarga desde la aplicación.
+
+Uso:
+    python -m irpf informes campana.csv informes.zip -j 8
+    python -m irpf informes campana.jsonl - > informes.zip
+    python -m irpf informes campana.irpfbin informes.zip -j 8
+"""
+
+import json
+import re
+import sys
+import time
+import zipfile
+from contextlib import nullcontext
+from datetime import datetime
+from string import Formatter
+
+from lotes import (
+    COLUMNAS_SALIDA, ESTANDAR, FORMATO_BINARIO, FORMATOS, EstadisticasLote, InformeProgreso, abrir_entrada, calcular_filas,
+    convertir_bloque, detectar_formato, en_bloques, leer_registros, repartir_bloques
+)
+
+
+# Plantilla del informe (sintaxis de str.format): los campos son las columnas
+# de COLUMNAS_SALIDA más 'anio', 'resultado' e 'importe' (ver valores_fila)
+PLANTILLA_INFORME = """
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        <style>
+            body {{ font-family: 'Inter', Arial, sans-serif; margin: 40px; background: #1a1d29; color: #e2e8f0; }}
+            .header {{ background: #252837; color: #e2e8f0; padding: 40px; text-align: center; border-radius: 12px; }}
+            .resultado {{ font-size: 52px; font-weight: 800; margin: 20px 0; }}
+            table {{ width: 100%; border-collapse: collapse; margin: 20px 0; background: #252837; }}
+            th, td {{ border-bottom: 1px solid rgba(59, 130, 246, 0.3); padding: 16px; color: #e2e8f0; }}
+            th {{ background-color: #3b82f6; color: white; }}
+        </style>
+    </head>
+    <body>
+        <div class="header">
+            <h1>💼 TaxCalc Pro - Informe {anio}</h1>
+            <div class="resultado">{resultado}: {importe:,.2f} €</div>
+        </div>
+        <table>
+            <tr><th>Concepto</th><th>Importe</th></tr>
+            <tr><td>Base Imponible</td><td>{base_imponible_general:,.2f} €</td></tr>
+            <tr><td>Cuota Líquida</td><td>{cuota_liquida_total:,.2f} €</td></tr>
+            <tr><td>Retenciones</td><td>{total_pagado:,.2f} €</td></tr>
+            <tr><td><b>RESULTADO</b></td><td><b>{importe:,.2f} €</b></td></tr>
+        </table>
+    </body>
+    </html>
+    """
+
+COMPRESIONES = {'deflate': zipfile.ZIP_DEFLATED, 'ninguna': zipfile.ZIP_STORED}
+
+_CARACTERES_NO_VALIDOS = re.compile(r'[^\w.-]+')
+
+
+class PlantillaCompilada:
+    """
+    Plantilla de texto analizada una sola vez
+
+    Se separa en los textos fijos y los campos (nombre, formato) que van
+    entre ellos, de modo que cada documento solo formatea sus valores y
+    une las piezas, sin volver a analizar la plantilla.
+
+    Args:
+        texto (str): plantilla con campos `{nombre}` o `{nombre:formato}`
+                     (las llaves literales van dobladas, como en str.format)
+
+    Raises:
+        ValueError: si algún campo no es un nombre simple
+    """
+
+    __slots__ = ('campos', '_piezas', '_final')
+
+    def __init__(self, texto):
+        piezas = []
+        pendiente = ''
+        for literal, campo, formato, conversion in Formatter().parse(texto):
+            pendiente += literal
+            if campo is None:
+                continue
+            if not campo.isidentifier() or conversion or '{' in formato:
+                raise ValueError(f"Campo de plantilla no admitido: {{{campo}}}")
+            piezas.append((pendiente, campo, formato))
+            pendiente = ''
+        self.campos = tuple(dict.fromkeys(campo for _, campo, _ in piezas))
+        self._piezas = tuple(piezas)
+        self._final = pendiente
+
+    def renderizar(self, valores):
+        """
+        Rellena la plantilla
+
+        Args:
+            valores (dict): valor de cada campo de la plantilla
+
+        Returns:
+            str
+        """
+        partes = []
+        for literal, campo, formato in self._piezas:
+            partes.append(literal)
+            partes.append(format(valores[campo], formato))
+        partes.append(self._final)
+        return ''.join(partes)
+
+
+# Se compila al importar el módulo: una vez por proceso del pool
+PLANTILLA = PlantillaCompilada(PLANTILLA_INFORME)
+
+
+def valores_fila(fila, anio):
+    """
+    Valores de la plantilla para una fila de resultados
+
+    Args:
+        fila (list): fila en el orden de COLUMNAS_SALIDA
+        anio (int): año que figura en la cabecera del informe
+
+    Returns:
+        dict
+    """
+    valores = dict(zip(COLUMNAS_SALIDA, fila))
+    diferencial = valores['cuota_diferencial']
+    valores['anio'] = anio
+    valores['resultado'] = 'A PAGAR' if diferencial > 0 else 'A DEVOLVER'
+    valores['importe'] = abs(diferencial)
+    return valores
+
+
+def informe_html(resultado, anio=None):
+    """
+    Informe HTML de un resultado completo de calcular_renta_total
+
+    Args:
+        resultado: dict (o ResultadoRenta) de calcular_renta_total
+        anio (int): año de la cabecera (por defecto, el actual)
+
+    Returns:
+        str
+    """
+    cuota_diferencial = resultado['cuota_diferencial']
+    return PLANTILLA.renderizar({
+        'anio': anio or datetime.now().year,
+        'resultado': cuota_diferencial['resultado'],
+        'importe': cuota_diferencial['importe'],
+        'base_imponible_general': resultado['resumen']['base_imponible_general'],
+        'cuota_liquida_total': resultado['cuotas_liquidas']['total'],
+        'total_pagado': cuota_diferencial['total_pagado']
+    })
+
+
+def nombre_documento(numero, identificador):
+    """
+    Nombre dentro del ZIP del informe de un registro
+
+    Empieza por el número de registro, así que es único aunque varios
+    registros tengan el mismo 'id' (o ids que solo se distinguen en
+    caracteres que no van en el nombre, o vacíos); el 'id' va detrás si el
+    registro lo trae.
+
+    Args:
+        numero (int): número del registro en la entrada
+        identificador: valor de la columna 'registro' ('id' o número)
+
+    Returns:
+        str, p. ej. 'informe_00000042_ES-123.html'
+    """
+    texto = _CARACTERES_NO_VALIDOS.sub('_', str(identificador))
+    if not texto or identificador == numero:
+        return f"informe_{numero:08d}.html"
+    return f"informe_{numero:08d}_{texto}.html"
+
+
+def renderizar_bloque(inicio, bloque, motor='vectorial', anio=None):
+    """
+    Calcula un bloque de registros y genera el informe de cada uno
+
+    Args:
+        inicio (int): número del primer registro del bloque
+        bloque (list): registros leídos (dict) o textos de error
+        motor (str): uno de lotes.MOTORES
+        anio (int): año de la cabecera de los informes (por defecto, el actual)
+
+    Returns:
+        tuple: (documentos, errores) con documentos como tuplas
+               (nombre, html en UTF-8) y errores como en procesar_bloque
+    """
+    numeros = []
+    identificadores, registros, errores = convertir_bloque(inicio, bloque, numeros)
+    filas = calcular_filas(identificadores, registros, motor)
+    return _documentos(numeros, filas, anio), errores
+
+
+def renderizar_tramo(inicio, tramo, motor='vectorial', anio=None):
+    """
+    Como renderizar_bloque, para un tramo (ruta, desde, hasta) de un fichero binario
+
+    Los registros del fichero binario ya se validaron al convertirlo: todos
+    tienen su informe y no hay errores.
+    """
+    from binario import procesar_tramo
+
+    filas, errores, _ = procesar_tramo(inicio, tramo, motor)
+    return _documentos(range(inicio, inicio + len(filas)), filas, anio), errores
+
+
+def _documentos(numeros, filas, anio):
+    anio = anio or datetime.now().year
+    renderizar = PLANTILLA.renderizar
+    return [
+        (nombre_documento(numero, fila[0]), renderizar(valores_fila(fila, anio)).encode('utf-8'))
+        for numero, fila in zip(numeros, filas)
+    ]
+
+
+def generar_informes(entrada, salida, formato_entrada, trabajadores=1, tamano_bloque=1000,
+                     motor='vectorial', compresion='deflate', errores=None, progreso=None):
+    """
+    Genera el informe de cada registro de `entrada` en un ZIP
+
+    Args:
+        entrada: fichero de texto abierto con los registros (la ruta, si
+                 el formato es el binario)
+        salida: fichero binario abierto para el ZIP (puede no admitir seek,
+                p. ej. una tubería)
+        formato_entrada (str): 'csv', 'jsonl' o 'binario'
+        trabajadores (int): número de procesos
+        tamano_bloque (int): registros por bloque enviado a cada proceso
+        motor (str): uno de lotes.MOTORES
+        compresion (str): clave de COMPRESIONES
+        errores: fichero opcional donde escribir los registros fallidos (JSONL)
+        progreso: función opcional llamada con las EstadisticasLote tras cada bloque
+
+    Returns:
+        EstadisticasLote
+    """
+    estadisticas = EstadisticasLote()
+    ahora = datetime.now()
+    fecha_zip = ahora.timetuple()[:6]
+    tipo = COMPRESIONES[compresion]
+    if formato_entrada == FORMATO_BINARIO:
+        # Los procesos reciben tramos (ruta, desde, hasta) y proyectan el fichero
+        import binario
+        bloques = binario.tramos(entrada, tamano_bloque)
+        renderizar = renderizar_tramo
+    else:
+        bloques = en_bloques(leer_registros(entrada, formato_entrada), tamano_bloque)
+        renderizar = renderizar_bloque
+
+    # zipfile solo avisa de los nombres repetidos, y al extraer el archivo
+    # un informe sustituiría a otro: se comprueba al escribir cada uno
+    nombres = set()
+    with zipfile.ZipFile(salida, 'w', compression=tipo) as archivo:
+        for documentos, fallidos in repartir_bloques(
+            renderizar, bloques, trabajadores, motor, ahora.year
+        ):
+            for nombre, contenido in documentos:
+                if nombre in nombres:
+                    raise ValueError(f"Informe repetido en el archivo: {nombre}")
+                nombres.add(nombre)
+                info = zipfile.ZipInfo(nombre, date_time=fecha_zip)
+                info.compress_type = tipo
+                archivo.writestr(info, contenido)
+            estadisticas.registros += len(documentos) + len(fallidos)
+            estadisticas.fallidos += len(fallidos)
+            if errores is not None:
+                for fallido in fallidos:
+                    errores.write(json.dumps(fallido, ensure_ascii=False) + '\n')
+            if progreso is not None:
+                progreso(estadisticas)
+
+    estadisticas.fin = time.perf_counter()
+    return estadisticas
+
+
+def ejecutar_informes(args):
+    """Comando `informes` de la línea de comandos"""
+    try:
+        return _ejecutar_informes(args)
+    except (OSError, ValueError) as error:
+        # Errores de uso (formatos, ficheros que no existen...): el mensaje, sin traza, como `irpf calc`
+        print(error, file=sys.stderr)
+        return 2
+
+
+def _ejecutar_informes(args):
+    formato_entrada = detectar_formato(args.entrada, args.formato_entrada)
+    if formato_entrada not in FORMATOS + (FORMATO_BINARIO,):
+        raise ValueError(f"Los informes se generan desde ficheros csv, jsonl o binarios, no {formato_entrada}")
+    desde_binario = formato_entrada == FORMATO_BINARIO
+    if desde_binario and args.entrada == ESTANDAR:
+        raise ValueError("La entrada binaria debe ser un fichero, no la entrada estándar")
+    progreso = InformeProgreso(args.progreso) if args.progreso > 0 else None
+
+    lectura = nullcontext(args.entrada) if desde_binario else abrir_entrada(args.entrada)
+    errores = open(args.errores, 'w', encoding='utf-8') if args.errores else None
+    salida = sys.stdout.buffer if args.salida == ESTANDAR else open(args.salida, 'wb')
+    try:
+        with lectura as entrada:
+            estadisticas = generar_informes(
+                entrada, salida, formato_entrada,
+                trabajadores=args.trabajadores,
+                tamano_bloque=args.bloque,
+                motor=args.motor,
+                compresion=args.compresion,
+                errores=errores,
+                progreso=progreso
+            )
+    finally:
+        if errores is not None:
+            errores.close()
+        if salida is not sys.stdout.buffer:
+            salida.close()
+
+    print(estadisticas.resumen().replace('registros', 'informes'), file=sys.stderr)
+    return 1 if estadisticas.fallidos else 0
@@ -0,0 +1,202 @@
+"""
+Medición de tiempos por etapa del cálculo
+Un MedidorEtapas activo en el contexto actual recibe el tiempo de cada PASO
+de calcular_renta_total (y de calcular_renta_batch) y de las funciones
+auxiliares principales, y los agrega en histogramas que se pueden volcar
+a JSON o en formato de texto de Prometheus. Sin medidor activo, cada
+etapa solo cuesta comprobar una variable local.
+
+Uso:
+    with medir_etapas() as medidor:
+        for datos in perfiles:
+            calcular_renta_total(datos)
+    print(medidor.resumen())
+"""
+
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+# Límites superiores de los cubos de los histogramas, en segundos
+LIMITES_HISTOGRAMA = (
+    1e-6, 2e-6, 5e-6,
+    1e-5, 2e-5, 5e-5,
+    1e-4, 2e-4, 5e-4,
+    1e-3, 2e-3, 5e-3,
+    1e-2, 2e-2, 5e-2,
+    0.1, 0.2, 0.5,
+    1.0, 2.0, 5.0
+)
+
+_MEDIDOR = ContextVar('medidor_etapas', default=None)
+
+# Devuelve el MedidorEtapas activo en el contexto actual, o None
+medidor_activo = _MEDIDOR.get
+
+
+class EstadisticaEtapa:
+    """Llamadas, tiempo total, mínimo, máximo e histograma de una etapa"""
+
+    __slots__ = ('llamadas', 'total', 'minimo', 'maximo', 'cubos')
+
+    def __init__(self):
+        self.llamadas = 0
+        self.total = 0.0
+        self.minimo = float('inf')
+        self.maximo = 0.0
+        # Un cubo por límite y uno final para lo que los supera
+        self.cubos = [0] * (len(LIMITES_HISTOGRAMA) + 1)
+
+    def anotar(self, segundos):
+        self.llamadas += 1
+        self.total += segundos
+        if segundos < self.minimo:
+            self.minimo = segundos
+        if segundos > self.maximo:
+            self.maximo = segundos
+        self.cubos[bisect_left(LIMITES_HISTOGRAMA, segundos)] += 1
+
+    def fusionar(self, otra):
+        self.llamadas += otra.llamadas
+        self.total += otra.total
+        self.minimo = min(self.minimo, otra.minimo)
+        self.maximo = max(self.maximo, otra.maximo)
+        self.cubos = [a + b for a, b in zip(self.cubos, otra.cubos)]
+
+    @property
+    def media(self):
+        return self.total / self.llamadas if self.llamadas else 0.0
+
+    def a_dict(self):
+        return {
+            'llamadas': self.llamadas,
+            'total': self.total,
+            'media': self.media,
+            'minimo': self.minimo if self.llamadas else 0.0,
+            'maximo': self.maximo,
+            'cubos': list(self.cubos)
+        }
+
+    @classmethod
+    def desde_dict(cls, datos):
+        estadistica = cls()
+        estadistica.llamadas = datos['llamadas']
+        estadistica.total = datos['total']
+        estadistica.minimo = datos['minimo'] if datos['llamadas'] else float('inf')
+        estadistica.maximo = datos['maximo']
+        estadistica.cubos = list(datos['cubos'])
+        return estadistica
+
+
+class MedidorEtapas:
+    """
+    Recoge el tiempo de cada etapa del cálculo
+
+    El motor llama a empezar() al comenzar un cálculo y a marca(etapa) al
+    terminar cada etapa: el tiempo de la etapa es el transcurrido desde la
+    marca anterior, así que las etapas reparten el tiempo total sin solaparse.
+
+    Args:
+        al_marcar: función opcional llamada con (etapa, segundos) en cada marca
+    """
+
+    def __init__(self, al_marcar=None):
+        self.etapas = {}
+        self.al_marcar = al_marcar
+        self._ultima = 0.0
+
+    def empezar(self):
+        self._ultima = time.perf_counter()
+
+    def marca(self, etapa):
+        ahora = time.perf_counter()
+        segundos = ahora - self._ultima
+        estadistica = self.etapas.get(etapa)
+        if estadistica is None:
+            estadistica = self.etapas[etapa] = EstadisticaEtapa()
+        estadistica.anotar(segundos)
+        if self.al_marcar is not None:
+            self.al_marcar(etapa, segundos)
+        # La marca no cuenta como tiempo de la etapa siguiente
+        self._ultima = time.perf_counter()
+
+    def fusionar(self, otro):
+        """
+        Suma a este medidor las etapas de otro (o de su exportar())
+
+        Sirve para agregar los medidores de los procesos de un lote.
+        """
+        etapas = otro.etapas if isinstance(otro, MedidorEtapas) else {
+            etapa: EstadisticaEtapa.desde_dict(datos) for etapa, datos in otro['etapas'].items()
+        }
+        for etapa, estadistica in etapas.items():
+            if etapa in self.etapas:
+                self.etapas[etapa].fusionar(estadistica)
+            else:
+                copia = self.etapas[etapa] = EstadisticaEtapa()
+                copia.fusionar(estadistica)
+
+    def limpiar(self):
+        self.etapas.clear()
+
+    def exportar(self):
+        """
+        Returns:
+            dict serializable a JSON: límites del histograma (s) y, por etapa,
+            llamadas, total, media, mínimo, máximo y recuento por cubo
+        """
+        return {
+            'limites': list(LIMITES_HISTOGRAMA),
+            'etapas': {etapa: estadistica.a_dict() for etapa, estadistica in self.etapas.items()}
+        }
+
+    def a_prometheus(self, nombre='irpf_etapa_segundos'):
+        """Histogramas en el formato de texto de Prometheus, con la etapa como etiqueta"""
+        lineas = [
+            f"# HELP {nombre} Tiempo de cada etapa del cálculo de IRPF",
+            f"# TYPE {nombre} histogram"
+        ]
+        for etapa, estadistica in self.etapas.items():
+            etiqueta = etapa.replace('\\', '\\\\').replace('"', '\\"')
+            acumulado = 0
+            for limite, cuantos in zip(LIMITES_HISTOGRAMA, estadistica.cubos):
+                acumulado += cuantos
+                lineas.append(f'{nombre}_bucket{{etapa="{etiqueta}",le="{limite:g}"}} {acumulado}')
+            lineas.append(f'{nombre}_bucket{{etapa="{etiqueta}",le="+Inf"}} {estadistica.llamadas}')
+            lineas.append(f'{nombre}_sum{{etapa="{etiqueta}"}} {estadistica.total!r}')
+            lineas.append(f'{nombre}_count{{etapa="{etiqueta}"}} {estadistica.llamadas}')
+        return '\n'.join(lineas) + '\n'
+
+    def resumen(self):
+        """Tabla de texto con las etapas ordenadas por tiempo total"""
+        total = sum(estadistica.total for estadistica in self.etapas.values()) or 1.0
+        ancho = max([len('etapa')] + [len(etapa) for etapa in self.etapas])
+        lineas = [f"{'etapa':<{ancho}} {'llamadas':>10} {'media µs':>10} {'máx µs':>10} {'% total':>8}"]
+        for etapa, estadistica in sorted(self.etapas.items(), key=lambda item: -item[1].total):
+            lineas.append(
+                f"{etapa:<{ancho}} {estadistica.llamadas:>10,} {estadistica.media * 1e6:>10.2f} "
+                f"{estadistica.maximo * 1e6:>10.1f} {estadistica.total / total:>8.1%}"
+            )
+        return '\n'.join(lineas)
+
+
+@contextmanager
+def medir_etapas(medidor=None):
+    """
+    Activa un medidor en el contexto actual mientras dura el bloque `with`
+
+    Args:
+        medidor: MedidorEtapas a usar (por defecto, uno nuevo)
+
+    Yields:
+        MedidorEtapas
+    """
+    if medidor is None:
+        medidor = MedidorEtapas()
+    token = _MEDIDOR.set(medidor)
+    try:
+        yield medidor
+    finally:
+        _MEDIDOR.reset(token)
@@ -0,0 +1,234 @@
+"""
+Línea de comandos del motor IRPF
+
+Uso:
+    python -m renta batch entrada.csv salida.csv --trabajadores 8
+    python -m irpf batch campana.csv resultados.parquet --bloque 100000
+    python -m irpf informes campana.csv informes.zip -j 8
+    python -m irpf convertir campana.csv campana.irpfbin && python -m irpf batch campana.irpfbin resultados.csv
+    python -m renta bench --comparar base.json
+    python -m renta arranque --margen 1.5
+    echo '{"comunidad": "Madrid", "salario": 32000}' | python -m irpf calc --campos cuota_diferencial.importe
+    python -m irpf servir --puerto 8080 & python -m irpf carga http://127.0.0.1:8080/calcular -c 64
+    zcat campana.jsonl.gz | python -m renta stream - - --formato-salida csv | gzip > resultados.csv.gz
+"""
+
+import argparse
+import os
+import sys
+
+
+# Los de lotes.MOTORES, repetidos aquí para no importar lotes al arrancar
+MOTORES = ('vectorial', 'escalar', 'vectorial_centimos', 'escalar_centimos')
+
+
+def crear_parser():
+    """Construye el parser de argumentos con un subcomando por operación"""
+    parser = argparse.ArgumentParser(prog='irpf', description="Motor de cálculo de IRPF")
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    batch = subcomandos.add_parser(
+        'batch',
+        help="calcula un fichero CSV/JSONL de registros con un pool de procesos"
+    )
+    batch.add_argument('entrada', help="fichero de registros (.csv o .jsonl, '-' = stdin)")
+    batch.add_argument('salida', help="fichero de resultados (.csv o .jsonl, '-' = stdout)")
+    _opciones_lote(batch, trabajadores=os.cpu_count() or 1, progreso=0)
+    batch.set_defaults(funcion=_batch)
+
+    stream = subcomandos.add_parser(
+        'stream',
+        help="calcula un flujo de registros en memoria constante (por defecto, stdin -> stdout)"
+    )
+    stream.add_argument('entrada', nargs='?', default='-',
+                        help="fichero de registros (por defecto, '-' = stdin)")
+    stream.add_argument('salida', nargs='?', default='-',
+                        help="fichero de resultados (por defecto, '-' = stdout)")
+    _opciones_lote(stream, trabajadores=1, progreso=5.0)
+    stream.set_defaults(funcion=_batch)
+
+    informes = subcomandos.add_parser(
+        'informes',
+        help="genera el informe HTML de cada registro en un archivo ZIP"
+    )
+    informes.add_argument('entrada', help="fichero de registros (.csv, .jsonl o .irpfbin; '-' = stdin)")
+    informes.add_argument('salida', help="archivo ZIP de informes ('-' = stdout)")
+    informes.add_argument('-j', '--trabajadores', type=int, default=1,
+                          help="número de procesos que calculan y generan los informes (por defecto, 1)")
+    informes.add_argument('--bloque', type=int, default=1000,
+                          help="registros por bloque enviado a cada proceso")
+    informes.add_argument('--formato-entrada', choices=('csv', 'jsonl', 'binario'),
+                          help="formato de entrada (por defecto, según la extensión; stdin es JSONL)")
+    informes.add_argument('--motor', choices=MOTORES, default='vectorial',
+                          help="motor de cálculo de cada bloque (los _centimos calculan en céntimos enteros)")
+    informes.add_argument('--compresion', choices=('deflate', 'ninguna'), default='deflate',
+                          help="compresión de los informes dentro del ZIP (por defecto, deflate)")
+    informes.add_argument('--errores', help="fichero JSONL donde guardar los registros fallidos")
+    informes.add_argument('--progreso', type=float, default=5.0, metavar='SEGUNDOS',
+                          help="informa de informes/s en stderr cada SEGUNDOS (0 = no; por defecto, 5)")
+    informes.set_defaults(funcion=_informes)
+
+    convertir = subcomandos.add_parser(
+        'convertir',
+        help="convierte un fichero CSV/JSONL de registros al formato binario (.irpfbin)"
+    )
+    convertir.add_argument('entrada', help="fichero de registros (.csv o .jsonl, '-' = stdin)")
+    convertir.add_argument('salida', help="fichero binario de registros (.irpfbin)")
+    convertir.add_argument('--formato-entrada', choices=('csv', 'jsonl'),
+                           help="formato de entrada (por defecto, según la extensión; stdin es JSONL)")
+    convertir.add_argument('--ancho-id', type=int, default=32, metavar='BYTES',
+                           help="bytes reservados para cada 'id' de texto (por defecto, 32)")
+    convertir.add_argument('--bloque', type=int, default=5000,
+                           help="registros que se convierten de una vez")
+    convertir.add_argument('--errores', help="fichero JSONL donde guardar los registros no convertidos")
+    convertir.add_argument('--progreso', type=float, default=0, metavar='SEGUNDOS',
+                           help="informa de registros/s en stderr cada SEGUNDOS (0 = no; por defecto, 0)")
+    convertir.set_defaults(funcion=_convertir)
+
+    bench = subcomandos.add_parser(
+        'bench',
+        help="mide el rendimiento del motor y lo compara con una línea base"
+    )
+    bench.add_argument('--guardar', metavar='FICHERO', help="guarda los tiempos como línea base JSON")
+    bench.add_argument('--comparar', metavar='FICHERO', help="compara con una línea base JSON")
+    bench.add_argument('--actual', metavar='FICHERO',
+                       help="compara este resultado guardado en lugar de ejecutar los benchmarks")
+    bench.add_argument('--umbral', type=float, default=0.10,
+                       help="aumento relativo considerado regresión (por defecto, 0.10 = 10%%)")
+    bench.add_argument('--filtro', help="solo los casos cuyo nombre contiene este texto")
+    bench.add_argument('--tamano-maximo', type=int, default=1000000,
+                       help="mayor tamaño de lote a medir (por defecto, 1.000.000)")
+    bench.add_argument('--objetivo', type=float, default=0.2, metavar='SEGUNDOS',
+                       help="duración aproximada de cada repetición")
+    bench.set_defaults(funcion=_bench)
+
+    calc = subcomandos.add_parser(
+        'calc',
+        help="calcula una declaración en JSON y escribe el resultado en JSON (sin cargar la aplicación)"
+    )
+    calc.add_argument('entrada', nargs='?', default='-',
+                      help="fichero JSON con los datos (por defecto, '-' = stdin)")
+    calc.add_argument('salida', nargs='?', default='-',
+                      help="fichero de resultado (por defecto, '-' = stdout)")
+    calc.add_argument('--campos', '--fields', action='append', metavar='RUTAS',
+                      help="solo estas rutas del resultado, separadas por comas (p. ej. resumen.tipo_medio); "
+                           "con una sola ruta se escribe el valor suelto")
+    calc.add_argument('--ejercicio', type=int, help="ejercicio fiscal (por defecto, el de los datos)")
+    calc.add_argument('--indentar', type=int, metavar='N', help="indenta el JSON con N espacios")
+    calc.set_defaults(funcion=_calc)
+
+    servir = subcomandos.add_parser(
+        'servir',
+        help="servicio HTTP local del motor, con agrupación de peticiones simultáneas en lotes"
+    )
+    servir.add_argument('--host', default='127.0.0.1', help="dirección de escucha (por defecto, 127.0.0.1)")
+    servir.add_argument('--puerto', type=int, default=8080, help="puerto de escucha (por defecto, 8080)")
+    servir.add_argument('--ventana-ms', type=float, default=2.0,
+                        help="espera máxima para juntar peticiones en un lote (por defecto, 2 ms)")
+    servir.add_argument('--lote-maximo', type=int, default=4096,
+                        help="registros como mucho por lote (por defecto, 4096)")
+    servir.set_defaults(funcion=_servir)
+
+    carga = subcomandos.add_parser(
+        'carga',
+        help="prueba de carga contra el servicio HTTP: peticiones/s y latencias"
+    )
+    carga.add_argument('url', nargs='?', default='http://127.0.0.1:8080/calcular',
+                       help="endpoint (por defecto, http://127.0.0.1:8080/calcular)")
+    carga.add_argument('-c', '--conexiones', type=int, default=64,
+                       help="conexiones simultáneas (por defecto, 64)")
+    carga.add_argument('-n', '--peticiones', type=int, default=10000,
+                       help="peticiones en total (por defecto, 10.000)")
+    carga.set_defaults(funcion=_carga)
+
+    arranque = subcomandos.add_parser(
+        'arranque',
+        help="comprueba el presupuesto de arranque en frío y rerun de la aplicación Streamlit"
+    )
+    arranque.add_argument('--margen', type=float, default=1.0,
+                          help="factor aplicado a los presupuestos (por defecto, 1.0)")
+    arranque.add_argument('--repeticiones', type=int, default=5,
+                          help="reruns medidos por escenario (se queda el mínimo)")
+    arranque.add_argument('--filtro', help="solo los escenarios cuyo nombre contiene este texto")
+    arranque.add_argument('--guardar', metavar='FICHERO', help="guarda las medidas en JSON")
+    arranque.set_defaults(funcion=_arranque)
+
+    return parser
+
+
+def _opciones_lote(parser, trabajadores, progreso):
+    """Opciones comunes de los comandos que calculan ficheros de registros"""
+    parser.add_argument('-j', '--trabajadores', type=int, default=trabajadores,
+                        help=f"número de procesos (por defecto, {trabajadores})")
+    parser.add_argument('--bloque', type=int, default=5000,
+                        help="registros por bloque enviado a cada proceso")
+    parser.add_argument('--formato-entrada', choices=('csv', 'jsonl', 'binario'),
+                        help="formato de entrada (por defecto, según la extensión; stdin es JSONL); "
+                             "binario es un fichero .irpfbin de `irpf convertir`")
+    parser.add_argument('--formato-salida', choices=('csv', 'jsonl', 'arrow', 'parquet'),
+                        help="formato de salida (por defecto, según la extensión; stdout es JSONL); "
+                             "arrow y parquet llevan una columna por cifra del resultado")
+    parser.add_argument('--motor', choices=MOTORES, default='vectorial',
+                        help="motor de cálculo de cada bloque (los _centimos calculan en céntimos enteros, "
+                             "sin salida arrow ni parquet)")
+    parser.add_argument('--errores', help="fichero JSONL donde guardar los registros fallidos")
+    parser.add_argument('--progreso', type=float, default=progreso, metavar='SEGUNDOS',
+                        help=f"informa de registros/s en stderr cada SEGUNDOS (0 = no; por defecto, {progreso:g})")
+    parser.add_argument('--etapas', metavar='FICHERO',
+                        help="guarda el tiempo de cada etapa del cálculo (JSON, o Prometheus si acaba en .prom)")
+
+
+def _batch(args):
+    from lotes import ejecutar_batch
+    return ejecutar_batch(args)
+
+
+def _informes(args):
+    from informes import ejecutar_informes
+    return ejecutar_informes(args)
+
+
+def _convertir(args):
+    from binario import ejecutar_conversion
+    return ejecutar_conversion(args)
+
+
+def _bench(args):
+    from benchmark import ejecutar_benchmark
+    return ejecutar_benchmark(args)
+
+
+def _calc(args):
+    from calculo import ejecutar_calculo
+    return ejecutar_calculo(args)
+
+
+def _servir(args):
+    from servicio import ejecutar_servicio
+    return ejecutar_servicio(args)
+
+
+def _carga(args):
+    from servicio import ejecutar_carga
+    return ejecutar_carga(args)
+
+
+def _arranque(args):
+    from arranque import ejecutar_arranque
+    return ejecutar_arranque(args)
+
+
+def main(argv=None):
+    """Punto de entrada: devuelve el código de salida del comando"""
+    args = crear_parser().parse_args(argv)
+    if getattr(args, 'bloque', 1) < 1 or getattr(args, 'trabajadores', 1) < 1:
+        print("--bloque y --trabajadores deben ser >= 1", file=sys.stderr)
+        return 2
+    if getattr(args, 'lote_maximo', 1) < 1 or getattr(args, 'conexiones', 1) < 1:
+        print("--lote-maximo y --conexiones deben ser >= 1", file=sys.stderr)
+        return 2
+    return args.funcion(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,764 @@
+"""
+Procesamiento por lotes de declaraciones
+Lee registros `datos` de un fichero CSV o JSONL, los calcula por bloques
+repartidos en un pool de procesos y escribe una fila de resultados por
+registro, en el mismo orden que la entrada sea cual sea el número de procesos.
+
+Todo el proceso es una cadena de generadores (leer -> agrupar en bloques ->
+validar y calcular -> escribir), así que la memoria depende del tamaño de
+bloque y no del de la entrada; la ruta '-' es la entrada o salida estándar.
+"""
+
+import csv
+import importlib.util
+import io
+import json
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from itertools import repeat
+
+from contribuyente import CAMPOS, VALORES_POR_DEFECTO, DatosContribuyente, vista_desde_valores
+from instrumentacion import MedidorEtapas, medir_etapas
+from reglas import EJERCICIOS
+
+
+# Columnas de la fila de salida de cada registro
+COLUMNAS_SALIDA = (
+    'registro',
+    'ejercicio',
+    'comunidad',
+    'base_imponible_general',
+    'base_imponible_ahorro',
+    'base_gravamen_general',
+    'cuota_integra_total',
+    'deducciones_total',
+    'cuota_liquida_total',
+    'total_pagado',
+    'cuota_diferencial',
+    'tipo_medio',
+    'tipo_marginal'
+)
+
+FORMATOS = ('csv', 'jsonl')
+
+# Motores de cálculo: en coma flotante (renta.py, renta_vectorizada.py) o en
+# céntimos enteros (renta_centimos.py), registro a registro o por lotes
+MOTORES = ('vectorial', 'escalar', 'vectorial_centimos', 'escalar_centimos')
+MOTORES_ESCALARES = ('escalar', 'escalar_centimos')
+MOTORES_CENTIMOS = ('vectorial_centimos', 'escalar_centimos')
+
+# Formatos solo de salida, con una columna por cifra del resultado (exportacion.py)
+FORMATOS_COLUMNARES = ('arrow', 'parquet')
+_EXTENSIONES_COLUMNARES = {'.arrow': 'arrow', '.feather': 'arrow', '.parquet': 'parquet'}
+
+# Formato binario de registros de entrada (ver binario.py): se lee de un fichero, no de stdin
+FORMATO_BINARIO = 'binario'
+_EXTENSION_BINARIA = '.irpfbin'
+
+_VERDADEROS = frozenset(('1', 'true', 'si', 'sí', 's', 'yes', 'y', 'x'))
+_FALSOS = frozenset(('0', 'false', 'no', 'n', ''))
+
+
+class EstadisticasLote:
+    """Contadores de un lote: registros procesados, fallidos y velocidad"""
+
+    __slots__ = ('registros', 'fallidos', 'inicio', 'fin')
+
+    def __init__(self):
+        self.registros = 0
+        self.fallidos = 0
+        self.inicio = time.perf_counter()
+        self.fin = None
+
+    @property
+    def segundos(self):
+        return (self.fin or time.perf_counter()) - self.inicio
+
+    @property
+    def registros_por_segundo(self):
+        segundos = self.segundos
+        return self.registros / segundos if segundos > 0 else 0.0
+
+    def resumen(self):
+        return (
+            f"{self.registros:,} registros ({self.fallidos:,} fallidos) en "
+            f"{self.segundos:.2f} s - {self.registros_por_segundo:,.0f} registros/s"
+        )
+
+
+def convertir_registro(valores):
+    """
+    Convierte un registro leído de fichero en DatosContribuyente
+
+    Los textos de CSV se convierten al tipo de cada campo; los campos vacíos
+    o ausentes toman su valor por defecto y las claves desconocidas se ignoran.
+
+    Args:
+        valores (dict): campo -> valor (texto en CSV, tipado en JSONL)
+
+    Returns:
+        DatosContribuyente
+
+    Raises:
+        ValueError: si algún valor no se puede convertir a su tipo
+    """
+    return DatosContribuyente(*convertir_valores(valores))
+
+
+def convertir_valores(valores):
+    """Como convertir_registro, pero devuelve la lista de valores en el orden de CAMPOS"""
+    get = valores.get
+    convertidos = []
+    for nombre, conversor, defecto in _CONVERSORES:
+        valor = get(nombre)
+        if valor is None or valor == '':
+            convertidos.append(defecto)
+            continue
+        try:
+            convertidos.append(conversor(valor))
+        except (TypeError, ValueError):
+            raise ValueError(f"Valor no válido para '{nombre}': {valor!r}") from None
+    return convertidos
+
+
+def convertir_campos(cambios):
+    """
+    Convierte al tipo de cada campo unos valores sueltos, como convertir_valores
+
+    Args:
+        cambios (dict): campo -> valor, solo de los campos que se indican
+
+    Returns:
+        dict campo -> valor convertido (los vacíos, a su valor por defecto)
+
+    Raises:
+        ValueError: si algún campo no existe o su valor no se puede convertir
+    """
+    convertidos = {}
+    for nombre, valor in cambios.items():
+        conversion = _CONVERSOR_CAMPO.get(nombre)
+        if conversion is None:
+            raise ValueError(f"Campo desconocido: '{nombre}'")
+        conversor, defecto = conversion
+        if valor is None or valor == '':
+            convertidos[nombre] = defecto
+            continue
+        try:
+            convertidos[nombre] = conversor(valor)
+        except (TypeError, ValueError):
+            raise ValueError(f"Valor no válido para '{nombre}': {valor!r}") from None
+    return convertidos
+
+
+def _a_bool(valor):
+    if valor is True or valor is False:
+        return valor
+    texto = str(valor).strip().lower()
+    if texto in _VERDADEROS:
+        return True
+    if texto in _FALSOS:
+        return False
+    raise ValueError(valor)
+
+
+def _a_int(valor):
+    if type(valor) is int:
+        return valor
+    numero = float(valor)
+    if not numero.is_integer():
+        raise ValueError(valor)
+    return int(numero)
+
+
+def _a_float(valor):
+    numero = float(valor)
+    if numero - numero != 0:
+        # NaN o infinito
+        raise ValueError(valor)
+    return valor if type(valor) is int else numero
+
+
+def _a_ejercicio(valor):
+    ejercicio = _a_int(valor)
+    if ejercicio not in EJERCICIOS:
+        # Se rechaza al leer: el cálculo del bloque no llega a pedir reglas inexistentes
+        raise ValueError(valor)
+    return ejercicio
+
+
+_CONVERSORES_TIPO = {bool: _a_bool, int: _a_int, float: _a_float}
+
+# Conversores de los campos que no se tratan solo por su tipo
+_CONVERSORES_CAMPO = {'ejercicio': _a_ejercicio}
+
+_CONVERSORES = tuple(
+    (nombre, _CONVERSORES_CAMPO.get(nombre) or _CONVERSORES_TIPO.get(tipo, str), defecto)
+    for nombre, tipo, defecto in CAMPOS
+)
+
+_CONVERSOR_CAMPO = {nombre: (conversor, defecto) for nombre, conversor, defecto in _CONVERSORES}
+
+# Nombres de los campos en el orden de CAMPOS
+NOMBRES_CAMPOS = tuple(nombre for nombre, _, _ in CAMPOS)
+
+
+# Ruta que representa la entrada o salida estándar
+ESTANDAR = '-'
+
+
+def detectar_formato(ruta, formato=None):
+    """
+    Devuelve el formato indicado o el deducido de la extensión del fichero
+
+    Para la entrada o salida estándar ('-'), sin formato indicado, es JSONL.
+    """
+    if formato:
+        return formato
+    if ruta == ESTANDAR:
+        return 'jsonl'
+    for candidato in FORMATOS:
+        if str(ruta).lower().endswith('.' + candidato):
+            return candidato
+    if str(ruta).lower().endswith('.json'):
+        return 'jsonl'
+    for extension, candidato in _EXTENSIONES_COLUMNARES.items():
+        if str(ruta).lower().endswith(extension):
+            return candidato
+    if str(ruta).lower().endswith(_EXTENSION_BINARIA):
+        return FORMATO_BINARIO
+    raise ValueError(f"No se puede deducir el formato de '{ruta}': usa csv, jsonl, arrow, parquet o binario")
+
+
+@contextmanager
+def abrir_entrada(ruta):
+    """Abre un fichero de registros en modo texto ('-' = entrada estándar)"""
+    if ruta == ESTANDAR:
+        with _flujo_estandar(sys.stdin, 'r') as fichero:
+            yield fichero
+    else:
+        with open(ruta, newline='', encoding='utf-8') as fichero:
+            yield fichero
+
+
+@contextmanager
+def abrir_salida(ruta, binario=False):
+    """Abre un fichero de resultados en modo texto o binario ('-' = salida estándar)"""
+    if binario:
+        if ruta == ESTANDAR:
+            sys.stdout.flush()
+            yield sys.stdout.buffer
+            sys.stdout.buffer.flush()
+        else:
+            with open(ruta, 'wb') as fichero:
+                yield fichero
+    elif ruta == ESTANDAR:
+        with _flujo_estandar(sys.stdout, 'w') as fichero:
+            yield fichero
+    else:
+        with open(ruta, 'w', newline='', encoding='utf-8') as fichero:
+            yield fichero
+
+
+@contextmanager
+def _flujo_estandar(flujo, modo):
+    # stdin/stdout en UTF-8 y sin traducir saltos de línea (lo que espera csv),
+    # sin cerrar el flujo del proceso al terminar
+    buffer = getattr(flujo, 'buffer', None)
+    if buffer is None:
+        yield flujo
+        return
+    if modo == 'w':
+        flujo.flush()
+    fichero = io.TextIOWrapper(buffer, encoding='utf-8', newline='')
+    try:
+        yield fichero
+    finally:
+        if modo == 'w':
+            fichero.flush()
+        fichero.detach()
+
+
+def leer_registros(fichero, formato):
+    """
+    Lee los registros de un fichero abierto en modo texto
+
+    Yields:
+        dict con los valores de cada registro (o un str con el error si la
+        línea no se puede leer)
+    """
+    if formato == 'csv':
+        for fila in csv.DictReader(fichero):
+            yield fila
+    else:
+        for linea in fichero:
+            linea = linea.strip()
+            if not linea:
+                continue
+            try:
+                registro = json.loads(linea)
+            except json.JSONDecodeError as error:
+                yield f"JSON no válido: {error}"
+                continue
+            yield registro if isinstance(registro, dict) else "El registro no es un objeto JSON"
+
+
+def en_bloques(registros, tamano_bloque):
+    """Agrupa los registros en bloques numerados: (número del primero, lista)"""
+    bloque = []
+    inicio = 1
+    for numero, registro in enumerate(registros, start=1):
+        if not bloque:
+            inicio = numero
+        bloque.append(registro)
+        if len(bloque) >= tamano_bloque:
+            yield inicio, bloque
+            bloque = []
+    if bloque:
+        yield inicio, bloque
+
+
+def procesar_bloque(inicio, bloque, motor='vectorial', etapas=False):
+    """
+    Calcula un bloque de registros (se ejecuta en los procesos del pool)
+
+    Args:
+        inicio (int): número de registro del primer elemento del bloque
+        bloque (list): registros leídos (dicts, o str con un error de lectura)
+        motor (str): uno de MOTORES ('vectorial' es calcular_renta_batch)
+        etapas (bool): si es True, mide el tiempo de cada etapa del cálculo
+
+    Returns:
+        tuple: (filas, errores, etapas) con filas en el orden de
+               COLUMNAS_SALIDA, errores como dicts {'registro', 'error'} y
+               etapas como MedidorEtapas.exportar() (o None sin medición)
+    """
+    if etapas:
+        with medir_etapas() as medidor:
+            filas, errores, _ = procesar_bloque(inicio, bloque, motor)
+        return filas, errores, medidor.exportar()
+
+    identificadores, registros, errores = convertir_bloque(inicio, bloque)
+    return calcular_filas(identificadores, registros, motor), errores, None
+
+
+def convertir_bloque(inicio, bloque, numeros=None):
+    """
+    Valida y convierte los registros leídos de un bloque
+
+    Args:
+        inicio (int): número de registro del primer elemento del bloque
+        bloque (list): registros leídos (dicts, o str con un error de lectura)
+        numeros (list): si se indica, se le añade el número de registro de
+                        cada registro válido
+
+    Returns:
+        tuple: (identificadores, registros, errores) con el identificador
+               ('id' o número) y los valores en el orden de CAMPOS de cada
+               registro válido, y errores como dicts {'registro', 'error'}
+    """
+    identificadores = []
+    registros = []
+    errores = []
+    for numero, valores in enumerate(bloque, start=inicio):
+        if isinstance(valores, str):
+            errores.append({'registro': numero, 'error': valores})
+            continue
+        try:
+            registros.append(convertir_valores(valores))
+        except ValueError as error:
+            errores.append({'registro': valores.get('id', numero), 'error': str(error)})
+            continue
+        identificadores.append(valores.get('id', numero))
+        if numeros is not None:
+            numeros.append(numero)
+    return identificadores, registros, errores
+
+
+def calcular_filas(identificadores, registros, motor='vectorial'):
+    """
+    Calcula registros ya convertidos
+
+    Args:
+        identificadores (list): valor de la columna 'registro' de cada fila
+        registros (list): valores de cada registro en el orden de CAMPOS (convertir_valores)
+        motor (str): uno de MOTORES ('vectorial' es calcular_renta_batch)
+
+    Returns:
+        list de filas en el orden de COLUMNAS_SALIDA
+    """
+    if motor in MOTORES_ESCALARES:
+        fila_escalar = _fila_escalar_centimos if motor == 'escalar_centimos' else _fila_escalar
+        return [
+            fila_escalar(identificador, vista_desde_valores(registro))
+            for identificador, registro in zip(identificadores, registros)
+        ]
+    return _filas_vectoriales(identificadores, registros, motor)
+
+
+def _fila_escalar(identificador, contribuyente):
+    from renta import calcular_renta_total
+
+    resultado = calcular_renta_total(contribuyente, detalle=False)
+    resumen = resultado['resumen']
+    deducciones = resultado['deducciones']
+    cuota_diferencial = resultado['cuota_diferencial']
+    return [
+        identificador,
+        contribuyente.ejercicio,
+        contribuyente.comunidad,
+        _redondear(resumen['base_imponible_general']),
+        _redondear(resumen['base_imponible_ahorro']),
+        _redondear(resumen['base_gravamen_general']),
+        _redondear(resultado['cuotas_integras']['total']),
+        _redondear(deducciones['total_estatal'] + deducciones['total_autonomica']),
+        _redondear(cuota_diferencial['cuota_liquida']),
+        _redondear(cuota_diferencial['total_pagado']),
+        _redondear(cuota_diferencial['diferencial']),
+        _redondear(resumen['tipo_medio']),
+        _redondear(resumen['tipo_marginal'])
+    ]
+
+
+def _fila_escalar_centimos(identificador, contribuyente):
+    from renta_centimos import calcular_renta_centimos
+
+    r = calcular_renta_centimos(contribuyente)
+    return [
+        identificador,
+        contribuyente.ejercicio,
+        contribuyente.comunidad,
+        r['base_imponible_general'] / 100,
+        r['base_imponible_ahorro'] / 100,
+        r['base_gravamen_general'] / 100,
+        r['cuota_integra_total'] / 100,
+        (r['deducciones_estatal'] + r['deducciones_autonomica']) / 100,
+        r['cuota_liquida_total'] / 100,
+        r['total_pagado'] / 100,
+        r['cuota_diferencial'] / 100,
+        _redondear(r['tipo_medio']),
+        _redondear(r['tipo_marginal'])
+    ]
+
+
+def _redondear(importe):
+    return round(float(importe), 2)
+
+
+def _filas_vectoriales(identificadores, registros, motor='vectorial'):
+    if not registros:
+        return []
+    return filas_vectoriales(identificadores, dict(zip(NOMBRES_CAMPOS, zip(*registros))), motor=motor)
+
+
+def filas_vectoriales(identificadores, columnas, comunidades=None, motor='vectorial'):
+    """
+    Calcula con el motor vectorial registros que ya están en columnas
+
+    Args:
+        identificadores (list): valor de la columna 'registro' de cada fila
+        columnas (dict): campo -> columna, como las de calcular_renta_batch
+        comunidades: nombre de la comunidad de cada fila (por defecto, la
+                     columna 'comunidad'; hace falta si esta trae índices)
+        motor (str): 'vectorial' o 'vectorial_centimos'
+
+    Returns:
+        list de filas en el orden de COLUMNAS_SALIDA
+    """
+    n = len(identificadores)
+    if motor == 'vectorial_centimos':
+        from renta_centimos import calcular_renta_batch_centimos
+        r = calcular_renta_batch_centimos(columnas)
+        # Los importes salen en céntimos exactos: a euros sin volver a redondear
+        importes = {nombre: valores / 100 for nombre, valores in r.items() if valores.dtype.kind == 'i'}
+        r = {**r, **importes}
+    else:
+        from renta_vectorizada import calcular_renta_batch
+        r = calcular_renta_batch(columnas)
+    numericas = [
+        r['base_imponible_general'],
+        r['base_imponible_ahorro'],
+        r['base_gravamen_general'],
+        r['cuota_integra_total'],
+        r['deducciones_estatal'] + r['deducciones_autonomica'],
+        r['cuota_liquida_total'],
+        r['total_pagado'],
+        r['cuota_diferencial'],
+        r['tipo_medio'],
+        r['tipo_marginal']
+    ]
+    numericas = [columna.round(2).tolist() for columna in numericas]
+    ejercicios = _como_lista(columnas.get('ejercicio', repeat(VALORES_POR_DEFECTO['ejercicio'], n)))
+    if comunidades is None:
+        comunidades = columnas.get('comunidad', repeat(VALORES_POR_DEFECTO['comunidad'], n))
+    return [
+        [identificador, ejercicio, comunidad, *valores]
+        for identificador, ejercicio, comunidad, valores in zip(
+            _como_lista(identificadores), ejercicios, _como_lista(comunidades), zip(*numericas)
+        )
+    ]
+
+
+def registros_de_columnas(columnas, n, comunidades=None):
+    """
+    Valores de cada registro en el orden de CAMPOS a partir de columnas
+
+    Args:
+        columnas (dict): campo -> columna (los campos ausentes toman su valor por defecto)
+        n (int): número de registros
+        comunidades: nombre de la comunidad de cada fila (por defecto, la columna 'comunidad')
+
+    Returns:
+        list de listas de valores, como las de convertir_valores
+    """
+    listas = []
+    for nombre, _, defecto in CAMPOS:
+        if nombre == 'comunidad' and comunidades is not None:
+            listas.append(_como_lista(comunidades))
+        elif nombre in columnas:
+            listas.append(_como_lista(columnas[nombre]))
+        else:
+            listas.append(repeat(defecto, n))
+    return [list(valores) for valores in zip(*listas)]
+
+
+def _como_lista(valores):
+    # Los arrays de NumPy pasan a valores de Python (int, float, str) de una vez
+    return valores.tolist() if hasattr(valores, 'tolist') else valores
+
+
+def calcular_bloques(bloques, trabajadores=1, motor='vectorial', etapas=False):
+    """
+    Calcula los bloques en un pool de procesos, conservando el orden
+
+    Como mucho hay 2 bloques por proceso en vuelo, de modo que la memoria
+    no crece con el tamaño de la entrada.
+
+    Args:
+        bloques: iterable de (inicio, bloque) como los de en_bloques()
+        trabajadores (int): número de procesos (1 = en este proceso)
+        motor (str): uno de MOTORES
+        etapas (bool): si es True, mide el tiempo de cada etapa
+
+    Returns:
+        iterador de (filas, errores, etapas) de cada bloque, en el orden de entrada
+    """
+    return repartir_bloques(procesar_bloque, bloques, trabajadores, motor, etapas)
+
+
+def repartir_bloques(funcion, bloques, trabajadores=1, *argumentos):
+    """
+    Aplica `funcion(inicio, bloque, *argumentos)` a cada bloque en un pool de procesos
+
+    Los resultados salen en el orden de los bloques y como mucho hay 2
+    bloques por proceso en vuelo. `funcion` debe estar definida en un
+    módulo (el pool la envía por pickle).
+
+    Args:
+        funcion: función de nivel de módulo
+        bloques: iterable de (inicio, bloque) como los de en_bloques()
+        trabajadores (int): número de procesos (1 = en este proceso)
+        *argumentos: argumentos adicionales de `funcion`
+
+    Yields:
+        el resultado de `funcion` para cada bloque, en el orden de entrada
+    """
+    if trabajadores <= 1:
+        for inicio, bloque in bloques:
+            yield funcion(inicio, bloque, *argumentos)
+        return
+
+    # Solo aquí: importar el pool cuesta más que el resto del módulo
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=trabajadores) as pool:
+        pendientes = deque()
+        for inicio, bloque in bloques:
+            pendientes.append(pool.submit(funcion, inicio, bloque, *argumentos))
+            if len(pendientes) >= 2 * trabajadores:
+                yield pendientes.popleft().result()
+        while pendientes:
+            yield pendientes.popleft().result()
+
+
+class EscritorResultados:
+    """Escribe filas de COLUMNAS_SALIDA en CSV o JSONL"""
+
+    def __init__(self, fichero, formato):
+        self.fichero = fichero
+        self.formato = formato
+        if formato == 'csv':
+            self._csv = csv.writer(fichero, lineterminator='\n')
+            self._csv.writerow(COLUMNAS_SALIDA)
+
+    def escribir(self, filas):
+        """Escribe las filas de un bloque y devuelve cuántas son"""
+        if self.formato == 'csv':
+            self._csv.writerows(filas)
+        else:
+            self.fichero.writelines(
+                json.dumps(dict(zip(COLUMNAS_SALIDA, fila)), ensure_ascii=False) + '\n'
+                for fila in filas
+            )
+        return len(filas)
+
+    def cerrar(self):
+        self.fichero.flush()
+
+
+class InformeProgreso:
+    """
+    Informa del avance de un lote en un fichero de texto (stderr)
+
+    Se llama tras cada bloque con las estadísticas acumuladas y escribe una
+    línea como mucho cada `intervalo` segundos.
+    """
+
+    def __init__(self, intervalo=5.0, fichero=None):
+        self.intervalo = intervalo
+        self.fichero = fichero
+        self._siguiente = time.perf_counter() + intervalo
+
+    def __call__(self, estadisticas):
+        ahora = time.perf_counter()
+        if ahora < self._siguiente:
+            return
+        self._siguiente = ahora + self.intervalo
+        fichero = self.fichero or sys.stderr
+        print(estadisticas.resumen(), file=fichero, flush=True)
+
+
+def procesar_lote(entrada, salida, formato_entrada, formato_salida, trabajadores=1,
+                  tamano_bloque=5000, motor='vectorial', errores=None, progreso=None,
+                  etapas=None):
+    """
+    Calcula todos los registros de `entrada` y escribe los resultados en `salida`
+
+    Args:
+        entrada: fichero de texto abierto con los registros (con
+                 FORMATO_BINARIO, la ruta del fichero)
+        salida: fichero abierto para los resultados (de texto; binario con
+                FORMATOS_COLUMNARES)
+        formato_entrada (str): 'csv', 'jsonl' o 'binario'
+        formato_salida (str): 'csv', 'jsonl', 'arrow' o 'parquet'
+        trabajadores (int): número de procesos
+        tamano_bloque (int): registros por bloque enviado a cada proceso
+        motor (str): uno de MOTORES
+        errores: fichero opcional donde escribir los registros fallidos (JSONL)
+        progreso: función opcional llamada con las EstadisticasLote tras
+                  cada bloque (p. ej. un InformeProgreso)
+        etapas: MedidorEtapas opcional donde agregar el tiempo de cada
+                etapa del cálculo en todos los procesos
+
+    Returns:
+        EstadisticasLote
+    """
+    estadisticas = EstadisticasLote()
+    if formato_salida in FORMATOS_COLUMNARES:
+        from exportacion import EscritorColumnar, calcular_columnas
+        escritor = EscritorColumnar(salida, formato_salida)
+        calcular = calcular_columnas
+    else:
+        escritor = EscritorResultados(salida, formato_salida)
+        calcular = procesar_bloque
+    if formato_entrada == FORMATO_BINARIO:
+        # Los procesos reciben tramos (ruta, desde, hasta) y proyectan el fichero
+        import binario
+        bloques = binario.tramos(entrada, tamano_bloque)
+        columnar = formato_salida in FORMATOS_COLUMNARES
+        calcular = binario.calcular_columnas_tramo if columnar else binario.procesar_tramo
+    else:
+        bloques = en_bloques(leer_registros(entrada, formato_entrada), tamano_bloque)
+
+    medir = etapas is not None
+    for calculado, fallidos, medidas in repartir_bloques(calcular, bloques, trabajadores, motor, medir):
+        if medir:
+            etapas.fusionar(medidas)
+        escritos = escritor.escribir(calculado)
+        # Cada bloque sale en cuanto está calculado, para quien lea de una tubería
+        salida.flush()
+        estadisticas.registros += escritos + len(fallidos)
+        estadisticas.fallidos += len(fallidos)
+        if errores is not None:
+            for fallido in fallidos:
+                errores.write(json.dumps(fallido, ensure_ascii=False) + '\n')
+        if progreso is not None:
+            progreso(estadisticas)
+    escritor.cerrar()
+
+    estadisticas.fin = time.perf_counter()
+    return estadisticas
+
+
+def ejecutar_batch(args):
+    """Comandos `batch` y `stream` de la línea de comandos"""
+    try:
+        return _ejecutar_batch(args)
+    except (OSError, ValueError) as error:
+        # Errores de uso (formatos, ficheros que no existen...): el mensaje, sin traza, como `irpf calc`
+        print(error, file=sys.stderr)
+        return 2
+
+
+def _ejecutar_batch(args):
+    formato_entrada = detectar_formato(args.entrada, args.formato_entrada)
+    formato_salida = detectar_formato(args.salida, args.formato_salida)
+    if formato_entrada in FORMATOS_COLUMNARES:
+        raise ValueError(f"El formato {formato_entrada} solo se admite para la salida")
+    if formato_salida == FORMATO_BINARIO:
+        raise ValueError("El formato binario es de entrada: se genera con `irpf convertir`")
+    if formato_salida in FORMATOS_COLUMNARES and importlib.util.find_spec('pyarrow') is None:
+        # Antes de empezar: sin pyarrow, la salida fallaría en el primer bloque
+        raise ValueError(f"La salida {formato_salida} necesita pyarrow (pip install pyarrow)")
+    if formato_salida in FORMATOS_COLUMNARES and args.motor in MOTORES_CENTIMOS:
+        raise ValueError(f"La salida {formato_salida} se calcula con el motor vectorial o el escalar")
+    desde_binario = formato_entrada == FORMATO_BINARIO
+    if desde_binario and args.entrada == ESTANDAR:
+        raise ValueError("La entrada binaria debe ser un fichero, no la entrada estándar")
+    progreso = InformeProgreso(args.progreso) if args.progreso > 0 else None
+    etapas = MedidorEtapas() if args.etapas else None
+
+    errores = open(args.errores, 'w', encoding='utf-8') if args.errores else None
+    try:
+        binario = formato_salida in FORMATOS_COLUMNARES
+        lectura = nullcontext(args.entrada) if desde_binario else abrir_entrada(args.entrada)
+        with lectura as entrada, abrir_salida(args.salida, binario) as salida:
+            estadisticas = procesar_lote(
+                entrada, salida, formato_entrada, formato_salida,
+                trabajadores=args.trabajadores,
+                tamano_bloque=args.bloque,
+                motor=args.motor,
+                errores=errores,
+                progreso=progreso,
+                etapas=etapas
+            )
+    except BrokenPipeError:
+        # El siguiente proceso de la tubería ha dejado de leer (p. ej. `head`)
+        if args.salida == ESTANDAR:
+            _descartar_salida_estandar()
+        return 1
+    finally:
+        if errores is not None:
+            errores.close()
+
+    if etapas is not None:
+        guardar_etapas(etapas, args.etapas)
+    print(estadisticas.resumen(), file=sys.stderr)
+    return 1 if estadisticas.fallidos else 0
+
+
+def guardar_etapas(medidor, ruta):
+    """Guarda los tiempos por etapa: texto de Prometheus si la ruta acaba en .prom, si no JSON"""
+    with open(ruta, 'w', encoding='utf-8') as fichero:
+        if str(ruta).endswith('.prom'):
+            fichero.write(medidor.a_prometheus())
+        else:
+            json.dump(medidor.exportar(), fichero, ensure_ascii=False, indent=2)
+
+
+def _descartar_salida_estandar():
+    # Redirige stdout a /dev/null para que Python no vuelva a fallar al cerrarlo
+    import os
+    descartar = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(descartar, sys.stdout.fileno())
+    os.close(descartar)
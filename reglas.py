@@ -0,0 +1,389 @@
+"""
+Paquetes de reglas por ejercicio fiscal
+Las escalas y deducciones de cada ejercicio están en datos_reglas/<año>.toml.
+Un paquete se carga la primera vez que se pide su ejercicio: el fichero se
+lee, se valida y se compila una sola vez (escalas con búsqueda binaria,
+escalas estatal + autonómica combinadas), y el paquete compilado se guarda en
+una caché binaria para que los siguientes procesos no vuelvan a leer ni a
+validar el TOML mientras los ficheros de reglas no cambien.
+
+Uso:
+    reglas = reglas_ejercicio(2025)
+    reglas.estatal_general.cuota(base)
+"""
+
+import hashlib
+import math
+import os
+import pickle
+import re
+import tempfile
+
+import centimos
+import deducciones_compiladas
+import escalas
+from deducciones_compiladas import compilar_deducciones
+from escalas import compilar_escala, combinar_escalas
+
+
+# Ejercicio que se calcula cuando los datos no indican otro
+EJERCICIO_POR_DEFECTO = 2024
+
+# Revisión de las reglas que no están en tablas (mínimos, reducciones,
+# límites de deducciones...): súbela al cambiar cualquiera de ellas
+REVISION_REGLAS = 1
+
+# Directorio con un fichero <año>.toml por ejercicio
+DIRECTORIO_REGLAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'datos_reglas')
+
+# Directorio de la caché binaria de paquetes compilados. La variable de
+# entorno IRPF_CACHE_REGLAS lo cambia; vacía, desactiva la caché.
+DIRECTORIO_CACHE = os.environ.get('IRPF_CACHE_REGLAS', os.path.join(DIRECTORIO_REGLAS, '__pycache__'))
+
+# Formato de la caché. El código fuente de los módulos que compilan los
+# paquetes ya forma parte de su huella (_huella_ficheros), así que solo hace
+# falta subirlo si cambia cómo se guardan sin cambiar esos módulos
+FORMATO_CACHE = 3
+
+# Módulos cuyo código construye o define los paquetes compilados (y, por
+# tanto, lo que guarda la caché)
+_MODULOS_COMPILACION = (centimos, deducciones_compiladas, escalas)
+
+# Tablas que tiene que definir cada ejercicio (directamente o heredadas)
+TABLAS = (
+    'escala_estatal_general',
+    'escala_ahorro_estatal',
+    'escala_ahorro_autonomica',
+    'escalas_autonomicas',
+    'deducciones_especificas'
+)
+
+
+class PaqueteReglas:
+    """
+    Tablas de un ejercicio, compiladas para el motor
+
+    Obtén las instancias con reglas_ejercicio(ejercicio).
+
+    Atributos:
+        ejercicio (int): año del ejercicio fiscal
+        tablas (dict): tablas originales (listas de tramos y dicts de deducciones)
+        estatal_general (EscalaCompilada): escala general estatal
+        ahorro_estatal (EscalaCompilada): escala del ahorro estatal
+        ahorro_autonomica (EscalaCompilada): escala del ahorro autonómica
+        ahorro_combinada (EscalaCombinada): escala del ahorro estatal + autonómica
+        escalas_autonomicas (dict): comunidad -> EscalaCompilada
+        generales_combinadas (dict): comunidad -> EscalaCombinada (general estatal + autonómica)
+        deducciones (dict): comunidad -> deducciones específicas
+        deducciones_compiladas (dict): comunidad -> tuple de reglas de deducciones_compiladas
+        version (str): versión de las reglas (ejercicio, revisión y huella de las tablas)
+    """
+
+    __slots__ = (
+        'ejercicio', 'tablas', 'estatal_general', 'ahorro_estatal', 'ahorro_autonomica',
+        'ahorro_combinada', 'escalas_autonomicas', 'generales_combinadas', 'deducciones',
+        'deducciones_compiladas', 'version'
+    )
+
+    def __init__(self, ejercicio, tablas):
+        self.ejercicio = ejercicio
+        self.tablas = tablas
+        self.estatal_general = compilar_escala(tablas['escala_estatal_general'])
+        self.ahorro_estatal = compilar_escala(tablas['escala_ahorro_estatal'])
+        self.ahorro_autonomica = compilar_escala(tablas['escala_ahorro_autonomica'])
+        self.ahorro_combinada = combinar_escalas(self.ahorro_estatal, self.ahorro_autonomica)
+        self.escalas_autonomicas = {
+            comunidad: compilar_escala(escala)
+            for comunidad, escala in tablas['escalas_autonomicas'].items()
+        }
+        self.generales_combinadas = {
+            comunidad: combinar_escalas(self.estatal_general, escala)
+            for comunidad, escala in self.escalas_autonomicas.items()
+        }
+        self.deducciones = tablas['deducciones_especificas']
+        self.deducciones_compiladas = {
+            comunidad: compilar_deducciones(deducciones)
+            for comunidad, deducciones in self.deducciones.items()
+        }
+        self.version = f"{ejercicio}.{REVISION_REGLAS}-" + _huella_reglas(
+            tablas['escala_estatal_general'],
+            tablas['escala_ahorro_estatal'],
+            tablas['escala_ahorro_autonomica'],
+            tablas['escalas_autonomicas'],
+            tablas['deducciones_especificas']
+        )
+
+    def escala_autonomica(self, comunidad):
+        """Escala autonómica compilada de la comunidad (las desconocidas usan la de Madrid)"""
+        escala = self.escalas_autonomicas.get(comunidad)
+        return escala if escala is not None else self.escalas_autonomicas['Madrid']
+
+    def general_combinada(self, comunidad):
+        """Escala general estatal + autonómica de la comunidad (las desconocidas usan la de Madrid)"""
+        escala = self.generales_combinadas.get(comunidad)
+        return escala if escala is not None else self.generales_combinadas['Madrid']
+
+    def deducciones_comunidad(self, comunidad):
+        """Reglas compiladas de las deducciones de la comunidad (ninguna si es desconocida)"""
+        return self.deducciones_compiladas.get(comunidad, ())
+
+    def __repr__(self):
+        return f"PaqueteReglas({self.ejercicio}, version={self.version!r})"
+
+
+def _huella_reglas(*tablas):
+    """Huella corta del contenido de las tablas de reglas"""
+    return hashlib.sha256(repr(tablas).encode('utf-8')).hexdigest()[:12]
+
+
+# ===== CARGA Y VALIDACIÓN DE LAS TABLAS =====
+
+def _ruta_tablas(ejercicio):
+    return os.path.join(DIRECTORIO_REGLAS, f"{ejercicio}.toml")
+
+
+def _ejercicios_disponibles():
+    return tuple(sorted(
+        int(nombre[:-5]) for nombre in os.listdir(DIRECTORIO_REGLAS)
+        if re.fullmatch(r'\d{4}\.toml', nombre)
+    ))
+
+
+# Ejercicios con fichero de reglas, en orden
+EJERCICIOS = _ejercicios_disponibles()
+
+
+def cargar_tablas(ejercicio):
+    """
+    Lee y valida las tablas de un ejercicio desde su fichero TOML
+
+    Un fichero con `hereda = <año>` toma las tablas de ese ejercicio y
+    redefine solo las que incluye.
+
+    Args:
+        ejercicio (int): año del ejercicio fiscal
+
+    Returns:
+        dict {tabla: valor} con las tablas de TABLAS, con las escalas como
+        listas de tuplas (límite, tipo)
+
+    Raises:
+        ValueError: si el fichero no existe o las tablas no son válidas
+    """
+    return validar_tablas(_leer_tablas(ejercicio, ()), _ruta_tablas(ejercicio))
+
+
+def _leer_tablas(ejercicio, herederos):
+    # Tablas del fichero sin validar, con las heredadas ya incorporadas
+    import tomllib
+
+    ruta = _ruta_tablas(ejercicio)
+    try:
+        with open(ruta, 'rb') as fichero:
+            datos = tomllib.load(fichero)
+    except FileNotFoundError:
+        raise ValueError(f"No hay fichero de reglas para el ejercicio {ejercicio!r}: {ruta}") from None
+    except tomllib.TOMLDecodeError as error:
+        raise ValueError(f"{ruta}: TOML no válido: {error}") from None
+
+    padre = datos.pop('hereda', None)
+    if padre is None:
+        return datos
+    herederos = herederos + (ejercicio,)
+    if padre in herederos:
+        cadena = ' -> '.join(str(e) for e in herederos + (padre,))
+        raise ValueError(f"{ruta}: herencia circular: {cadena}")
+    return dict(_leer_tablas(padre, herederos), **datos)
+
+
+def validar_tablas(tablas, origen='tablas'):
+    """
+    Comprueba las tablas de un ejercicio y normaliza las escalas
+
+    Args:
+        tablas (dict): tablas leídas del fichero de reglas
+        origen (str): nombre del fichero, para los mensajes de error
+
+    Returns:
+        dict con las mismas tablas y cada escala como lista de tuplas (límite, tipo)
+
+    Raises:
+        ValueError: con el primer problema encontrado
+    """
+    desconocidas = set(tablas) - set(TABLAS)
+    if desconocidas:
+        raise ValueError(f"{origen}: tablas desconocidas: {', '.join(sorted(desconocidas))}")
+    faltan = [tabla for tabla in TABLAS if tabla not in tablas]
+    if faltan:
+        raise ValueError(f"{origen}: faltan tablas: {', '.join(faltan)}")
+
+    normalizadas = {
+        tabla: _validar_escala(tablas[tabla], f"{origen}: {tabla}")
+        for tabla in ('escala_estatal_general', 'escala_ahorro_estatal', 'escala_ahorro_autonomica')
+    }
+
+    escalas_autonomicas = tablas['escalas_autonomicas']
+    if not isinstance(escalas_autonomicas, dict) or 'Madrid' not in escalas_autonomicas:
+        # Madrid es la escala de las comunidades desconocidas
+        raise ValueError(f"{origen}: escalas_autonomicas debe incluir al menos 'Madrid'")
+    normalizadas['escalas_autonomicas'] = {
+        comunidad: _validar_escala(escala, f"{origen}: escalas_autonomicas.{comunidad}")
+        for comunidad, escala in escalas_autonomicas.items()
+    }
+
+    deducciones = tablas['deducciones_especificas']
+    if not isinstance(deducciones, dict):
+        raise ValueError(f"{origen}: deducciones_especificas debe ser una tabla por comunidad")
+    for comunidad, deducciones_comunidad in deducciones.items():
+        lugar = f"{origen}: deducciones_especificas.{comunidad}"
+        if comunidad not in escalas_autonomicas:
+            raise ValueError(f"{lugar}: comunidad sin escala autonómica")
+        if not isinstance(deducciones_comunidad, dict):
+            raise ValueError(f"{lugar}: debe ser una tabla de deducciones")
+        for nombre, valor in deducciones_comunidad.items():
+            parametros = valor if isinstance(valor, dict) else {None: valor}
+            for parametro, numero in parametros.items():
+                if isinstance(numero, str):
+                    # Descripciones ('condiciones')
+                    continue
+                if not _es_numero(numero) or numero < 0:
+                    campo = nombre if parametro is None else f"{nombre}.{parametro}"
+                    raise ValueError(f"{lugar}.{campo}: importe o porcentaje no válido: {numero!r}")
+    normalizadas['deducciones_especificas'] = deducciones
+    return normalizadas
+
+
+def _validar_escala(escala, lugar):
+    # Lista no vacía de [límite, tipo] con límites crecientes y el último infinito
+    if not isinstance(escala, list) or not escala:
+        raise ValueError(f"{lugar}: la escala debe ser una lista de tramos [límite, tipo]")
+    tramos = []
+    anterior = 0
+    for tramo in escala:
+        if not isinstance(tramo, list) or len(tramo) != 2 or not all(_es_numero(x) for x in tramo):
+            raise ValueError(f"{lugar}: tramo no válido: {tramo!r}")
+        limite, tipo = tramo
+        if limite <= anterior:
+            raise ValueError(f"{lugar}: los límites deben ser crecientes y positivos: {limite!r}")
+        if not 0 <= tipo < 1:
+            raise ValueError(f"{lugar}: tipo fuera de [0, 1): {tipo!r}")
+        tramos.append((limite, tipo))
+        anterior = limite
+    if not math.isinf(anterior):
+        raise ValueError(f"{lugar}: el último tramo debe tener límite inf")
+    return tramos
+
+
+def _es_numero(valor):
+    return isinstance(valor, (int, float)) and not isinstance(valor, bool) and not math.isnan(valor)
+
+
+# ===== CACHÉ BINARIA DE PAQUETES COMPILADOS =====
+
+_HUELLA_FICHEROS = None
+
+
+def _huella_ficheros():
+    """
+    Huella del contenido de todos los ficheros de reglas (y de los formatos)
+
+    Cubre todos los ejercicios a la vez porque uno puede heredar de otro, y
+    el código fuente de este módulo y de _MODULOS_COMPILACION: un cambio en
+    cómo se compilan las tablas invalida los paquetes guardados sin tener
+    que acordarse de subir FORMATO_CACHE. Se calcula una vez por proceso
+    leyendo los ficheros, sin interpretarlos.
+    """
+    global _HUELLA_FICHEROS
+    if _HUELLA_FICHEROS is None:
+        huella = hashlib.sha256(f"{FORMATO_CACHE}.{REVISION_REGLAS}".encode('ascii'))
+        for ejercicio in EJERCICIOS:
+            with open(_ruta_tablas(ejercicio), 'rb') as fichero:
+                huella.update(b'\0%d\0' % ejercicio)
+                huella.update(fichero.read())
+        for ruta in (__file__, *(modulo.__file__ for modulo in _MODULOS_COMPILACION)):
+            with open(ruta, 'rb') as fichero:
+                huella.update(b'\0' + os.path.basename(ruta).encode('utf-8') + b'\0')
+                huella.update(fichero.read())
+        _HUELLA_FICHEROS = huella.hexdigest()[:16]
+    return _HUELLA_FICHEROS
+
+
+def _ruta_cache(ejercicio):
+    return os.path.join(DIRECTORIO_CACHE, f"{ejercicio}.{_huella_ficheros()}.pickle")
+
+
+def _leer_cache(ejercicio):
+    """PaqueteReglas guardado para el contenido actual de las reglas, o None"""
+    if not DIRECTORIO_CACHE:
+        return None
+    try:
+        with open(_ruta_cache(ejercicio), 'rb') as fichero:
+            paquete = pickle.load(fichero)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # Caché dañada o de otra versión: se vuelve a compilar
+        return None
+    return paquete if isinstance(paquete, PaqueteReglas) and paquete.ejercicio == ejercicio else None
+
+
+def _guardar_cache(paquete):
+    """
+    Guarda el paquete compilado y borra los de contenidos anteriores
+
+    Escribe en un temporal y lo renombra, así que varios procesos pueden
+    compilar a la vez sin dejar ficheros a medias. Si el directorio no se
+    puede escribir, sigue sin caché.
+    """
+    if not DIRECTORIO_CACHE:
+        return
+    ruta = _ruta_cache(paquete.ejercicio)
+    try:
+        os.makedirs(DIRECTORIO_CACHE, exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(dir=DIRECTORIO_CACHE, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as fichero:
+                pickle.dump(paquete, fichero, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporal, ruta)
+        except BaseException:
+            os.unlink(temporal)
+            raise
+        prefijo = f"{paquete.ejercicio}."
+        for nombre in os.listdir(DIRECTORIO_CACHE):
+            if nombre.startswith(prefijo) and nombre.endswith('.pickle') and nombre != os.path.basename(ruta):
+                os.unlink(os.path.join(DIRECTORIO_CACHE, nombre))
+    except OSError:
+        pass
+
+
+_PAQUETES = {}
+
+
+def reglas_ejercicio(ejercicio=EJERCICIO_POR_DEFECTO):
+    """
+    Devuelve el PaqueteReglas de un ejercicio, cargándolo y compilándolo solo la primera vez
+
+    Busca primero el paquete compilado en la caché binaria; si no está (o
+    los ficheros de reglas cambiaron), lee y valida el TOML, lo compila y lo
+    guarda en la caché.
+
+    Args:
+        ejercicio (int): año del ejercicio fiscal
+
+    Returns:
+        PaqueteReglas
+
+    Raises:
+        ValueError: si no hay reglas para ese ejercicio o no son válidas
+    """
+    paquete = _PAQUETES.get(ejercicio)
+    if paquete is None:
+        if ejercicio not in EJERCICIOS:
+            disponibles = ', '.join(str(e) for e in EJERCICIOS)
+            raise ValueError(f"No hay reglas para el ejercicio {ejercicio!r} (disponibles: {disponibles})")
+        paquete = _leer_cache(ejercicio)
+        if paquete is None:
+            paquete = PaqueteReglas(ejercicio, cargar_tablas(ejercicio))
+            _guardar_cache(paquete)
+        _PAQUETES[ejercicio] = paquete
+    return paquete
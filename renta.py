@@ -1,136 +1,180 @@
 """
-Motor de cálculo de IRPF - España 2024 (VERSIÓN PROFESIONAL)
+Motor de cálculo de IRPF - España 2023-2025 (VERSIÓN PROFESIONAL)
 Incluye: Escalas autonómicas reales, autónomos, imputación rentas, 
          deducciones completas, compensación pérdidas
 """
 
-from deducciones_autonomicas import (
-    obtener_escala_autonomica,
-    obtener_deducciones_autonomicas,
-    calcular_deduccion_nacimiento,
-    calcular_deduccion_familia_numerosa,
-    calcular_deduccion_alquiler
-)
+from collections.abc import Mapping
+
+from escalas import compilar_escala, combinar_escalas
+from instrumentacion import medidor_activo
+from reglas import EJERCICIO_POR_DEFECTO, reglas_ejercicio
+from contribuyente import como_contribuyente
 
 
-def calcular_renta_total(datos):
+def calcular_renta_total(datos, detalle=True, cache=None, ejercicio=None):
     """
     Calcula la declaración de la renta completa con todas las mejoras
     
     Args:
-        datos: dict con todos los campos del formulario
+        datos: dict con todos los campos del formulario o DatosContribuyente
+        detalle: si es True (por defecto) devuelve un dict con todas las
+                 secciones construidas. Si es False devuelve un ResultadoRenta
+                 que calcula las cifras al momento pero construye cada
+                 sección (desgloses, datos_entrada...) solo cuando se lee.
+        cache: CacheResultados opcional. Si el perfil (con la misma versión
+               de las reglas de su ejercicio) ya se calculó, se reutilizan sus cifras.
+        ejercicio: año cuyas reglas se aplican; si no se indica, el campo
+                   'ejercicio' de `datos` (por defecto EJERCICIO_POR_DEFECTO)
     
     Returns:
-        dict con resultados detallados del cálculo
+        dict (o ResultadoRenta) con resultados detallados del cálculo
+
+    Raises:
+        ValueError: si no hay reglas para el ejercicio
     """
-    resultado = {
-        'errores': [],
-        'avisos': [],
-        'datos_entrada': datos.copy()
-    }
+    contribuyente = como_contribuyente(datos)
+    if ejercicio is not None and ejercicio != contribuyente.ejercicio:
+        contribuyente = contribuyente.reemplazar(ejercicio=ejercicio)
+        datos = {**datos, 'ejercicio': ejercicio} if isinstance(datos, dict) else contribuyente
+    if cache is None:
+        valores = _calcular_valores(contribuyente)
+    else:
+        clave = (reglas_ejercicio(contribuyente.ejercicio).version, contribuyente.como_tupla())
+        calculados = cache.obtener(clave)
+        if calculados is None:
+            calculados = _calcular_valores(contribuyente)
+            cache.guardar(clave, calculados)
+        # Copia: 'entrada' es propia de cada llamada
+        valores = calculados.copy()
+    valores['entrada'] = datos
+    if not detalle:
+        return ResultadoRenta(contribuyente, valores)
+    medidor = medidor_activo()
+    if medidor is None:
+        return _resultado_completo(contribuyente, valores)
+    medidor.empezar()
+    resultado = _resultado_completo(contribuyente, valores)
+    medidor.marca('secciones')
+    return resultado
+
+
+def _calcular_valores(datos, etapas=None, valores=None):
+    """
+    Ejecuta los PASOS 1-14 y devuelve solo las cifras, sin construir secciones
+    
+    Con un MedidorEtapas activo (instrumentacion.medir_etapas) anota el
+    tiempo de cada etapa de ETAPAS.
+    
+    Args:
+        datos: DatosContribuyente o VistaContribuyente (como_contribuyente)
+        etapas: etapas a ejecutar (por defecto, todas las de ETAPAS en orden)
+        valores: dict de cifras de partida; las etapas ejecutadas sobrescriben
+                 sus salidas y el resto se reutiliza tal cual
+    """
+    valores = {} if valores is None else valores
+    medidor = medidor_activo()
+    if medidor is None:
+        for funcion in _FUNCIONES_ETAPAS if etapas is None else (etapa.funcion for etapa in etapas):
+            funcion(datos, valores)
+        return valores
+    medidor.empezar()
+    for etapa in ETAPAS if etapas is None else etapas:
+        etapa.funcion(datos, valores)
+        medidor.marca(etapa.nombre)
+    return valores
+
 
-    # ===== PASO 1: RENDIMIENTOS DEL TRABAJO =====
-    rendimiento_trabajo_bruto = datos.get('salario', 0)
+# ===== REGLAS DEL EJERCICIO =====
+def _paso_reglas(datos, v):
+    v['reglas'] = reglas_ejercicio(datos.ejercicio)
+
+
+# ===== PASO 1: RENDIMIENTOS DEL TRABAJO =====
+def _paso_trabajo(datos, v):
+    rendimiento_trabajo_bruto = datos.salario
     
     # Reducción por obtención de rendimientos del trabajo (art. 20 LIRPF)
     reduccion_trabajo = calcular_reduccion_trabajo(rendimiento_trabajo_bruto, datos)
-    rendimiento_trabajo_neto = max(0, rendimiento_trabajo_bruto - reduccion_trabajo)
-    
-    resultado['rendimiento_trabajo'] = {
-        'bruto': rendimiento_trabajo_bruto,
-        'reduccion': reduccion_trabajo,
-        'neto': rendimiento_trabajo_neto
-    }
+    v['rendimiento_trabajo_bruto'] = rendimiento_trabajo_bruto
+    v['reduccion_trabajo'] = reduccion_trabajo
+    v['rendimiento_trabajo_neto'] = max(0, rendimiento_trabajo_bruto - reduccion_trabajo)
 
-    # ===== PASO 1B: RENDIMIENTOS DE ACTIVIDADES ECONÓMICAS (AUTÓNOMOS) =====
+
+# ===== PASO 1B: RENDIMIENTOS DE ACTIVIDADES ECONÓMICAS (AUTÓNOMOS) =====
+def _paso_actividades(datos, v):
     rendimiento_actividades = 0
-    if datos.get('es_autonomo', False):
-        ingresos_autonomo = datos.get('ingresos_autonomo', 0)
-        gastos_autonomo = datos.get('gastos_autonomo', 0)
+    ingresos_autonomo = gastos_autonomo = 0
+    if datos.es_autonomo:
+        ingresos_autonomo = datos.ingresos_autonomo
+        gastos_autonomo = datos.gastos_autonomo
         
         # Rendimiento neto = ingresos - gastos
         rendimiento_neto_actividad = max(0, ingresos_autonomo - gastos_autonomo)
         
         # Reducción adicional por actividades económicas (gastos difícil justificación)
-        if datos.get('regimen_autonomo') == 'estimacion_directa_simplificada':
+        if datos.regimen_autonomo == 'estimacion_directa_simplificada':
             # 5% adicional en simplificada (máximo 2.000€)
             reduccion_adicional = min(rendimiento_neto_actividad * 0.05, 2000)
             rendimiento_actividades = max(0, rendimiento_neto_actividad - reduccion_adicional)
         else:
             rendimiento_actividades = rendimiento_neto_actividad
-        
-        resultado['rendimiento_actividades'] = {
-            'ingresos': ingresos_autonomo,
-            'gastos': gastos_autonomo,
-            'neto': rendimiento_actividades
-        }
-    else:
-        resultado['rendimiento_actividades'] = {
-            'ingresos': 0,
-            'gastos': 0,
-            'neto': 0
-        }
+    v['ingresos_autonomo'] = ingresos_autonomo
+    v['gastos_autonomo'] = gastos_autonomo
+    v['rendimiento_actividades'] = rendimiento_actividades
 
-    # ===== PASO 2: RENDIMIENTOS DEL CAPITAL INMOBILIARIO =====
-    alquiler_bruto = datos.get('alquiler_ingresos', 0)
-    alquiler_gastos = datos.get('alquiler_gastos', 0)
-    
-    # Gastos deducibles detallados
-    gastos_detallados = {
-        'ibi': datos.get('ibi', 0),
-        'comunidad': datos.get('comunidad', 0),
-        'seguro': datos.get('seguro_hogar', 0),
-        'reparaciones': datos.get('reparaciones', 0),
-        'intereses_hipoteca': datos.get('intereses_hipoteca', 0),
-        'amortizacion': calcular_amortizacion_inmueble(datos),
-        'otros': alquiler_gastos
-    }
-    
-    total_gastos_alquiler = sum(gastos_detallados.values())
+
+def _paso_amortizacion(datos, v):
+    v['amortizacion'] = calcular_amortizacion_inmueble(datos)
+
+
+# ===== PASO 2: RENDIMIENTOS DEL CAPITAL INMOBILIARIO =====
+def _paso_capital_inmobiliario(datos, v):
+    alquiler_bruto = datos.alquiler_ingresos
+    total_gastos_alquiler = (
+        datos.ibi +
+        datos.gastos_comunidad +
+        datos.seguro_hogar +
+        datos.reparaciones +
+        datos.intereses_hipoteca +
+        v['amortizacion'] +
+        datos.alquiler_gastos
+    )
     alquiler_neto_previo = max(0, alquiler_bruto - total_gastos_alquiler)
     
     # Reducción del 60% para alquileres de vivienda (art. 23.2 LIRPF)
     # Si arrendatario es menor de 30 años: 70% (nueva normativa)
-    porcentaje_reduccion = 0.70 if datos.get('arrendatario_menor_30', False) else 0.60
+    porcentaje_reduccion = 0.70 if datos.arrendatario_menor_30 else 0.60
     reduccion_alquiler = alquiler_neto_previo * porcentaje_reduccion if alquiler_bruto > 0 else 0
-    rendimiento_capital_inmobiliario = max(0, alquiler_neto_previo - reduccion_alquiler)
-    
-    resultado['rendimiento_capital_inmobiliario'] = {
-        'ingresos': alquiler_bruto,
-        'gastos_detallados': gastos_detallados,
-        'gastos_totales': total_gastos_alquiler,
-        'neto_previo': alquiler_neto_previo,
-        'reduccion_porcentaje': porcentaje_reduccion,
-        'reduccion_importe': reduccion_alquiler,
-        'neto_final': rendimiento_capital_inmobiliario
-    }
+    v['alquiler_bruto'] = alquiler_bruto
+    v['total_gastos_alquiler'] = total_gastos_alquiler
+    v['alquiler_neto_previo'] = alquiler_neto_previo
+    v['porcentaje_reduccion'] = porcentaje_reduccion
+    v['reduccion_alquiler'] = reduccion_alquiler
+    v['rendimiento_capital_inmobiliario'] = max(0, alquiler_neto_previo - reduccion_alquiler)
 
-    # ===== PASO 2B: IMPUTACIÓN DE RENTAS INMOBILIARIAS =====
+
+# ===== PASO 2B: IMPUTACIÓN DE RENTAS INMOBILIARIAS =====
+def _paso_imputacion_rentas(datos, v):
     # Segunda vivienda no alquilada: 1,1% o 2% del valor catastral
     imputacion_rentas = 0
-    if datos.get('tiene_segunda_vivienda', False):
-        valor_catastral = datos.get('valor_catastral_segunda', 0)
-        porcentaje = 0.02 if datos.get('valor_catastral_revisado', False) else 0.011
-        imputacion_rentas = valor_catastral * porcentaje
-        
-        resultado['imputacion_rentas'] = {
-            'valor_catastral': valor_catastral,
-            'porcentaje': porcentaje * 100,
-            'importe': imputacion_rentas
-        }
+    porcentaje_imputacion = 0
+    if datos.tiene_segunda_vivienda:
+        porcentaje_imputacion = 0.02 if datos.valor_catastral_revisado else 0.011
+        imputacion_rentas = datos.valor_catastral_segunda * porcentaje_imputacion
+    v['porcentaje_imputacion'] = porcentaje_imputacion
+    v['imputacion_rentas'] = imputacion_rentas
 
-    # ===== PASO 3: RENDIMIENTOS DEL CAPITAL MOBILIARIO =====
-    rendimiento_capital_mobiliario = datos.get('dividendos', 0) + datos.get('intereses', 0)
-    
-    resultado['rendimiento_capital_mobiliario'] = {
-        'dividendos': datos.get('dividendos', 0),
-        'intereses': datos.get('intereses', 0),
-        'total': rendimiento_capital_mobiliario
-    }
 
-    # ===== PASO 4: GANANCIAS Y PÉRDIDAS PATRIMONIALES =====
-    ganancias_brutas = datos.get('ganancias', 0)
-    perdidas = datos.get('perdidas_patrimoniales', 0)
+# ===== PASO 3: RENDIMIENTOS DEL CAPITAL MOBILIARIO =====
+def _paso_capital_mobiliario(datos, v):
+    v['rendimiento_capital_mobiliario'] = datos.dividendos + datos.intereses
+
+
+# ===== PASO 4: GANANCIAS Y PÉRDIDAS PATRIMONIALES =====
+def _paso_ganancias(datos, v):
+    ganancias_brutas = datos.ganancias
+    perdidas = datos.perdidas_patrimoniales
     
     # Compensación de pérdidas (art. 49 LIRPF)
     # Las pérdidas se compensan primero con ganancias del mismo año
@@ -138,166 +182,716 @@ def calcular_renta_total(datos):
     perdidas_pendientes = max(0, perdidas - ganancias_brutas)
     
     # Pérdidas de años anteriores pendientes de compensar
-    perdidas_anos_anteriores = datos.get('perdidas_pendientes_anos_anteriores', 0)
-    ganancias_tras_compensacion = max(0, ganancias_netas - perdidas_anos_anteriores)
-    perdidas_pendientes_futuro = max(0, perdidas_pendientes + (perdidas_anos_anteriores - ganancias_netas))
-    
-    resultado['ganancias_patrimoniales'] = {
-        'ganancias_brutas': ganancias_brutas,
-        'perdidas_ejercicio': perdidas,
-        'ganancias_netas': ganancias_netas,
-        'perdidas_anos_anteriores': perdidas_anos_anteriores,
-        'ganancias_final': ganancias_tras_compensacion,
-        'perdidas_pendientes_compensar': perdidas_pendientes_futuro
-    }
-    
-    if perdidas_pendientes_futuro > 0:
-        resultado['avisos'].append(
-            f"Tienes {perdidas_pendientes_futuro:,.2f}€ en pérdidas pendientes de compensar en ejercicios futuros (hasta 4 años)"
-        )
+    perdidas_anos_anteriores = datos.perdidas_pendientes_anos_anteriores
+    v['ganancias_brutas'] = ganancias_brutas
+    v['perdidas'] = perdidas
+    v['ganancias_netas'] = ganancias_netas
+    v['perdidas_anos_anteriores'] = perdidas_anos_anteriores
+    v['ganancias_tras_compensacion'] = max(0, ganancias_netas - perdidas_anos_anteriores)
+    v['perdidas_pendientes_futuro'] = max(0, perdidas_pendientes + (perdidas_anos_anteriores - ganancias_netas))
 
-    # ===== PASO 5: BASE IMPONIBLE GENERAL =====
-    base_imponible_general = (
-        rendimiento_trabajo_neto +
-        rendimiento_actividades +
-        rendimiento_capital_inmobiliario +
-        imputacion_rentas
+
+# ===== PASO 5: BASE IMPONIBLE GENERAL =====
+def _paso_base_imponible_general(datos, v):
+    # Antes de reducciones: el PASO 7 la reduce
+    v['base_imponible_general_previa'] = (
+        v['rendimiento_trabajo_neto'] +
+        v['rendimiento_actividades'] +
+        v['rendimiento_capital_inmobiliario'] +
+        v['imputacion_rentas']
     )
 
-    # ===== PASO 6: BASE IMPONIBLE DEL AHORRO =====
-    base_imponible_ahorro = (
-        rendimiento_capital_mobiliario +
-        ganancias_tras_compensacion
+
+# ===== PASO 6: BASE IMPONIBLE DEL AHORRO =====
+def _paso_base_imponible_ahorro(datos, v):
+    v['base_imponible_ahorro'] = (
+        v['rendimiento_capital_mobiliario'] +
+        v['ganancias_tras_compensacion']
     )
 
-    # ===== PASO 7: REDUCCIONES DE LA BASE IMPONIBLE =====
-    reducciones_totales = 0
-    
+
+# ===== PASO 7-8: REDUCCIONES DE LA BASE IMPONIBLE Y BASE LIQUIDABLE GENERAL =====
+def _paso_reducciones(datos, v):
     # 7.1 Plan de pensiones (máximo 1.500€ general)
-    plan_pensiones = min(datos.get('plan_pensiones', 0), 1500)
-    reducciones_totales += plan_pensiones
+    plan_pensiones = min(datos.plan_pensiones, 1500)
     
     # 7.2 Aportaciones a mutualidades (autónomos)
-    if datos.get('es_autonomo', False):
-        mutualidad = min(datos.get('mutualidad', 0), 1500)
-        reducciones_totales += mutualidad
-    else:
-        mutualidad = 0
+    mutualidad = min(datos.mutualidad, 1500) if datos.es_autonomo else 0
     
     # 7.3 Pensiones compensatorias
-    pensiones_compensatorias = datos.get('pensiones_compensatorias', 0)
-    reducciones_totales += pensiones_compensatorias
+    pensiones_compensatorias = datos.pensiones_compensatorias
     
-    base_imponible_general -= reducciones_totales
-    base_imponible_general = max(0, base_imponible_general)
+    reducciones_totales = plan_pensiones + mutualidad + pensiones_compensatorias
+    base_imponible_general = max(0, v['base_imponible_general_previa'] - reducciones_totales)
+    v['plan_pensiones'] = plan_pensiones
+    v['mutualidad'] = mutualidad
+    v['pensiones_compensatorias'] = pensiones_compensatorias
+    v['reducciones_totales'] = reducciones_totales
+    v['base_imponible_general'] = base_imponible_general
 
-    resultado['reducciones_base'] = {
-        'plan_pensiones': plan_pensiones,
-        'mutualidad': mutualidad,
-        'pensiones_compensatorias': pensiones_compensatorias,
-        'total': reducciones_totales
-    }
+    # PASO 8: la base liquidable general es la base imponible reducida
+    v['base_liquidable_general'] = base_imponible_general
 
-    # ===== PASO 8: BASE LIQUIDABLE GENERAL =====
-    base_liquidable_general = base_imponible_general
 
-    # ===== PASO 9: MÍNIMO PERSONAL Y FAMILIAR =====
-    minimo_personal_familiar = calcular_minimo_personal_familiar(datos)
-    
-    resultado['minimo_personal_familiar'] = minimo_personal_familiar
+# ===== PASO 9: MÍNIMO PERSONAL Y FAMILIAR =====
+def _paso_minimo(datos, v):
+    v['minimo_personal_familiar'] = calcular_minimo_personal_familiar(datos)
 
-    # ===== PASO 10: BASE LIQUIDABLE SOMETIDA A GRAVAMEN =====
-    base_gravamen_general = max(0, base_liquidable_general - minimo_personal_familiar['total'])
 
-    # ===== PASO 11: CUOTA ÍNTEGRA ESTATAL Y AUTONÓMICA =====
-    # Escala general estatal (50% del tipo)
-    cuota_estatal_general, desglose_estatal = calcular_cuota_escala(
-        base_gravamen_general,
-        ESCALA_ESTATAL_GENERAL
-    )
+# ===== PASO 10: BASE LIQUIDABLE SOMETIDA A GRAVAMEN =====
+def _paso_base_gravamen(datos, v):
+    v['base_gravamen_general'] = max(0, v['base_liquidable_general'] - v['minimo_personal_familiar']['total'])
 
-    # Escala general autonómica REAL según comunidad
-    escala_autonomica = obtener_escala_autonomica(datos.get('comunidad', 'Madrid'))
-    cuota_autonomica_general, desglose_autonomico = calcular_cuota_escala(
-        base_gravamen_general,
-        escala_autonomica
-    )
+
+# ===== PASO 11: CUOTA ÍNTEGRA ESTATAL Y AUTONÓMICA =====
+def _paso_cuotas_integras(datos, v):
+    base_gravamen_general = v['base_gravamen_general']
+    base_imponible_ahorro = v['base_imponible_ahorro']
+    reglas = v['reglas']
+
+    # Escala general estatal (50% del tipo) y autonómica REAL según comunidad,
+    # combinadas: una sola búsqueda da las dos cuotas
+    escala_general = reglas.general_combinada(datos.comunidad)
+    cuota_estatal_general, cuota_autonomica_general = escala_general.cuota_partes(base_gravamen_general)
 
     # Escala del ahorro
-    cuota_estatal_ahorro, desglose_ahorro_est = calcular_cuota_escala(
-        base_imponible_ahorro,
-        ESCALA_AHORRO_ESTATAL
-    )
-    
-    cuota_autonomica_ahorro, desglose_ahorro_aut = calcular_cuota_escala(
-        base_imponible_ahorro,
-        ESCALA_AHORRO_AUTONOMICA
+    cuota_estatal_ahorro, cuota_autonomica_ahorro = reglas.ahorro_combinada.cuota_partes(base_imponible_ahorro)
+
+    v['escala_general'] = escala_general
+    v['escala_autonomica'] = escala_general.partes[1]
+    v['cuota_estatal_general'] = cuota_estatal_general
+    v['cuota_autonomica_general'] = cuota_autonomica_general
+    v['cuota_estatal_ahorro'] = cuota_estatal_ahorro
+    v['cuota_autonomica_ahorro'] = cuota_autonomica_ahorro
+    v['cuota_integra_estatal'] = cuota_estatal_general + cuota_estatal_ahorro
+    v['cuota_integra_autonomica'] = cuota_autonomica_general + cuota_autonomica_ahorro
+
+
+# ===== PASO 12: DEDUCCIONES DE LA CUOTA =====
+def _paso_deducciones(datos, v):
+    v['deducciones'] = calcular_deducciones_completas(
+        datos, v['cuota_integra_estatal'], v['cuota_integra_autonomica'], v['reglas']
     )
 
-    cuota_integra_estatal = cuota_estatal_general + cuota_estatal_ahorro
-    cuota_integra_autonomica = cuota_autonomica_general + cuota_autonomica_ahorro
-    cuota_integra_total = cuota_integra_estatal + cuota_integra_autonomica
 
-    resultado['cuotas_integras'] = {
-        'estatal_general': cuota_estatal_general,
-        'estatal_ahorro': cuota_estatal_ahorro,
-        'estatal_total': cuota_integra_estatal,
-        'autonomica_general': cuota_autonomica_general,
-        'autonomica_ahorro': cuota_autonomica_ahorro,
-        'autonomica_total': cuota_integra_autonomica,
-        'total': cuota_integra_total,
-        'desglose_estatal_general': desglose_estatal,
-        'desglose_autonomico_general': desglose_autonomico,
-        'desglose_ahorro_estatal': desglose_ahorro_est,
-        'desglose_ahorro_autonomico': desglose_ahorro_aut
-    }
+# ===== PASO 13: CUOTA LÍQUIDA =====
+def _paso_cuota_liquida(datos, v):
+    deducciones = v['deducciones']
+    cuota_liquida_estatal = max(0, v['cuota_integra_estatal'] - deducciones['total_estatal'])
+    cuota_liquida_autonomica = max(0, v['cuota_integra_autonomica'] - deducciones['total_autonomica'])
+    v['cuota_liquida_estatal'] = cuota_liquida_estatal
+    v['cuota_liquida_autonomica'] = cuota_liquida_autonomica
+    v['cuota_liquida_total'] = cuota_liquida_estatal + cuota_liquida_autonomica
 
-    # ===== PASO 12: DEDUCCIONES DE LA CUOTA =====
-    deducciones = calcular_deducciones_completas(datos, cuota_integra_estatal, cuota_integra_autonomica)
-    
-    resultado['deducciones'] = deducciones
 
-    # ===== PASO 13: CUOTA LÍQUIDA =====
-    cuota_liquida_estatal = max(0, cuota_integra_estatal - deducciones['total_estatal'])
-    cuota_liquida_autonomica = max(0, cuota_integra_autonomica - deducciones['total_autonomica'])
-    cuota_liquida_total = cuota_liquida_estatal + cuota_liquida_autonomica
+# ===== PASO 14: CUOTA DIFERENCIAL =====
+def _paso_cuota_diferencial(datos, v):
+    retenciones = datos.retenciones
+    pagos_fraccionados = datos.pagos_fraccionados_autonomo if datos.es_autonomo else 0
+    total_pagado = retenciones + pagos_fraccionados
+    v['retenciones'] = retenciones
+    v['pagos_fraccionados'] = pagos_fraccionados
+    v['total_pagado'] = total_pagado
+    v['cuota_diferencial'] = v['cuota_liquida_total'] - total_pagado
+
 
-    resultado['cuotas_liquidas'] = {
-        'estatal': cuota_liquida_estatal,
-        'autonomica': cuota_liquida_autonomica,
-        'total': cuota_liquida_total
+# ===== TIPOS MEDIO Y MARGINAL =====
+def _paso_tipos(datos, v):
+    base_total = v['base_imponible_general'] + v['base_imponible_ahorro']
+    v['tipo_medio'] = (v['cuota_liquida_total'] / base_total * 100) if base_total > 0 else 0
+    v['tipo_marginal'] = v['escala_general'].tipo(v['base_gravamen_general']) * 100
+    v['tipo_marginal_ahorro'] = v['reglas'].ahorro_combinada.tipo(v['base_imponible_ahorro']) * 100
+
+
+class Etapa:
+    """
+    Etapa del cálculo en el grafo de dependencias
+
+    Atributos:
+        nombre (str): nombre de la etapa (también en la instrumentación)
+        funcion: función (datos, valores) que escribe sus salidas en `valores`
+        campos (tuple): campos de DatosContribuyente que lee
+        entradas (tuple): cifras de otras etapas que lee
+        salidas (tuple): cifras que escribe
+    """
+
+    __slots__ = ('nombre', 'funcion', 'campos', 'entradas', 'salidas')
+
+    def __init__(self, nombre, funcion, campos, entradas, salidas):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.campos = frozenset(campos)
+        self.entradas = tuple(entradas)
+        self.salidas = tuple(salidas)
+
+    def __repr__(self):
+        return f"Etapa({self.nombre!r})"
+
+
+# Grafo del cálculo: cada etapa con lo que lee y lo que escribe, en orden
+# topológico. recalcular_renta() lo usa para repetir solo las etapas
+# afectadas por los campos que cambian.
+ETAPAS = (
+    Etapa(
+        'reglas_ejercicio', _paso_reglas,
+        campos=('ejercicio',),
+        entradas=(),
+        salidas=('reglas',)
+    ),
+    Etapa(
+        'PASO 1: rendimientos del trabajo', _paso_trabajo,
+        campos=('salario',),
+        entradas=(),
+        salidas=('rendimiento_trabajo_bruto', 'reduccion_trabajo', 'rendimiento_trabajo_neto')
+    ),
+    Etapa(
+        'PASO 1B: rendimientos de actividades económicas', _paso_actividades,
+        campos=('es_autonomo', 'regimen_autonomo', 'ingresos_autonomo', 'gastos_autonomo'),
+        entradas=(),
+        salidas=('ingresos_autonomo', 'gastos_autonomo', 'rendimiento_actividades')
+    ),
+    Etapa(
+        'calcular_amortizacion_inmueble', _paso_amortizacion,
+        campos=('alquiler_ingresos', 'valor_construccion_alquiler', 'valor_compra_inmueble'),
+        entradas=(),
+        salidas=('amortizacion',)
+    ),
+    Etapa(
+        'PASO 2: rendimientos del capital inmobiliario', _paso_capital_inmobiliario,
+        campos=(
+            'alquiler_ingresos', 'ibi', 'gastos_comunidad', 'seguro_hogar', 'reparaciones',
+            'intereses_hipoteca', 'alquiler_gastos', 'arrendatario_menor_30'
+        ),
+        entradas=('amortizacion',),
+        salidas=(
+            'alquiler_bruto', 'total_gastos_alquiler', 'alquiler_neto_previo', 'porcentaje_reduccion',
+            'reduccion_alquiler', 'rendimiento_capital_inmobiliario'
+        )
+    ),
+    Etapa(
+        'PASO 2B: imputación de rentas inmobiliarias', _paso_imputacion_rentas,
+        campos=('tiene_segunda_vivienda', 'valor_catastral_revisado', 'valor_catastral_segunda'),
+        entradas=(),
+        salidas=('porcentaje_imputacion', 'imputacion_rentas')
+    ),
+    Etapa(
+        'PASO 3: rendimientos del capital mobiliario', _paso_capital_mobiliario,
+        campos=('dividendos', 'intereses'),
+        entradas=(),
+        salidas=('rendimiento_capital_mobiliario',)
+    ),
+    Etapa(
+        'PASO 4: ganancias y pérdidas patrimoniales', _paso_ganancias,
+        campos=('ganancias', 'perdidas_patrimoniales', 'perdidas_pendientes_anos_anteriores'),
+        entradas=(),
+        salidas=(
+            'ganancias_brutas', 'perdidas', 'ganancias_netas', 'perdidas_anos_anteriores',
+            'ganancias_tras_compensacion', 'perdidas_pendientes_futuro'
+        )
+    ),
+    Etapa(
+        'PASO 5: base imponible general', _paso_base_imponible_general,
+        campos=(),
+        entradas=(
+            'rendimiento_trabajo_neto', 'rendimiento_actividades', 'rendimiento_capital_inmobiliario',
+            'imputacion_rentas'
+        ),
+        salidas=('base_imponible_general_previa',)
+    ),
+    Etapa(
+        'PASO 6: base imponible del ahorro', _paso_base_imponible_ahorro,
+        campos=(),
+        entradas=('rendimiento_capital_mobiliario', 'ganancias_tras_compensacion'),
+        salidas=('base_imponible_ahorro',)
+    ),
+    Etapa(
+        'PASO 7-8: reducciones y base liquidable general', _paso_reducciones,
+        campos=('plan_pensiones', 'mutualidad', 'es_autonomo', 'pensiones_compensatorias'),
+        entradas=('base_imponible_general_previa',),
+        salidas=(
+            'plan_pensiones', 'mutualidad', 'pensiones_compensatorias', 'reducciones_totales',
+            'base_imponible_general', 'base_liquidable_general'
+        )
+    ),
+    Etapa(
+        'PASO 9: calcular_minimo_personal_familiar', _paso_minimo,
+        campos=(
+            'edad', 'discapacidad', 'grado_discapacidad', 'hijos_menores_3', 'hijos_mayores_3',
+            'hijos_con_discapacidad', 'ascendientes_mayores_65_a_cargo', 'ascendientes_mayores_75_a_cargo'
+        ),
+        entradas=(),
+        salidas=('minimo_personal_familiar',)
+    ),
+    Etapa(
+        'PASO 10: base liquidable sometida a gravamen', _paso_base_gravamen,
+        campos=(),
+        entradas=('base_liquidable_general', 'minimo_personal_familiar'),
+        salidas=('base_gravamen_general',)
+    ),
+    Etapa(
+        'PASO 11: cuota íntegra estatal y autonómica', _paso_cuotas_integras,
+        campos=('comunidad',),
+        entradas=('reglas', 'base_gravamen_general', 'base_imponible_ahorro'),
+        salidas=(
+            'escala_general', 'escala_autonomica', 'cuota_estatal_general', 'cuota_autonomica_general',
+            'cuota_estatal_ahorro', 'cuota_autonomica_ahorro', 'cuota_integra_estatal',
+            'cuota_integra_autonomica'
+        )
+    ),
+    Etapa(
+        'PASO 12: calcular_deducciones_completas', _paso_deducciones,
+        campos=(
+            'comunidad', 'edad', 'vivienda_habitual', 'vivienda_importe', 'donaciones',
+            'donacion_plurianual', 'maternidad', 'hijos_menores_3', 'hijos_mayores_3',
+            'familia_numerosa', 'familia_numerosa_especial', 'nacimiento_ultimo_ano',
+            'alquiler_vivienda_habitual_pagado', 'gastos_guarderia'
+        ),
+        entradas=('reglas', 'cuota_integra_estatal', 'cuota_integra_autonomica'),
+        salidas=('deducciones',)
+    ),
+    Etapa(
+        'PASO 13: cuota líquida', _paso_cuota_liquida,
+        campos=(),
+        entradas=('cuota_integra_estatal', 'cuota_integra_autonomica', 'deducciones'),
+        salidas=('cuota_liquida_estatal', 'cuota_liquida_autonomica', 'cuota_liquida_total')
+    ),
+    Etapa(
+        'PASO 14: cuota diferencial', _paso_cuota_diferencial,
+        campos=('retenciones', 'pagos_fraccionados_autonomo', 'es_autonomo'),
+        entradas=('cuota_liquida_total',),
+        salidas=('retenciones', 'pagos_fraccionados', 'total_pagado', 'cuota_diferencial')
+    ),
+    Etapa(
+        'calcular_tipo_marginal', _paso_tipos,
+        campos=(),
+        entradas=(
+            'reglas', 'base_imponible_general', 'base_imponible_ahorro', 'cuota_liquida_total',
+            'base_gravamen_general', 'escala_general'
+        ),
+        salidas=('tipo_medio', 'tipo_marginal', 'tipo_marginal_ahorro')
+    ),
+)
+
+# Funciones de ETAPAS en orden, para el cálculo completo sin instrumentación
+_FUNCIONES_ETAPAS = tuple(etapa.funcion for etapa in ETAPAS)
+
+_ETAPAS_AFECTADAS = {}
+
+
+def etapas_afectadas(campos):
+    """
+    Etapas que hay que repetir cuando cambian `campos`, en orden de ETAPAS
+
+    Una etapa se repite si lee alguno de los campos o alguna cifra escrita
+    por otra etapa que se repite.
+
+    Args:
+        campos: nombres de campos de DatosContribuyente
+
+    Returns:
+        tuple de Etapa
+    """
+    campos = frozenset(campos)
+    afectadas = _ETAPAS_AFECTADAS.get(campos)
+    if afectadas is None:
+        sucias = set()
+        lista = []
+        for etapa in ETAPAS:
+            if etapa.campos & campos or sucias.intersection(etapa.entradas):
+                lista.append(etapa)
+                sucias.update(etapa.salidas)
+        afectadas = _ETAPAS_AFECTADAS[campos] = tuple(lista)
+    return afectadas
+
+
+def recalcular_renta(base, cambios, detalle=False):
+    """
+    Recalcula un escenario «¿y si...?» a partir de un resultado ya calculado
+
+    Solo repite las etapas que dependen de los campos cambiados; el resto de
+    cifras se reutilizan del escenario base.
+
+    Args:
+        base: ResultadoRenta del escenario base (calcular_renta_total(..., detalle=False))
+        cambios (dict): campo -> nuevo valor
+        detalle: como en calcular_renta_total
+
+    Returns:
+        ResultadoRenta (o dict si detalle=True) del nuevo escenario
+
+    Raises:
+        ValueError: si algún campo de `cambios` no existe o su valor no es
+                    válido (se convierten como los de un fichero de lotes)
+    """
+    from lotes import convertir_campos
+
+    cambios = convertir_campos(cambios)
+    datos = base._datos
+    cambiados = {
+        campo: valor for campo, valor in cambios.items()
+        if getattr(datos, campo) != valor
     }
+    valores = base._valores.copy()
+    if cambiados:
+        datos = datos.reemplazar(**cambiados)
+        _calcular_valores(datos, etapas_afectadas(cambiados), valores)
+    entrada = valores['entrada']
+    valores['entrada'] = {**entrada, **cambios} if isinstance(entrada, dict) else datos
+    resultado = ResultadoRenta(datos, valores)
+    return resultado.como_dict() if detalle else resultado
 
-    # ===== PASO 14: CUOTA DIFERENCIAL =====
-    retenciones = datos.get('retenciones', 0)
-    pagos_fraccionados = datos.get('pagos_fraccionados_autonomo', 0) if datos.get('es_autonomo', False) else 0
-    total_pagado = retenciones + pagos_fraccionados
-    
-    cuota_diferencial = cuota_liquida_total - total_pagado
 
+def comparar_comunidades(datos, comunidades=None):
+    """
+    Calcula la declaración de `datos` en cada comunidad autónoma
+
+    Las etapas que no dependen de la comunidad (PASOS 1-10, hasta la base
+    liquidable sometida a gravamen) se calculan una sola vez; para cada
+    comunidad solo se repiten las cuotas, deducciones y tipos.
+
+    Args:
+        datos: dict del formulario o DatosContribuyente
+        comunidades: comunidades a comparar (por defecto, todas las del ejercicio de `datos`)
+
+    Returns:
+        list de dicts ordenada de menor a mayor cuota diferencial, con
+        posicion, comunidad, cuota_integra, deducciones_autonomicas,
+        cuota_liquida, cuota_diferencial, tipo_medio, tipo_marginal y
+        diferencia (respecto a la comunidad de `datos`)
+    """
+    base = calcular_renta_total(datos, detalle=False)
+    if comunidades is None:
+        comunidades = base._valores['reglas'].escalas_autonomicas
+    cuota_propia = base._valores['cuota_diferencial']
+
+    filas = []
+    for comunidad in comunidades:
+        v = recalcular_renta(base, {'comunidad': comunidad})._valores
+        filas.append({
+            'comunidad': comunidad,
+            'cuota_integra': v['cuota_integra_estatal'] + v['cuota_integra_autonomica'],
+            'deducciones_autonomicas': v['deducciones']['total_autonomica'],
+            'cuota_liquida': v['cuota_liquida_total'],
+            'cuota_diferencial': v['cuota_diferencial'],
+            'tipo_medio': v['tipo_medio'],
+            'tipo_marginal': v['tipo_marginal'],
+            'diferencia': v['cuota_diferencial'] - cuota_propia
+        })
+
+    filas.sort(key=lambda fila: fila['cuota_diferencial'])
+    for posicion, fila in enumerate(filas, start=1):
+        fila['posicion'] = posicion
+    return filas
+
+
+class ResultadoRenta(Mapping):
+    """
+    Resultado de calcular_renta_total con las secciones construidas a demanda
+
+    Se comporta como el dict de resultados (resultado['resumen'],
+    resultado.get('avisos'), iteración...), pero cada sección se construye
+    la primera vez que se lee. Las cifras ya están calculadas: leer una
+    sección solo reorganiza valores, nunca repite el cálculo.
+
+    `datos_entrada` se copia al leerse, así que el dict de entrada no debe modificarse
+    mientras el resultado esté en uso.
+    """
+
+    __slots__ = ('_datos', '_valores', '_secciones')
+
+    def __init__(self, datos, valores):
+        self._datos = datos
+        self._valores = valores
+        self._secciones = {}
+
+    def __getitem__(self, clave):
+        secciones = self._secciones
+        if clave in secciones:
+            return secciones[clave]
+        if clave not in self._claves():
+            raise KeyError(clave)
+        seccion = secciones[clave] = _SECCIONES[clave](self._datos, self._valores)
+        return seccion
+
+    def __contains__(self, clave):
+        return clave in self._claves()
+
+    def __iter__(self):
+        return iter(self._claves())
+
+    def __len__(self):
+        return len(self._claves())
+
+    def __repr__(self):
+        return f"ResultadoRenta(cuota_diferencial={self._valores['cuota_diferencial']!r})"
+
+    def _claves(self):
+        if self._datos.tiene_segunda_vivienda:
+            return _CLAVES_CON_IMPUTACION
+        return _CLAVES_SIN_IMPUTACION
+
+    def como_dict(self):
+        """Construye todas las secciones de una vez y devuelve un dict normal"""
+        return _resultado_completo(self._datos, self._valores)
+
+    def copia(self):
+        """
+        Devuelve un ResultadoRenta con las mismas cifras y ninguna sección construida
+
+        Las secciones de la copia son objetos nuevos: modificarlas no afecta
+        a este resultado. Las cifras no se recalculan.
+        """
+        return ResultadoRenta(self._datos, self._valores.copy())
+
+
+def _resultado_completo(datos, v):
+    """
+    Construye el dict de resultados completo en una sola pasada
+
+    Es lo que devuelve calcular_renta_total con detalle=True: cada sección
+    se escribe aquí directamente, sin pasar por los constructores de
+    _SECCIONES (que usa ResultadoRenta para construir solo las que se leen).
+    Las dos versiones tienen que dar las mismas secciones.
+    """
+    reglas = v['reglas']
+    base_gravamen_general = v['base_gravamen_general']
+    base_imponible_ahorro = v['base_imponible_ahorro']
+    cuota_diferencial = v['cuota_diferencial']
+    avisos = []
+    if v['perdidas_pendientes_futuro'] > 0:
+        avisos.append(
+            f"Tienes {v['perdidas_pendientes_futuro']:,.2f}€ en pérdidas pendientes de compensar en ejercicios futuros (hasta 4 años)"
+        )
+    resultado = {
+        'errores': [],
+        'avisos': avisos,
+        'datos_entrada': _copiar_entrada(v['entrada']),
+        'rendimiento_trabajo': {
+            'bruto': v['rendimiento_trabajo_bruto'],
+            'reduccion': v['reduccion_trabajo'],
+            'neto': v['rendimiento_trabajo_neto']
+        },
+        'rendimiento_actividades': {
+            'ingresos': v['ingresos_autonomo'],
+            'gastos': v['gastos_autonomo'],
+            'neto': v['rendimiento_actividades']
+        },
+        'rendimiento_capital_inmobiliario': {
+            'ingresos': v['alquiler_bruto'],
+            'gastos_detallados': {
+                'ibi': datos.ibi,
+                'comunidad': datos.gastos_comunidad,
+                'seguro': datos.seguro_hogar,
+                'reparaciones': datos.reparaciones,
+                'intereses_hipoteca': datos.intereses_hipoteca,
+                'amortizacion': v['amortizacion'],
+                'otros': datos.alquiler_gastos
+            },
+            'gastos_totales': v['total_gastos_alquiler'],
+            'neto_previo': v['alquiler_neto_previo'],
+            'reduccion_porcentaje': v['porcentaje_reduccion'],
+            'reduccion_importe': v['reduccion_alquiler'],
+            'neto_final': v['rendimiento_capital_inmobiliario']
+        }
+    }
+    if datos.tiene_segunda_vivienda:
+        resultado['imputacion_rentas'] = {
+            'valor_catastral': datos.valor_catastral_segunda,
+            'porcentaje': v['porcentaje_imputacion'] * 100,
+            'importe': v['imputacion_rentas']
+        }
+    resultado['rendimiento_capital_mobiliario'] = {
+        'dividendos': datos.dividendos,
+        'intereses': datos.intereses,
+        'total': v['rendimiento_capital_mobiliario']
+    }
+    resultado['ganancias_patrimoniales'] = {
+        'ganancias_brutas': v['ganancias_brutas'],
+        'perdidas_ejercicio': v['perdidas'],
+        'ganancias_netas': v['ganancias_netas'],
+        'perdidas_anos_anteriores': v['perdidas_anos_anteriores'],
+        'ganancias_final': v['ganancias_tras_compensacion'],
+        'perdidas_pendientes_compensar': v['perdidas_pendientes_futuro']
+    }
+    resultado['reducciones_base'] = {
+        'plan_pensiones': v['plan_pensiones'],
+        'mutualidad': v['mutualidad'],
+        'pensiones_compensatorias': v['pensiones_compensatorias'],
+        'total': v['reducciones_totales']
+    }
+    resultado['minimo_personal_familiar'] = v['minimo_personal_familiar'].copy()
+    resultado['cuotas_integras'] = {
+        'estatal_general': v['cuota_estatal_general'],
+        'estatal_ahorro': v['cuota_estatal_ahorro'],
+        'estatal_total': v['cuota_integra_estatal'],
+        'autonomica_general': v['cuota_autonomica_general'],
+        'autonomica_ahorro': v['cuota_autonomica_ahorro'],
+        'autonomica_total': v['cuota_integra_autonomica'],
+        'total': v['cuota_integra_estatal'] + v['cuota_integra_autonomica'],
+        'desglose_estatal_general': reglas.estatal_general.desglose(base_gravamen_general),
+        'desglose_autonomico_general': v['escala_autonomica'].desglose(base_gravamen_general),
+        'desglose_ahorro_estatal': reglas.ahorro_estatal.desglose(base_imponible_ahorro),
+        'desglose_ahorro_autonomico': reglas.ahorro_autonomica.desglose(base_imponible_ahorro)
+    }
+    resultado['deducciones'] = v['deducciones'].copy()
+    resultado['cuotas_liquidas'] = {
+        'estatal': v['cuota_liquida_estatal'],
+        'autonomica': v['cuota_liquida_autonomica'],
+        'total': v['cuota_liquida_total']
+    }
     resultado['cuota_diferencial'] = {
-        'cuota_liquida': cuota_liquida_total,
-        'retenciones': retenciones,
-        'pagos_fraccionados': pagos_fraccionados,
-        'total_pagado': total_pagado,
+        'cuota_liquida': v['cuota_liquida_total'],
+        'retenciones': v['retenciones'],
+        'pagos_fraccionados': v['pagos_fraccionados'],
+        'total_pagado': v['total_pagado'],
         'diferencial': cuota_diferencial,
         'resultado': 'A PAGAR' if cuota_diferencial > 0 else 'A DEVOLVER',
         'importe': abs(cuota_diferencial)
     }
-
-    # ===== RESUMEN FINAL =====
     resultado['resumen'] = {
-        'base_imponible_general': base_imponible_general,
+        'base_imponible_general': v['base_imponible_general'],
         'base_imponible_ahorro': base_imponible_ahorro,
-        'base_liquidable_general': base_liquidable_general,
+        'base_liquidable_general': v['base_liquidable_general'],
         'base_gravamen_general': base_gravamen_general,
-        'tipo_medio': (cuota_liquida_total / (base_imponible_general + base_imponible_ahorro) * 100) if (base_imponible_general + base_imponible_ahorro) > 0 else 0,
-        'tipo_marginal': calcular_tipo_marginal(base_gravamen_general, escala_autonomica)
+        'tipo_medio': v['tipo_medio'],
+        'tipo_marginal': v['tipo_marginal'],
+        'tipo_marginal_ahorro': v['tipo_marginal_ahorro']
     }
-
     return resultado
 
 
+def _seccion_avisos(datos, v):
+    avisos = []
+    if v['perdidas_pendientes_futuro'] > 0:
+        avisos.append(
+            f"Tienes {v['perdidas_pendientes_futuro']:,.2f}€ en pérdidas pendientes de compensar en ejercicios futuros (hasta 4 años)"
+        )
+    return avisos
+
+
+def _seccion_rendimiento_capital_inmobiliario(datos, v):
+    gastos_detallados = {
+        'ibi': datos.ibi,
+        'comunidad': datos.gastos_comunidad,
+        'seguro': datos.seguro_hogar,
+        'reparaciones': datos.reparaciones,
+        'intereses_hipoteca': datos.intereses_hipoteca,
+        'amortizacion': v['amortizacion'],
+        'otros': datos.alquiler_gastos
+    }
+    return {
+        'ingresos': v['alquiler_bruto'],
+        'gastos_detallados': gastos_detallados,
+        'gastos_totales': v['total_gastos_alquiler'],
+        'neto_previo': v['alquiler_neto_previo'],
+        'reduccion_porcentaje': v['porcentaje_reduccion'],
+        'reduccion_importe': v['reduccion_alquiler'],
+        'neto_final': v['rendimiento_capital_inmobiliario']
+    }
+
+
+def _seccion_cuotas_integras(datos, v):
+    base_gravamen_general = v['base_gravamen_general']
+    base_imponible_ahorro = v['base_imponible_ahorro']
+    reglas = v['reglas']
+    return {
+        'estatal_general': v['cuota_estatal_general'],
+        'estatal_ahorro': v['cuota_estatal_ahorro'],
+        'estatal_total': v['cuota_integra_estatal'],
+        'autonomica_general': v['cuota_autonomica_general'],
+        'autonomica_ahorro': v['cuota_autonomica_ahorro'],
+        'autonomica_total': v['cuota_integra_autonomica'],
+        'total': v['cuota_integra_estatal'] + v['cuota_integra_autonomica'],
+        'desglose_estatal_general': reglas.estatal_general.desglose(base_gravamen_general),
+        'desglose_autonomico_general': v['escala_autonomica'].desglose(base_gravamen_general),
+        'desglose_ahorro_estatal': reglas.ahorro_estatal.desglose(base_imponible_ahorro),
+        'desglose_ahorro_autonomico': reglas.ahorro_autonomica.desglose(base_imponible_ahorro)
+    }
+
+
+def _seccion_cuota_diferencial(datos, v):
+    cuota_diferencial = v['cuota_diferencial']
+    return {
+        'cuota_liquida': v['cuota_liquida_total'],
+        'retenciones': v['retenciones'],
+        'pagos_fraccionados': v['pagos_fraccionados'],
+        'total_pagado': v['total_pagado'],
+        'diferencial': cuota_diferencial,
+        'resultado': 'A PAGAR' if cuota_diferencial > 0 else 'A DEVOLVER',
+        'importe': abs(cuota_diferencial)
+    }
+
+
+def _copiar_entrada(entrada):
+    if isinstance(entrada, dict):
+        return entrada.copy()
+    return entrada.a_dict()
+
+
+# Constructores de cada sección del resultado, en el orden del dict original
+_SECCIONES = {
+    'errores': lambda datos, v: [],
+    'avisos': _seccion_avisos,
+    'datos_entrada': lambda datos, v: _copiar_entrada(v['entrada']),
+    'rendimiento_trabajo': lambda datos, v: {
+        'bruto': v['rendimiento_trabajo_bruto'],
+        'reduccion': v['reduccion_trabajo'],
+        'neto': v['rendimiento_trabajo_neto']
+    },
+    'rendimiento_actividades': lambda datos, v: {
+        'ingresos': v['ingresos_autonomo'],
+        'gastos': v['gastos_autonomo'],
+        'neto': v['rendimiento_actividades']
+    },
+    'rendimiento_capital_inmobiliario': _seccion_rendimiento_capital_inmobiliario,
+    'imputacion_rentas': lambda datos, v: {
+        'valor_catastral': datos.valor_catastral_segunda,
+        'porcentaje': v['porcentaje_imputacion'] * 100,
+        'importe': v['imputacion_rentas']
+    },
+    'rendimiento_capital_mobiliario': lambda datos, v: {
+        'dividendos': datos.dividendos,
+        'intereses': datos.intereses,
+        'total': v['rendimiento_capital_mobiliario']
+    },
+    'ganancias_patrimoniales': lambda datos, v: {
+        'ganancias_brutas': v['ganancias_brutas'],
+        'perdidas_ejercicio': v['perdidas'],
+        'ganancias_netas': v['ganancias_netas'],
+        'perdidas_anos_anteriores': v['perdidas_anos_anteriores'],
+        'ganancias_final': v['ganancias_tras_compensacion'],
+        'perdidas_pendientes_compensar': v['perdidas_pendientes_futuro']
+    },
+    'reducciones_base': lambda datos, v: {
+        'plan_pensiones': v['plan_pensiones'],
+        'mutualidad': v['mutualidad'],
+        'pensiones_compensatorias': v['pensiones_compensatorias'],
+        'total': v['reducciones_totales']
+    },
+    'minimo_personal_familiar': lambda datos, v: v['minimo_personal_familiar'].copy(),
+    'cuotas_integras': _seccion_cuotas_integras,
+    'deducciones': lambda datos, v: v['deducciones'].copy(),
+    'cuotas_liquidas': lambda datos, v: {
+        'estatal': v['cuota_liquida_estatal'],
+        'autonomica': v['cuota_liquida_autonomica'],
+        'total': v['cuota_liquida_total']
+    },
+    'cuota_diferencial': _seccion_cuota_diferencial,
+    'resumen': lambda datos, v: {
+        'base_imponible_general': v['base_imponible_general'],
+        'base_imponible_ahorro': v['base_imponible_ahorro'],
+        'base_liquidable_general': v['base_liquidable_general'],
+        'base_gravamen_general': v['base_gravamen_general'],
+        'tipo_medio': v['tipo_medio'],
+        'tipo_marginal': v['tipo_marginal'],
+        'tipo_marginal_ahorro': v['tipo_marginal_ahorro']
+    }
+}
+
+_CLAVES_CON_IMPUTACION = tuple(_SECCIONES)
+_CLAVES_SIN_IMPUTACION = tuple(clave for clave in _SECCIONES if clave != 'imputacion_rentas')
+
+
 def calcular_reduccion_trabajo(salario, datos):
     """Calcula la reducción por rendimientos del trabajo (art. 20 LIRPF)"""
     if salario == 0:
@@ -317,13 +911,14 @@ def calcular_amortizacion_inmueble(datos):
     """
     Calcula la amortización del inmueble alquilado (3% anual sobre construcción)
     """
-    if datos.get('alquiler_ingresos', 0) == 0:
+    datos = como_contribuyente(datos)
+    if datos.alquiler_ingresos == 0:
         return 0
     
-    valor_construccion = datos.get('valor_construccion_alquiler', 0)
+    valor_construccion = datos.valor_construccion_alquiler
     if valor_construccion == 0:
         # Si no se especifica, estimamos 70% del valor total como construcción
-        valor_total = datos.get('valor_compra_inmueble', 0)
+        valor_total = datos.valor_compra_inmueble
         valor_construccion = valor_total * 0.70
     
     return valor_construccion * 0.03  # 3% anual
@@ -331,10 +926,11 @@ def calcular_amortizacion_inmueble(datos):
 
 def calcular_minimo_personal_familiar(datos):
     """Calcula el mínimo personal y familiar (art. 56-58 LIRPF)"""
+    datos = como_contribuyente(datos)
     resultado = {}
     
     # Mínimo del contribuyente (art. 56)
-    edad = datos.get('edad', 30)
+    edad = datos.edad
     if edad < 65:
         minimo_contribuyente = 5550
     elif edad < 75:
@@ -343,8 +939,8 @@ def calcular_minimo_personal_familiar(datos):
         minimo_contribuyente = 8100
     
     # Incremento por discapacidad
-    if datos.get('discapacidad', False):
-        grado_discapacidad = datos.get('grado_discapacidad', 33)
+    if datos.discapacidad:
+        grado_discapacidad = datos.grado_discapacidad
         if grado_discapacidad >= 65:
             minimo_contribuyente += 9000
         else:
@@ -353,8 +949,8 @@ def calcular_minimo_personal_familiar(datos):
     resultado['contribuyente'] = minimo_contribuyente
     
     # Mínimo por descendientes (art. 58)
-    hijos_menores = datos.get('hijos_menores_3', 0)
-    hijos_mayores = datos.get('hijos_mayores_3', 0)
+    hijos_menores = datos.hijos_menores_3
+    hijos_mayores = datos.hijos_mayores_3
     total_hijos = hijos_menores + hijos_mayores
     
     minimo_descendientes = 0
@@ -368,15 +964,15 @@ def calcular_minimo_personal_familiar(datos):
     minimo_descendientes += hijos_menores * 2800
     
     # Incremento si descendiente con discapacidad
-    hijos_con_discapacidad = datos.get('hijos_con_discapacidad', 0)
+    hijos_con_discapacidad = datos.hijos_con_discapacidad
     minimo_descendientes += hijos_con_discapacidad * 3000
     
     resultado['descendientes'] = minimo_descendientes
     resultado['total_hijos'] = total_hijos
     
     # Mínimo por ascendientes
-    ascendientes_mayores_65 = datos.get('ascendientes_mayores_65_a_cargo', 0)
-    ascendientes_mayores_75 = datos.get('ascendientes_mayores_75_a_cargo', 0)
+    ascendientes_mayores_65 = datos.ascendientes_mayores_65_a_cargo
+    ascendientes_mayores_75 = datos.ascendientes_mayores_75_a_cargo
     minimo_ascendientes = ascendientes_mayores_65 * 1150 + ascendientes_mayores_75 * 1400
     resultado['ascendientes'] = minimo_ascendientes
     
@@ -385,8 +981,15 @@ def calcular_minimo_personal_familiar(datos):
     return resultado
 
 
-def calcular_deducciones_completas(datos, cuota_estatal, cuota_autonomica):
-    """Calcula TODAS las deducciones aplicables (estatales + autonómicas)"""
+def calcular_deducciones_completas(datos, cuota_estatal, cuota_autonomica, reglas=None):
+    """
+    Calcula TODAS las deducciones aplicables (estatales + autonómicas)
+
+    `reglas` es el PaqueteReglas a aplicar (por defecto, el del ejercicio de `datos`).
+    """
+    datos = como_contribuyente(datos)
+    if reglas is None:
+        reglas = reglas_ejercicio(datos.ejercicio)
     deducciones = {
         # Estatales
         'vivienda_habitual': 0,
@@ -409,60 +1012,34 @@ def calcular_deducciones_completas(datos, cuota_estatal, cuota_autonomica):
     # === DEDUCCIONES ESTATALES ===
     
     # 1. Vivienda habitual (solo compras pre-2013)
-    if datos.get('vivienda_habitual', False):
-        base_deduccion = min(datos.get('vivienda_importe', 0), 9040)
+    if datos.vivienda_habitual:
+        base_deduccion = min(datos.vivienda_importe, 9040)
         deducciones['vivienda_habitual'] = base_deduccion * 0.15
     
     # 2. Donaciones
-    if datos.get('donaciones', 0) > 0:
-        donacion = datos.get('donaciones', 0)
+    if datos.donaciones > 0:
+        donacion = datos.donaciones
         if donacion <= 150:
             deducciones['donaciones'] = donacion * 0.80
         else:
             # Verificar si es plurianual (3+ años consecutivos)
-            es_plurianual = datos.get('donacion_plurianual', False)
+            es_plurianual = datos.donacion_plurianual
             porcentaje_resto = 0.40 if es_plurianual else 0.35
             deducciones['donaciones'] = 150 * 0.80 + (donacion - 150) * porcentaje_resto
     
     # 3. Maternidad (1.200€/año por hijo menor de 3 años)
-    if datos.get('maternidad', False) and datos.get('hijos_menores_3', 0) > 0:
-        deducciones['maternidad'] = datos.get('hijos_menores_3', 0) * 1200
+    if datos.maternidad and datos.hijos_menores_3 > 0:
+        deducciones['maternidad'] = datos.hijos_menores_3 * 1200
     
     # 4. Familia numerosa estatal (1.200€)
-    if datos.get('familia_numerosa', False):
+    if datos.familia_numerosa:
         deducciones['familia_numerosa_estatal'] = 1200
     
     # === DEDUCCIONES AUTONÓMICAS ===
-    comunidad = datos.get('comunidad', 'Madrid')
-    
-    # 5. Nacimiento/Adopción
-    if datos.get('nacimiento_ultimo_ano', False):
-        numero_hijo = datos.get('hijos_menores_3', 0) + datos.get('hijos_mayores_3', 0)
-        deducciones['nacimiento_adopcion'] = calcular_deduccion_nacimiento(comunidad, numero_hijo)
-    
-    # 6. Familia numerosa autonómica
-    if datos.get('familia_numerosa', False):
-        tipo_fn = "especial" if datos.get('familia_numerosa_especial', False) else "general"
-        deducciones['familia_numerosa_autonomica'] = calcular_deduccion_familia_numerosa(comunidad, tipo_fn)
-    
-    # 7. Alquiler vivienda habitual (autonómica)
-    if datos.get('alquiler_vivienda_habitual_pagado', 0) > 0:
-        deducciones['alquiler_vivienda_habitual'] = calcular_deduccion_alquiler(
-            comunidad,
-            datos.get('alquiler_vivienda_habitual_pagado', 0),
-            datos.get('edad', 30)
-        )
-    
-    # 8. Cuidado de menores (guarderías)
-    gastos_guarderia = datos.get('gastos_guarderia', 0)
-    if gastos_guarderia > 0:
-        deducciones_ccaa = obtener_deducciones_autonomicas(comunidad)
-        if 'gastos_guarderia' in deducciones_ccaa:
-            gg = deducciones_ccaa['gastos_guarderia']
-            limite = gg.get('limite', float('inf'))
-            porcentaje = gg.get('porcentaje', 0)
-            base = min(gastos_guarderia, limite)
-            deducciones['cuidado_menores'] = base * porcentaje
+    # 5-8. Reglas compiladas de la comunidad: cada una rellena su apartado si se cumple su condición
+    for regla in reglas.deducciones_comunidad(datos.comunidad):
+        if regla.aplica(datos):
+            deducciones[regla.apartado] = regla.importe(datos)
     
     # Sumar estatales
     deducciones['total_estatal'] = (
@@ -489,75 +1066,189 @@ def calcular_deducciones_completas(datos, cuota_estatal, cuota_autonomica):
     return deducciones
 
 
-def calcular_cuota_escala(base, escala):
-    """Calcula la cuota según una escala progresiva"""
-    cuota = 0
-    desglose = []
-    base_restante = base
-    tramo_previo = 0
-    
-    for limite, tipo in escala:
-        if base_restante <= 0:
-            break
-        
-        tramo_base = min(base_restante, limite - tramo_previo)
-        if tramo_base <= 0:
-            tramo_previo = limite
-            continue
-        
-        cuota_tramo = tramo_base * tipo
-        cuota += cuota_tramo
-        
-        desglose.append({
-            'base': tramo_base,
-            'tipo': tipo,
-            'cuota': cuota_tramo
-        })
-        
-        base_restante -= tramo_base
-        tramo_previo = limite
-    
-    return cuota, desglose
-
-
-def calcular_tipo_marginal(base, escala_autonomica):
-    """Calcula el tipo marginal total (estatal + autonómico)"""
-    # Buscamos en qué tramo está
-    for limite, tipo_est in ESCALA_ESTATAL_GENERAL:
-        if base <= limite:
-            # Buscamos el tipo autonómico correspondiente
-            for lim_aut, tipo_aut in escala_autonomica:
-                if base <= lim_aut:
-                    return (tipo_est + tipo_aut) * 100
-    return 47.0  # Tipo máximo
-
-
-# ===== ESCALAS IMPOSITIVAS 2024 =====
-
-# Escala ESTATAL general (50% del total)
-ESCALA_ESTATAL_GENERAL = [
-    (12450, 0.095),    # 9.5% (19% / 2)
-    (20200, 0.12),     # 12% (24% / 2)
-    (35200, 0.15),     # 15% (30% / 2)
-    (60000, 0.185),    # 18.5% (37% / 2)
-    (300000, 0.225),   # 22.5% (45% / 2)
-    (float('inf'), 0.235)  # 23.5% (47% / 2)
-]
-
-# Escala del AHORRO estatal (parte estatal)
-ESCALA_AHORRO_ESTATAL = [
-    (6000, 0.095),     # 9.5% (19% / 2)
-    (50000, 0.105),    # 10.5% (21% / 2)
-    (200000, 0.115),   # 11.5% (23% / 2)
-    (300000, 0.13),    # 13% (26% / 2)
-    (float('inf'), 0.145)  # 14.5% (29% / 2)
-]
-
-# Escala del AHORRO autonómica
-ESCALA_AHORRO_AUTONOMICA = [
-    (6000, 0.095),
-    (50000, 0.105),
-    (200000, 0.115),
-    (300000, 0.13),
-    (float('inf'), 0.145)
-]
+def calcular_cuota_escala(base, escala, desglose=True):
+    """
+    Calcula la cuota según una escala progresiva
+
+    Args:
+        base: base liquidable
+        escala: lista de tuplas (límite, tipo) o EscalaCompilada. Con la
+                escala ya compilada (compilar_escala, o las de
+                PaqueteReglas) no se busca en la caché de escalas en cada llamada.
+        desglose (bool): si es True (por defecto) calcula también el desglose
+                         por tramos; si es False solo la cuota
+
+    Returns:
+        tuple (cuota, desglose por tramos), o solo la cuota si desglose es False
+    """
+    compilada = compilar_escala(escala)
+    if not desglose:
+        return compilada.cuota(base)
+    return compilada.cuota(base), compilada.desglose(base)
+
+
+def calcular_cuota(base, escala):
+    """Calcula solo la cuota según una escala progresiva, sin desglose"""
+    return compilar_escala(escala).cuota(base)
+
+
+def calcular_tipo_marginal(base, escala_autonomica, reglas=None):
+    """Calcula el tipo marginal total (estatal + autonómico) con una sola búsqueda"""
+    escala_estatal = (reglas or _REGLAS).estatal_general
+    return combinar_escalas(escala_estatal, escala_autonomica).tipo(base) * 100
+
+
+def calcular_tipo_marginal_ahorro(base_ahorro, reglas=None):
+    """Calcula el tipo marginal total (estatal + autonómico) de la base del ahorro"""
+    return (reglas or _REGLAS).ahorro_combinada.tipo(base_ahorro) * 100
+
+
+class TarifaComunidad:
+    """
+    Cuota de una comunidad como función lineal a trozos de la base
+
+    Con el mínimo personal y familiar y las deducciones fijos, la cuota
+    líquida solo depende de la base liquidable general y de la base del
+    ahorro, y es lineal entre los límites de las escalas estatal y
+    autonómica. Cada escala se combina una sola vez y cada consulta es una
+    búsqueda binaria por base, también sobre arrays para barridos.
+
+    Obtén las instancias con tarifa_comunidad(comunidad, ejercicio).
+
+    Atributos:
+        comunidad (str): comunidad autónoma
+        ejercicio (int): ejercicio cuyas escalas se aplican
+        general (EscalaCombinada): escala general estatal + autonómica
+        ahorro (EscalaCombinada): escala del ahorro estatal + autonómica
+    """
+
+    __slots__ = ('comunidad', 'ejercicio', 'general', 'ahorro')
+
+    def __init__(self, comunidad, ejercicio=EJERCICIO_POR_DEFECTO):
+        reglas = reglas_ejercicio(ejercicio)
+        self.comunidad = comunidad
+        self.ejercicio = ejercicio
+        self.general = combinar_escalas(reglas.estatal_general, reglas.escala_autonomica(comunidad))
+        self.ahorro = reglas.ahorro_combinada
+
+    def cuotas_integras(self, base, base_ahorro=0, minimo=0):
+        """
+        Cuotas íntegras estatal y autonómica
+
+        Args:
+            base: base liquidable general
+            base_ahorro: base imponible del ahorro
+            minimo: mínimo personal y familiar total
+
+        Returns:
+            tuple: (estatal, autonómica)
+        """
+        estatal, autonomica = self.general.cuota_partes(max(0, base - minimo))
+        estatal_ahorro, autonomica_ahorro = self.ahorro.cuota_partes(base_ahorro)
+        return estatal + estatal_ahorro, autonomica + autonomica_ahorro
+
+    def cuota_liquida(self, base, base_ahorro=0, minimo=0, deducciones_estatal=0, deducciones_autonomica=0):
+        """Cuota líquida total, con cada deducción limitada a su cuota como en el motor"""
+        estatal, autonomica = self.cuotas_integras(base, base_ahorro, minimo)
+        return max(0, estatal - deducciones_estatal) + max(0, autonomica - deducciones_autonomica)
+
+    def tipo_marginal(self, base, minimo=0):
+        """Tipo marginal general en % (estatal + autonómico)"""
+        return self.general.tipo(max(0, base - minimo)) * 100
+
+    def tipo_marginal_ahorro(self, base_ahorro):
+        """Tipo marginal del ahorro en % (estatal + autonómico)"""
+        return self.ahorro.tipo(base_ahorro) * 100
+
+    def tipo_medio(self, base, base_ahorro=0, minimo=0, deducciones_estatal=0, deducciones_autonomica=0):
+        """Tipo medio en %: cuota líquida / (base general + base del ahorro)"""
+        base_total = base + base_ahorro
+        if base_total <= 0:
+            return 0
+        cuota = self.cuota_liquida(base, base_ahorro, minimo, deducciones_estatal, deducciones_autonomica)
+        return cuota / base_total * 100
+
+    def cuota_liquida_array(self, bases, base_ahorro=0, minimo=0, deducciones_estatal=0,
+                            deducciones_autonomica=0):
+        """
+        Cuota líquida para un array de bases generales (barridos de ingresos)
+
+        base_ahorro, minimo y las deducciones pueden ser escalares o arrays
+        del mismo tamaño que `bases`.
+        """
+        import numpy as np
+        bases = np.asarray(bases, dtype=np.float64)
+        estatal, autonomica = self.general.cuota_partes_array(np.maximum(0, bases - minimo))
+        estatal_ahorro, autonomica_ahorro = self.ahorro.cuota_partes_array(
+            np.broadcast_to(np.asarray(base_ahorro, dtype=np.float64), bases.shape)
+        )
+        return (
+            np.maximum(0, estatal + estatal_ahorro - deducciones_estatal) +
+            np.maximum(0, autonomica + autonomica_ahorro - deducciones_autonomica)
+        )
+
+    def tipo_marginal_array(self, bases, minimo=0):
+        """Tipo marginal general en % para un array de bases"""
+        import numpy as np
+        bases = np.asarray(bases, dtype=np.float64)
+        return self.general.tipo_array(np.maximum(0, bases - minimo)) * 100
+
+    def tipo_medio_array(self, bases, base_ahorro=0, minimo=0, deducciones_estatal=0,
+                         deducciones_autonomica=0):
+        """Tipo medio en % para un array de bases generales"""
+        import numpy as np
+        bases = np.asarray(bases, dtype=np.float64)
+        cuota = self.cuota_liquida_array(bases, base_ahorro, minimo, deducciones_estatal, deducciones_autonomica)
+        base_total = bases + base_ahorro
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(base_total > 0, cuota / base_total * 100, 0.0)
+
+    def __repr__(self):
+        return f"TarifaComunidad({self.comunidad!r}, {self.ejercicio}, tramos={len(self.general)})"
+
+
+_TARIFAS = {}
+
+
+def tarifa_comunidad(comunidad, ejercicio=EJERCICIO_POR_DEFECTO):
+    """
+    Devuelve la TarifaComunidad de una comunidad, construyéndola solo la primera vez
+
+    Args:
+        comunidad (str): nombre de la comunidad (las desconocidas usan la escala de Madrid)
+        ejercicio (int): ejercicio cuyas escalas se aplican
+
+    Returns:
+        TarifaComunidad
+    """
+    clave = (ejercicio, comunidad)
+    tarifa = _TARIFAS.get(clave)
+    if tarifa is None:
+        tarifa = _TARIFAS[clave] = TarifaComunidad(comunidad, ejercicio)
+    return tarifa
+
+
+# ===== ESCALAS IMPOSITIVAS DEL EJERCICIO POR DEFECTO =====
+# Las tablas de cada ejercicio están en reglas.py; estos nombres son las del
+# ejercicio por defecto, ya compiladas
+
+_REGLAS = reglas_ejercicio(EJERCICIO_POR_DEFECTO)
+
+ESCALA_ESTATAL_GENERAL = _REGLAS.tablas['escala_estatal_general']
+ESCALA_AHORRO_ESTATAL = _REGLAS.tablas['escala_ahorro_estatal']
+ESCALA_AHORRO_AUTONOMICA = _REGLAS.tablas['escala_ahorro_autonomica']
+
+ESCALA_ESTATAL_GENERAL_COMPILADA = _REGLAS.estatal_general
+ESCALA_AHORRO_ESTATAL_COMPILADA = _REGLAS.ahorro_estatal
+ESCALA_AHORRO_AUTONOMICA_COMPILADA = _REGLAS.ahorro_autonomica
+ESCALA_AHORRO_COMBINADA = _REGLAS.ahorro_combinada
+
+# Versión de las reglas del ejercicio por defecto: forma parte de la clave de
+# la caché de resultados, así que cambia al cambiar escalas o deducciones
+VERSION_REGLAS = _REGLAS.version
+
+
+if __name__ == '__main__':
+    import sys
+    from irpf import main
+    sys.exit(main())
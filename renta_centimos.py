@@ -0,0 +1,514 @@
+"""
+Motor de cálculo de IRPF en céntimos (aritmética entera)
+Los mismos PASOS 1-14 que renta.py y renta_vectorizada.py, con los importes
+como enteros de céntimos y los tipos como enteros escalados (centimos.py),
+en versión escalar (un contribuyente, int de Python) y vectorial (un lote,
+int64 de NumPy). Las dos dan exactamente el mismo resultado, al céntimo.
+
+Reglas de redondeo (al céntimo más próximo, mitades lejos del cero):
+    - Entrada: cada importe en euros se pasa a céntimos una sola vez.
+    - PASOS 1-4 y deducciones: cada importe obtenido aplicando un tipo o
+      porcentaje (reducción del trabajo, reducción del 5% en simplificada,
+      valor de construcción y amortización, reducción del alquiler,
+      imputación de rentas, cada apartado de deducción) se redondea al
+      calcularse, antes de sumarlo a nada.
+    - PASO 11: la cuota de cada escala (estatal y autonómica, general y del
+      ahorro) se calcula exacta por tramos y se redondea una vez al final.
+    - Sumas, restas, mínimos, máximos, límites a cuota y cuota diferencial
+      son exactos.
+    - Los tipos medio y marginal son porcentajes, no importes: salen en
+      coma flotante.
+
+Los resultados tienen los nombres de calcular_renta_batch: importes en
+céntimos (int) y tipos en % (float).
+"""
+
+import numpy as np
+
+from centimos import (
+    ESCALA_TIPOS, a_centimos, a_centimos_array, aplicar_tipo, aplicar_tipo_array, dividir,
+    dividir_array, tipo_entero
+)
+from contribuyente import CAMPOS, como_contribuyente
+from deducciones_compiladas import deducciones_autonomicas_array
+from instrumentacion import medidor_activo
+from reglas import reglas_ejercicio
+from renta_vectorizada import (
+    _codificar_comunidades, _columna_booleana, _columna_igual_a, _columna_numerica, calcular_por_ejercicio
+)
+
+
+# Campos de importe (en euros en la entrada): los demás numéricos son enteros (edad, hijos...)
+IMPORTES = frozenset(nombre for nombre, tipo, _ in CAMPOS if tipo is float)
+
+# Tipos y porcentajes del cálculo (los de renta.py) como enteros escalados
+_TIPO_REDUCCION_SIMPLIFICADA = tipo_entero(0.05)
+_TIPO_VALOR_CONSTRUCCION = tipo_entero(0.70)
+_TIPO_AMORTIZACION = tipo_entero(0.03)
+_TIPO_REDUCCION_ALQUILER = tipo_entero(0.60)
+_TIPO_REDUCCION_ALQUILER_JOVEN = tipo_entero(0.70)
+_TIPO_IMPUTACION = tipo_entero(0.011)
+_TIPO_IMPUTACION_REVISADO = tipo_entero(0.02)
+_TIPO_VIVIENDA = tipo_entero(0.15)
+_TIPO_DONACION_PRIMEROS = tipo_entero(0.80)
+_TIPO_DONACION_RESTO = tipo_entero(0.35)
+_TIPO_DONACION_PLURIANUAL = tipo_entero(0.40)
+
+# Mínimo por descendientes acumulado según número de hijos (0, 1, 2, 3), en céntimos
+MINIMO_DESCENDIENTES_ACUMULADO = (0, 240000, 510000, 910000)
+_MINIMO_DESCENDIENTES_ARRAY = np.array(MINIMO_DESCENDIENTES_ACUMULADO, dtype=np.int64)
+
+
+# ===== MOTOR ESCALAR =====
+
+def calcular_renta_centimos(datos, ejercicio=None):
+    """
+    Calcula la renta de un contribuyente en céntimos
+
+    Args:
+        datos: dict del formulario o DatosContribuyente
+        ejercicio: año cuyas reglas se aplican; si no se indica, el campo
+                   'ejercicio' de `datos`
+
+    Returns:
+        dict {nombre: valor} con las cifras de calcular_renta_batch:
+        importes en céntimos (int) y tipos en % (float)
+
+    Raises:
+        ValueError: si no hay reglas para el ejercicio
+    """
+    datos = como_contribuyente(datos)
+    reglas = reglas_ejercicio(datos.ejercicio if ejercicio is None else ejercicio)
+    es_autonomo = datos.es_autonomo
+
+    # ===== PASO 1: RENDIMIENTOS DEL TRABAJO =====
+    salario = a_centimos(datos.salario)
+    if salario == 0:
+        reduccion_trabajo = 0
+    elif salario <= 1400000:
+        reduccion_trabajo = 200000
+    elif salario < 1900000:
+        # 2.000 € - (salario - 14.000 €) * 2.000 / 5.000
+        reduccion_trabajo = 200000 - dividir((salario - 1400000) * 2, 5)
+    else:
+        reduccion_trabajo = 0
+    rendimiento_trabajo_neto = max(0, salario - reduccion_trabajo)
+
+    # ===== PASO 1B: RENDIMIENTOS DE ACTIVIDADES ECONÓMICAS =====
+    rendimiento_actividades = 0
+    if es_autonomo:
+        rendimiento_neto_actividad = max(
+            0, a_centimos(datos.ingresos_autonomo) - a_centimos(datos.gastos_autonomo)
+        )
+        if datos.regimen_autonomo == 'estimacion_directa_simplificada':
+            reduccion_adicional = min(
+                aplicar_tipo(rendimiento_neto_actividad, _TIPO_REDUCCION_SIMPLIFICADA), 200000
+            )
+            rendimiento_actividades = max(0, rendimiento_neto_actividad - reduccion_adicional)
+        else:
+            rendimiento_actividades = rendimiento_neto_actividad
+
+    # ===== PASO 2: RENDIMIENTOS DEL CAPITAL INMOBILIARIO =====
+    alquiler_bruto = a_centimos(datos.alquiler_ingresos)
+    amortizacion = 0
+    if alquiler_bruto != 0:
+        valor_construccion = a_centimos(datos.valor_construccion_alquiler)
+        if valor_construccion == 0:
+            valor_construccion = aplicar_tipo(a_centimos(datos.valor_compra_inmueble), _TIPO_VALOR_CONSTRUCCION)
+        amortizacion = aplicar_tipo(valor_construccion, _TIPO_AMORTIZACION)
+    total_gastos_alquiler = (
+        a_centimos(datos.ibi) + a_centimos(datos.gastos_comunidad) + a_centimos(datos.seguro_hogar) +
+        a_centimos(datos.reparaciones) + a_centimos(datos.intereses_hipoteca) + amortizacion +
+        a_centimos(datos.alquiler_gastos)
+    )
+    alquiler_neto_previo = max(0, alquiler_bruto - total_gastos_alquiler)
+    reduccion_alquiler = 0
+    if alquiler_bruto > 0:
+        porcentaje = _TIPO_REDUCCION_ALQUILER_JOVEN if datos.arrendatario_menor_30 else _TIPO_REDUCCION_ALQUILER
+        reduccion_alquiler = aplicar_tipo(alquiler_neto_previo, porcentaje)
+    rendimiento_capital_inmobiliario = max(0, alquiler_neto_previo - reduccion_alquiler)
+
+    # ===== PASO 2B: IMPUTACIÓN DE RENTAS INMOBILIARIAS =====
+    imputacion_rentas = 0
+    if datos.tiene_segunda_vivienda:
+        porcentaje = _TIPO_IMPUTACION_REVISADO if datos.valor_catastral_revisado else _TIPO_IMPUTACION
+        imputacion_rentas = aplicar_tipo(a_centimos(datos.valor_catastral_segunda), porcentaje)
+
+    # ===== PASO 3: RENDIMIENTOS DEL CAPITAL MOBILIARIO =====
+    rendimiento_capital_mobiliario = a_centimos(datos.dividendos) + a_centimos(datos.intereses)
+
+    # ===== PASO 4: GANANCIAS Y PÉRDIDAS PATRIMONIALES =====
+    ganancias_brutas = a_centimos(datos.ganancias)
+    perdidas = a_centimos(datos.perdidas_patrimoniales)
+    ganancias_netas = max(0, ganancias_brutas - perdidas)
+    perdidas_pendientes = max(0, perdidas - ganancias_brutas)
+    perdidas_anos_anteriores = a_centimos(datos.perdidas_pendientes_anos_anteriores)
+    ganancias_tras_compensacion = max(0, ganancias_netas - perdidas_anos_anteriores)
+    perdidas_pendientes_futuro = max(0, perdidas_pendientes + (perdidas_anos_anteriores - ganancias_netas))
+
+    # ===== PASOS 5-8: BASES IMPONIBLES, REDUCCIONES Y BASE LIQUIDABLE =====
+    base_imponible_ahorro = rendimiento_capital_mobiliario + ganancias_tras_compensacion
+    reducciones_totales = (
+        min(a_centimos(datos.plan_pensiones), 150000) +
+        (min(a_centimos(datos.mutualidad), 150000) if es_autonomo else 0) +
+        a_centimos(datos.pensiones_compensatorias)
+    )
+    base_imponible_general = max(0, (
+        rendimiento_trabajo_neto + rendimiento_actividades + rendimiento_capital_inmobiliario +
+        imputacion_rentas
+    ) - reducciones_totales)
+    base_liquidable_general = base_imponible_general
+
+    # ===== PASO 9: MÍNIMO PERSONAL Y FAMILIAR =====
+    edad = datos.edad
+    minimo_personal_familiar = 555000 if edad < 65 else 670000 if edad < 75 else 810000
+    if datos.discapacidad:
+        minimo_personal_familiar += 900000 if datos.grado_discapacidad >= 65 else 300000
+    hijos_menores = datos.hijos_menores_3
+    total_hijos = max(hijos_menores + datos.hijos_mayores_3, 0)
+    minimo_personal_familiar += (
+        MINIMO_DESCENDIENTES_ACUMULADO[min(total_hijos, 3)] + max(total_hijos - 3, 0) * 450000 +
+        hijos_menores * 280000 + datos.hijos_con_discapacidad * 300000 +
+        datos.ascendientes_mayores_65_a_cargo * 115000 + datos.ascendientes_mayores_75_a_cargo * 140000
+    )
+
+    # ===== PASO 10: BASE LIQUIDABLE SOMETIDA A GRAVAMEN =====
+    base_gravamen_general = max(0, base_liquidable_general - minimo_personal_familiar)
+
+    # ===== PASO 11: CUOTA ÍNTEGRA ESTATAL Y AUTONÓMICA =====
+    estatal_general = reglas.estatal_general.centimos()
+    autonomica_general = reglas.escala_autonomica(datos.comunidad).centimos()
+    estatal_ahorro = reglas.ahorro_estatal.centimos()
+    autonomica_ahorro = reglas.ahorro_autonomica.centimos()
+    cuota_integra_estatal = (
+        estatal_general.cuota(base_gravamen_general) + estatal_ahorro.cuota(base_imponible_ahorro)
+    )
+    cuota_integra_autonomica = (
+        autonomica_general.cuota(base_gravamen_general) + autonomica_ahorro.cuota(base_imponible_ahorro)
+    )
+
+    # ===== PASO 12: DEDUCCIONES DE LA CUOTA =====
+    deducciones_estatal = 0
+    if datos.vivienda_habitual:
+        deducciones_estatal += aplicar_tipo(min(a_centimos(datos.vivienda_importe), 904000), _TIPO_VIVIENDA)
+    donacion = a_centimos(datos.donaciones)
+    if 0 < donacion <= 15000:
+        deducciones_estatal += aplicar_tipo(donacion, _TIPO_DONACION_PRIMEROS)
+    elif donacion > 15000:
+        porcentaje = _TIPO_DONACION_PLURIANUAL if datos.donacion_plurianual else _TIPO_DONACION_RESTO
+        deducciones_estatal += (
+            aplicar_tipo(15000, _TIPO_DONACION_PRIMEROS) + aplicar_tipo(donacion - 15000, porcentaje)
+        )
+    if datos.maternidad and hijos_menores > 0:
+        deducciones_estatal += hijos_menores * 120000
+    if datos.familia_numerosa:
+        deducciones_estatal += 120000
+    deducciones_autonomica = 0
+    for regla in reglas.deducciones_comunidad(datos.comunidad):
+        if regla.aplica(datos):
+            deducciones_autonomica += regla.importe_centimos(datos)
+    deducciones_estatal = min(deducciones_estatal, cuota_integra_estatal)
+    deducciones_autonomica = min(deducciones_autonomica, cuota_integra_autonomica)
+
+    # ===== PASOS 13-14: CUOTA LÍQUIDA Y CUOTA DIFERENCIAL =====
+    cuota_liquida_estatal = max(0, cuota_integra_estatal - deducciones_estatal)
+    cuota_liquida_autonomica = max(0, cuota_integra_autonomica - deducciones_autonomica)
+    cuota_liquida_total = cuota_liquida_estatal + cuota_liquida_autonomica
+    total_pagado = a_centimos(datos.retenciones) + (
+        a_centimos(datos.pagos_fraccionados_autonomo) if es_autonomo else 0
+    )
+
+    # ===== RESUMEN FINAL =====
+    base_total = base_imponible_general + base_imponible_ahorro
+    return {
+        'rendimiento_trabajo_neto': rendimiento_trabajo_neto,
+        'rendimiento_actividades': rendimiento_actividades,
+        'rendimiento_capital_inmobiliario': rendimiento_capital_inmobiliario,
+        'imputacion_rentas': imputacion_rentas,
+        'rendimiento_capital_mobiliario': rendimiento_capital_mobiliario,
+        'ganancias_patrimoniales': ganancias_tras_compensacion,
+        'perdidas_pendientes_compensar': perdidas_pendientes_futuro,
+        'reducciones_base': reducciones_totales,
+        'base_imponible_general': base_imponible_general,
+        'base_imponible_ahorro': base_imponible_ahorro,
+        'base_liquidable_general': base_liquidable_general,
+        'minimo_personal_familiar': minimo_personal_familiar,
+        'base_gravamen_general': base_gravamen_general,
+        'cuota_integra_estatal': cuota_integra_estatal,
+        'cuota_integra_autonomica': cuota_integra_autonomica,
+        'cuota_integra_total': cuota_integra_estatal + cuota_integra_autonomica,
+        'deducciones_estatal': deducciones_estatal,
+        'deducciones_autonomica': deducciones_autonomica,
+        'cuota_liquida_estatal': cuota_liquida_estatal,
+        'cuota_liquida_autonomica': cuota_liquida_autonomica,
+        'cuota_liquida_total': cuota_liquida_total,
+        'total_pagado': total_pagado,
+        'cuota_diferencial': cuota_liquida_total - total_pagado,
+        'tipo_medio': cuota_liquida_total / base_total * 100 if base_total > 0 else 0.0,
+        'tipo_marginal': (
+            estatal_general.tipo(base_gravamen_general) + autonomica_general.tipo(base_gravamen_general)
+        ) * 100 / ESCALA_TIPOS,
+        'tipo_marginal_ahorro': (
+            estatal_ahorro.tipo(base_imponible_ahorro) + autonomica_ahorro.tipo(base_imponible_ahorro)
+        ) * 100 / ESCALA_TIPOS
+    }
+
+
+# ===== MOTOR VECTORIAL =====
+
+def calcular_renta_batch_centimos(columnas, ejercicio=None):
+    """
+    Calcula la renta de muchos contribuyentes a la vez, en céntimos
+
+    Args:
+        columnas: dict {campo: array-like}, como en calcular_renta_batch
+                  (importes en euros)
+        ejercicio: año cuyas reglas se aplican a todo el lote; si no se
+                   indica, el de la columna 'ejercicio' de cada fila
+
+    Returns:
+        dict {nombre: np.ndarray} con las cifras de calcular_renta_batch:
+        importes en céntimos (int64) y tipos en % (float64)
+
+    Raises:
+        ValueError: si no hay reglas para algún ejercicio del lote
+    """
+    return calcular_por_ejercicio(columnas, ejercicio, _calcular_ejercicio_centimos)
+
+
+def _calcular_ejercicio_centimos(columnas, n, reglas):
+    """Calcula en céntimos el lote completo con las reglas de un solo ejercicio"""
+    medidor = medidor_activo()
+    if medidor is not None:
+        medidor.empezar()
+
+    convertidas = {}
+
+    def num(campo):
+        # Importes en céntimos; el resto de campos numéricos, como enteros
+        columna = convertidas.get(campo)
+        if columna is None:
+            valores = _columna_numerica(columnas, campo, n)
+            if campo in IMPORTES:
+                columna = a_centimos_array(valores)
+            else:
+                columna = valores.astype(np.int64)
+            convertidas[campo] = columna
+        return columna
+
+    def bool_(campo):
+        clave = (campo, bool)
+        columna = convertidas.get(clave)
+        if columna is None:
+            columna = convertidas[clave] = _columna_booleana(columnas, campo, n)
+        return columna
+
+    es_autonomo = bool_('es_autonomo')
+
+    # ===== PASO 1: RENDIMIENTOS DEL TRABAJO =====
+    salario = num('salario')
+    reduccion_trabajo = np.where(
+        salario <= 1400000,
+        np.where(salario == 0, 0, 200000),
+        np.where(salario < 1900000, 200000 - dividir_array((salario - 1400000) * 2, 5), 0)
+    )
+    rendimiento_trabajo_neto = np.maximum(0, salario - reduccion_trabajo)
+
+    # ===== PASO 1B: RENDIMIENTOS DE ACTIVIDADES ECONÓMICAS =====
+    rendimiento_neto_actividad = np.maximum(0, num('ingresos_autonomo') - num('gastos_autonomo'))
+    simplificada = _columna_igual_a(columnas, 'regimen_autonomo', 'estimacion_directa_simplificada', n)
+    reduccion_adicional = np.minimum(
+        aplicar_tipo_array(rendimiento_neto_actividad, _TIPO_REDUCCION_SIMPLIFICADA), 200000
+    )
+    rendimiento_actividades = np.where(
+        simplificada, np.maximum(0, rendimiento_neto_actividad - reduccion_adicional), rendimiento_neto_actividad
+    )
+    rendimiento_actividades = np.where(es_autonomo, rendimiento_actividades, 0)
+
+    # ===== PASO 2: RENDIMIENTOS DEL CAPITAL INMOBILIARIO =====
+    alquiler_bruto = num('alquiler_ingresos')
+    valor_construccion = num('valor_construccion_alquiler')
+    valor_construccion = np.where(
+        valor_construccion == 0,
+        aplicar_tipo_array(num('valor_compra_inmueble'), _TIPO_VALOR_CONSTRUCCION),
+        valor_construccion
+    )
+    amortizacion = np.where(alquiler_bruto == 0, 0, aplicar_tipo_array(valor_construccion, _TIPO_AMORTIZACION))
+    total_gastos_alquiler = (
+        num('ibi') + num('gastos_comunidad') + num('seguro_hogar') + num('reparaciones') +
+        num('intereses_hipoteca') + amortizacion + num('alquiler_gastos')
+    )
+    alquiler_neto_previo = np.maximum(0, alquiler_bruto - total_gastos_alquiler)
+    porcentaje_reduccion = np.where(
+        bool_('arrendatario_menor_30'), _TIPO_REDUCCION_ALQUILER_JOVEN, _TIPO_REDUCCION_ALQUILER
+    )
+    reduccion_alquiler = np.where(
+        alquiler_bruto > 0, aplicar_tipo_array(alquiler_neto_previo, porcentaje_reduccion), 0
+    )
+    rendimiento_capital_inmobiliario = np.maximum(0, alquiler_neto_previo - reduccion_alquiler)
+
+    # ===== PASO 2B: IMPUTACIÓN DE RENTAS INMOBILIARIAS =====
+    porcentaje_imputacion = np.where(
+        bool_('valor_catastral_revisado'), _TIPO_IMPUTACION_REVISADO, _TIPO_IMPUTACION
+    )
+    imputacion_rentas = np.where(
+        bool_('tiene_segunda_vivienda'),
+        aplicar_tipo_array(num('valor_catastral_segunda'), porcentaje_imputacion),
+        0
+    )
+
+    # ===== PASO 3: RENDIMIENTOS DEL CAPITAL MOBILIARIO =====
+    rendimiento_capital_mobiliario = num('dividendos') + num('intereses')
+
+    # ===== PASO 4: GANANCIAS Y PÉRDIDAS PATRIMONIALES =====
+    ganancias_brutas = num('ganancias')
+    perdidas = num('perdidas_patrimoniales')
+    ganancias_netas = np.maximum(0, ganancias_brutas - perdidas)
+    perdidas_pendientes = np.maximum(0, perdidas - ganancias_brutas)
+    perdidas_anos_anteriores = num('perdidas_pendientes_anos_anteriores')
+    ganancias_tras_compensacion = np.maximum(0, ganancias_netas - perdidas_anos_anteriores)
+    perdidas_pendientes_futuro = np.maximum(
+        0, perdidas_pendientes + (perdidas_anos_anteriores - ganancias_netas)
+    )
+
+    # ===== PASOS 5-8: BASES IMPONIBLES, REDUCCIONES Y BASE LIQUIDABLE =====
+    base_imponible_ahorro = rendimiento_capital_mobiliario + ganancias_tras_compensacion
+    reducciones_totales = (
+        np.minimum(num('plan_pensiones'), 150000) +
+        np.where(es_autonomo, np.minimum(num('mutualidad'), 150000), 0) +
+        num('pensiones_compensatorias')
+    )
+    base_imponible_general = np.maximum(0, (
+        rendimiento_trabajo_neto + rendimiento_actividades + rendimiento_capital_inmobiliario +
+        imputacion_rentas
+    ) - reducciones_totales)
+    base_liquidable_general = base_imponible_general
+
+    # ===== PASO 9: MÍNIMO PERSONAL Y FAMILIAR =====
+    edad = num('edad')
+    minimo_personal_familiar = np.where(edad < 65, 555000, np.where(edad < 75, 670000, 810000))
+    minimo_personal_familiar = minimo_personal_familiar + np.where(
+        bool_('discapacidad'), np.where(num('grado_discapacidad') >= 65, 900000, 300000), 0
+    )
+    hijos_menores = num('hijos_menores_3')
+    total_hijos = np.maximum(hijos_menores + num('hijos_mayores_3'), 0)
+    minimo_personal_familiar = minimo_personal_familiar + (
+        _MINIMO_DESCENDIENTES_ARRAY[np.minimum(total_hijos, 3)] + np.maximum(total_hijos - 3, 0) * 450000 +
+        hijos_menores * 280000 + num('hijos_con_discapacidad') * 300000 +
+        num('ascendientes_mayores_65_a_cargo') * 115000 + num('ascendientes_mayores_75_a_cargo') * 140000
+    )
+
+    # ===== PASO 10: BASE LIQUIDABLE SOMETIDA A GRAVAMEN =====
+    base_gravamen_general = np.maximum(0, base_liquidable_general - minimo_personal_familiar)
+
+    # ===== PASO 11: CUOTA ÍNTEGRA ESTATAL Y AUTONÓMICA =====
+    comunidades, indice_comunidad = _codificar_comunidades(columnas, n)
+    estatal_general = reglas.estatal_general.centimos()
+    estatal_ahorro = reglas.ahorro_estatal.centimos()
+    autonomica_ahorro = reglas.ahorro_autonomica.centimos()
+    cuota_autonomica_general, tipo_autonomico = _cuota_autonomica_centimos(
+        base_gravamen_general, comunidades, indice_comunidad, reglas
+    )
+    cuota_integra_estatal = (
+        estatal_general.cuota_array(base_gravamen_general) + estatal_ahorro.cuota_array(base_imponible_ahorro)
+    )
+    cuota_integra_autonomica = cuota_autonomica_general + autonomica_ahorro.cuota_array(base_imponible_ahorro)
+
+    # ===== PASO 12: DEDUCCIONES DE LA CUOTA =====
+    donacion = num('donaciones')
+    porcentaje_resto = np.where(bool_('donacion_plurianual'), _TIPO_DONACION_PLURIANUAL, _TIPO_DONACION_RESTO)
+    deducciones_estatal = (
+        np.where(
+            bool_('vivienda_habitual'),
+            aplicar_tipo_array(np.minimum(num('vivienda_importe'), 904000), _TIPO_VIVIENDA), 0
+        ) +
+        np.where(
+            donacion <= 15000,
+            np.where(donacion > 0, aplicar_tipo_array(donacion, _TIPO_DONACION_PRIMEROS), 0),
+            aplicar_tipo(15000, _TIPO_DONACION_PRIMEROS) + aplicar_tipo_array(donacion - 15000, porcentaje_resto)
+        ) +
+        np.where(bool_('maternidad') & (hijos_menores > 0), hijos_menores * 120000, 0) +
+        np.where(bool_('familia_numerosa'), 120000, 0)
+    )
+    deducciones_autonomica = deducciones_autonomicas_array(
+        [reglas.deducciones_comunidad(comunidad) for comunidad in comunidades], indice_comunidad, num, bool_,
+        centimos=True
+    )
+    deducciones_estatal = np.minimum(deducciones_estatal, cuota_integra_estatal)
+    deducciones_autonomica = np.minimum(deducciones_autonomica, cuota_integra_autonomica)
+
+    # ===== PASOS 13-14: CUOTA LÍQUIDA Y CUOTA DIFERENCIAL =====
+    cuota_liquida_estatal = np.maximum(0, cuota_integra_estatal - deducciones_estatal)
+    cuota_liquida_autonomica = np.maximum(0, cuota_integra_autonomica - deducciones_autonomica)
+    cuota_liquida_total = cuota_liquida_estatal + cuota_liquida_autonomica
+    total_pagado = num('retenciones') + np.where(es_autonomo, num('pagos_fraccionados_autonomo'), 0)
+
+    # ===== RESUMEN FINAL =====
+    base_total = base_imponible_general + base_imponible_ahorro
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tipo_medio = np.where(base_total > 0, cuota_liquida_total / base_total * 100, 0.0)
+    tipo_marginal = (estatal_general.tipo_array(base_gravamen_general) + tipo_autonomico) * 100 / ESCALA_TIPOS
+    tipo_marginal_ahorro = (
+        estatal_ahorro.tipo_array(base_imponible_ahorro) + autonomica_ahorro.tipo_array(base_imponible_ahorro)
+    ) * 100 / ESCALA_TIPOS
+    if medidor is not None:
+        medidor.marca('lote en céntimos: PASOS 1-14')
+
+    return {
+        'rendimiento_trabajo_neto': rendimiento_trabajo_neto,
+        'rendimiento_actividades': rendimiento_actividades,
+        'rendimiento_capital_inmobiliario': rendimiento_capital_inmobiliario,
+        'imputacion_rentas': imputacion_rentas,
+        'rendimiento_capital_mobiliario': rendimiento_capital_mobiliario,
+        'ganancias_patrimoniales': ganancias_tras_compensacion,
+        'perdidas_pendientes_compensar': perdidas_pendientes_futuro,
+        'reducciones_base': reducciones_totales,
+        'base_imponible_general': base_imponible_general,
+        'base_imponible_ahorro': base_imponible_ahorro,
+        'base_liquidable_general': base_liquidable_general,
+        'minimo_personal_familiar': minimo_personal_familiar,
+        'base_gravamen_general': base_gravamen_general,
+        'cuota_integra_estatal': cuota_integra_estatal,
+        'cuota_integra_autonomica': cuota_integra_autonomica,
+        'cuota_integra_total': cuota_integra_estatal + cuota_integra_autonomica,
+        'deducciones_estatal': deducciones_estatal,
+        'deducciones_autonomica': deducciones_autonomica,
+        'cuota_liquida_estatal': cuota_liquida_estatal,
+        'cuota_liquida_autonomica': cuota_liquida_autonomica,
+        'cuota_liquida_total': cuota_liquida_total,
+        'total_pagado': total_pagado,
+        'cuota_diferencial': cuota_liquida_total - total_pagado,
+        'tipo_medio': tipo_medio,
+        'tipo_marginal': tipo_marginal,
+        'tipo_marginal_ahorro': tipo_marginal_ahorro
+    }
+
+
+def _cuota_autonomica_centimos(bases, comunidades, indice_comunidad, reglas):
+    """
+    Cuota (en céntimos) y tipo marginal (escalado) autonómicos con la escala de cada fila
+
+    Como renta_vectorizada._cuota_autonomica_array, con las tablas enteras
+    de EscalaCentimos: cada cuota es exacta por tramos y se redondea una vez.
+    """
+    tablas = [reglas.escala_autonomica(c).centimos().arrays() for c in comunidades]
+    ancho = max(len(limites) for limites, _, _, _ in tablas)
+
+    def apilar(posicion):
+        # Las columnas sobrantes repiten el último tramo (límite infinito)
+        tabla = np.empty((len(tablas), ancho), dtype=np.int64)
+        for i, t in enumerate(tablas):
+            tabla[i, :len(t[posicion])] = t[posicion]
+            tabla[i, len(t[posicion]):] = t[posicion][-1]
+        return tabla
+
+    limites = apilar(0)
+    tipos = apilar(1).ravel()
+    inicios = apilar(2).ravel()
+    acumulado = apilar(3).ravel()
+
+    tramo = indice_comunidad * ancho
+    for j in range(ancho - 1):
+        tramo += limites[:, j][indice_comunidad] < bases
+    cuota = dividir_array(acumulado[tramo] + (bases - inicios[tramo]) * tipos[tramo], ESCALA_TIPOS)
+    return np.where(bases > 0, cuota, 0), tipos[tramo]
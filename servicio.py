@@ -0,0 +1,472 @@
+"""
+Servicio HTTP local del motor de cálculo
+Servidor asyncio de la biblioteca estándar (HTTP/1.1 con keep-alive) que
+mantiene cargados el motor y los paquetes de reglas de todos los ejercicios.
+Los registros sueltos que llegan a la vez se agrupan durante una ventana
+corta en un solo lote del motor vectorial. Con carga, cada lote reúne todo lo
+que llegó mientras se calculaba el anterior, así que el rendimiento crece con
+el kernel por lotes y la latencia no se dispara con el número de peticiones.
+
+Endpoints:
+    POST /calcular              objeto JSON `datos` -> fila de resultados (COLUMNAS_SALIDA)
+    POST /calcular?detalle=1    resultado completo de calcular_renta_total
+    POST /lote                  lista JSON de registros -> {'resultados': [...], 'errores': [...]}
+    GET  /salud                 versiones de las reglas y estadísticas de los lotes
+
+Uso:
+    python -m irpf servir --puerto 8080 --ventana-ms 2
+    python -m irpf carga http://127.0.0.1:8080/calcular --conexiones 64 --peticiones 20000
+"""
+
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from lotes import COLUMNAS_SALIDA, calcular_filas, convertir_registro, convertir_valores, procesar_bloque
+
+
+# Mayor cuerpo de petición aceptado, en bytes
+TAMANO_MAXIMO_CUERPO = 64 * 1024 * 1024
+
+# Lotes más pequeños que esto se calculan con el motor escalar: el vectorial
+# tiene un coste fijo (~0,9 ms) que solo compensa a partir de unos 16 registros
+LOTE_MINIMO_VECTORIAL = 16
+
+_MOTIVOS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    411: 'Length Required',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error'
+}
+
+
+class ErrorPeticion(Exception):
+    """Error que se devuelve al cliente con su código HTTP"""
+
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+class AgrupadorLotes:
+    """
+    Junta los registros que llegan a la vez en un solo lote del motor vectorial
+
+    Los lotes se calculan de uno en uno en `ejecutor` y, mientras tanto, el
+    bucle de eventos sigue aceptando registros para el siguiente. Si el lote
+    anterior reunió más de un registro (hay carga), el primero de cada lote
+    espera además como mucho `ventana` segundos a que lleguen más; con un
+    solo cliente no se espera nunca.
+
+    Args:
+        ventana (float): espera máxima del primer registro de cada lote, en segundos
+        lote_maximo (int): registros como mucho por lote
+        ejecutor: ejecutor de un solo hilo donde se calculan los lotes
+    """
+
+    def __init__(self, ventana=0.002, lote_maximo=4096, ejecutor=None):
+        if lote_maximo < 1:
+            raise ValueError("El lote máximo debe ser >= 1")
+        self.ventana = ventana
+        self.lote_maximo = lote_maximo
+        self.ejecutor = ejecutor
+        self.lotes = 0
+        self.registros = 0
+        self.mayor_lote = 0
+        self._cola = None
+        self._tarea = None
+
+    def iniciar(self):
+        """Arranca la tarea que forma y calcula los lotes (dentro del bucle de eventos)"""
+        self._cola = asyncio.Queue()
+        self._tarea = asyncio.get_running_loop().create_task(self._bucle())
+
+    async def detener(self):
+        self._tarea.cancel()
+        try:
+            await self._tarea
+        except asyncio.CancelledError:
+            pass
+
+    async def calcular(self, identificador, registro):
+        """
+        Calcula un registro dentro del próximo lote
+
+        Args:
+            identificador: valor de la columna 'registro' de la fila
+            registro (list): valores en el orden de CAMPOS (convertir_valores)
+
+        Returns:
+            list: fila en el orden de COLUMNAS_SALIDA
+        """
+        futuro = asyncio.get_running_loop().create_future()
+        self._cola.put_nowait((identificador, registro, futuro))
+        return await futuro
+
+    def estadisticas(self):
+        return {
+            'lotes': self.lotes,
+            'registros': self.registros,
+            'registros_por_lote': self.registros / self.lotes if self.lotes else 0.0,
+            'mayor_lote': self.mayor_lote
+        }
+
+    async def _bucle(self):
+        bucle = asyncio.get_running_loop()
+        cola = self._cola
+        anterior = 0
+        while True:
+            pendientes = [await cola.get()]
+            # Sin carga la ventana solo añadiría latencia, y si ya hay un lote
+            # completo esperando tampoco tiene sentido esperar más
+            if self.ventana > 0 and anterior > 1 and cola.qsize() + 1 < self.lote_maximo:
+                await asyncio.sleep(self.ventana)
+            while len(pendientes) < self.lote_maximo and not cola.empty():
+                pendientes.append(cola.get_nowait())
+
+            identificadores = [identificador for identificador, _, _ in pendientes]
+            registros = [registro for _, registro, _ in pendientes]
+            motor = 'vectorial' if len(pendientes) >= LOTE_MINIMO_VECTORIAL else 'escalar'
+            try:
+                filas = await bucle.run_in_executor(
+                    self.ejecutor, calcular_filas, identificadores, registros, motor
+                )
+            except Exception as error:
+                for _, _, futuro in pendientes:
+                    if not futuro.done():
+                        futuro.set_exception(error)
+                continue
+
+            anterior = len(pendientes)
+            self.lotes += 1
+            self.registros += len(pendientes)
+            self.mayor_lote = max(self.mayor_lote, len(pendientes))
+            for (_, _, futuro), fila in zip(pendientes, filas):
+                # El cliente puede haberse ido mientras se calculaba
+                if not futuro.done():
+                    futuro.set_result(fila)
+
+
+class ServicioRenta:
+    """
+    Atiende las conexiones HTTP del servicio
+
+    Args:
+        ventana (float): ventana de agrupación de /calcular, en segundos
+        lote_maximo (int): registros como mucho por lote de /calcular
+    """
+
+    def __init__(self, ventana=0.002, lote_maximo=4096):
+        # Un solo hilo de cálculo: el motor vectorial ya aprovecha cada lote y
+        # así los lotes no compiten entre sí por el GIL
+        self.ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='irpf-calculo')
+        self.agrupador = AgrupadorLotes(ventana, lote_maximo, self.ejecutor)
+        self.peticiones = 0
+        self.inicio = time.time()
+
+    def precalentar(self):
+        """Carga las reglas de todos los ejercicios y el motor vectorial antes de aceptar peticiones"""
+        from reglas import EJERCICIOS, reglas_ejercicio
+        for ejercicio in EJERCICIOS:
+            reglas_ejercicio(ejercicio)
+            registro = convertir_valores({'ejercicio': ejercicio})
+            calcular_filas([None], [registro], 'escalar')
+            calcular_filas([None], [registro], 'vectorial')
+
+    async def atender(self, lector, escritor):
+        """Atiende una conexión: peticiones sucesivas mientras el cliente la mantenga abierta"""
+        try:
+            while True:
+                try:
+                    peticion = await _leer_peticion(lector)
+                except ErrorPeticion as error:
+                    await _responder(escritor, error.estado, {'error': str(error)}, cerrar=True)
+                    return
+                if peticion is None:
+                    return
+                metodo, destino, version, cabeceras, cuerpo = peticion
+                self.peticiones += 1
+
+                try:
+                    estado, respuesta = 200, await self.despachar(metodo, destino, cuerpo)
+                except ErrorPeticion as error:
+                    estado, respuesta = error.estado, {'error': str(error)}
+                except Exception as error:
+                    estado, respuesta = 500, {'error': f"{type(error).__name__}: {error}"}
+
+                conexion = cabeceras.get('connection', '').lower()
+                cerrar = conexion == 'close' or (version == 'HTTP/1.0' and conexion != 'keep-alive')
+                await _responder(escritor, estado, respuesta, cerrar)
+                if cerrar:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            escritor.close()
+
+    async def despachar(self, metodo, destino, cuerpo):
+        """
+        Resuelve una petición
+
+        Returns:
+            objeto serializable a JSON con la respuesta
+
+        Raises:
+            ErrorPeticion: con el código HTTP del error
+        """
+        partes = urlsplit(destino)
+        ruta = partes.path.rstrip('/') or '/'
+        consulta = parse_qs(partes.query)
+
+        if ruta == '/salud':
+            _exigir_metodo(metodo, 'GET')
+            return self.salud()
+        if ruta == '/calcular':
+            _exigir_metodo(metodo, 'POST')
+            valores = _leer_json(cuerpo)
+            if not isinstance(valores, dict):
+                raise ErrorPeticion(400, "El cuerpo debe ser un objeto JSON con los campos de la declaración")
+            if consulta.get('detalle', ['0'])[0] not in ('0', '', 'false'):
+                return await self._calcular_detalle(valores)
+            try:
+                registro = convertir_valores(valores)
+            except ValueError as error:
+                raise ErrorPeticion(400, str(error)) from None
+            fila = await self.agrupador.calcular(valores.get('id'), registro)
+            return dict(zip(COLUMNAS_SALIDA, fila))
+        if ruta == '/lote':
+            _exigir_metodo(metodo, 'POST')
+            registros = _leer_json(cuerpo)
+            if not isinstance(registros, list) or not all(isinstance(valores, dict) for valores in registros):
+                raise ErrorPeticion(400, "El cuerpo debe ser una lista JSON de objetos")
+            filas, errores, _ = await asyncio.get_running_loop().run_in_executor(
+                self.ejecutor, procesar_bloque, 1, registros
+            )
+            return {'resultados': [dict(zip(COLUMNAS_SALIDA, fila)) for fila in filas], 'errores': errores}
+        raise ErrorPeticion(404, f"No existe {ruta}")
+
+    async def _calcular_detalle(self, valores):
+        from renta import calcular_renta_total
+        try:
+            contribuyente = convertir_registro(valores)
+        except ValueError as error:
+            raise ErrorPeticion(400, str(error)) from None
+        return await asyncio.get_running_loop().run_in_executor(
+            self.ejecutor, calcular_renta_total, contribuyente
+        )
+
+    def salud(self):
+        from reglas import EJERCICIOS, reglas_ejercicio
+        return {
+            'estado': 'ok',
+            'segundos_activo': round(time.time() - self.inicio, 1),
+            'peticiones': self.peticiones,
+            'reglas': {str(ejercicio): reglas_ejercicio(ejercicio).version for ejercicio in EJERCICIOS},
+            'agrupador': {
+                'ventana_ms': self.agrupador.ventana * 1000,
+                'lote_maximo': self.agrupador.lote_maximo,
+                **self.agrupador.estadisticas()
+            }
+        }
+
+
+def _exigir_metodo(metodo, esperado):
+    if metodo != esperado:
+        raise ErrorPeticion(405, f"Método {metodo} no admitido (usa {esperado})")
+
+
+def _leer_json(cuerpo):
+    try:
+        return json.loads(cuerpo)
+    except (UnicodeDecodeError, json.JSONDecodeError) as error:
+        raise ErrorPeticion(400, f"JSON no válido: {error}") from None
+
+
+async def _leer_peticion(lector):
+    """
+    Lee una petición HTTP/1.x
+
+    Returns:
+        (método, destino, versión, cabeceras, cuerpo), o None si el cliente cerró la conexión
+
+    Raises:
+        ErrorPeticion: si la petición no es válida
+    """
+    linea = await lector.readline()
+    if not linea:
+        return None
+    try:
+        metodo, destino, version = linea.decode('latin-1').split()
+    except ValueError:
+        raise ErrorPeticion(400, "Línea de petición no válida") from None
+
+    cabeceras = {}
+    while True:
+        linea = await lector.readline()
+        if linea in (b'\r\n', b'\n', b''):
+            break
+        nombre, _, valor = linea.decode('latin-1').partition(':')
+        cabeceras[nombre.strip().lower()] = valor.strip()
+
+    if 'transfer-encoding' in cabeceras:
+        raise ErrorPeticion(411, "Se necesita Content-Length (no se admite chunked)")
+    try:
+        longitud = int(cabeceras.get('content-length', 0))
+    except ValueError:
+        raise ErrorPeticion(400, "Content-Length no válido") from None
+    if longitud > TAMANO_MAXIMO_CUERPO:
+        raise ErrorPeticion(413, f"El cuerpo supera {TAMANO_MAXIMO_CUERPO:,} bytes")
+    cuerpo = await lector.readexactly(longitud) if longitud > 0 else b''
+    return metodo, destino, version, cabeceras, cuerpo
+
+
+async def _responder(escritor, estado, respuesta, cerrar=False):
+    cuerpo = json.dumps(respuesta, ensure_ascii=False).encode('utf-8')
+    cabecera = (
+        f"HTTP/1.1 {estado} {_MOTIVOS[estado]}\r\n"
+        f"Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(cuerpo)}\r\n"
+        f"{'Connection: close' if cerrar else 'Connection: keep-alive'}\r\n\r\n"
+    )
+    escritor.write(cabecera.encode('ascii') + cuerpo)
+    await escritor.drain()
+
+
+async def servir(host='127.0.0.1', puerto=8080, ventana=0.002, lote_maximo=4096, al_escuchar=None):
+    """
+    Ejecuta el servicio hasta que se cancele
+
+    Args:
+        host (str), puerto (int): dirección de escucha (puerto 0 = uno libre)
+        ventana (float): ventana de agrupación, en segundos
+        lote_maximo (int): registros como mucho por lote
+        al_escuchar: función opcional llamada con (host, puerto) al empezar a escuchar
+    """
+    servicio = ServicioRenta(ventana, lote_maximo)
+    servicio.precalentar()
+    servicio.agrupador.iniciar()
+    servidor = await asyncio.start_server(servicio.atender, host, puerto, backlog=1024)
+    try:
+        if al_escuchar is not None:
+            al_escuchar(*servidor.sockets[0].getsockname()[:2])
+        async with servidor:
+            await servidor.serve_forever()
+    finally:
+        await servicio.agrupador.detener()
+        servicio.ejecutor.shutdown(wait=False)
+
+
+def ejecutar_servicio(args):
+    """Comando `servir` de la línea de comandos"""
+    def al_escuchar(host, puerto):
+        print(
+            f"Escuchando en http://{host}:{puerto} (ventana {args.ventana_ms:g} ms, "
+            f"lotes de hasta {args.lote_maximo:,})",
+            file=sys.stderr
+        )
+
+    try:
+        asyncio.run(servir(args.host, args.puerto, args.ventana_ms / 1000, args.lote_maximo, al_escuchar))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+# ===== Generador de carga =====
+
+async def probar_carga(url, conexiones=64, peticiones=10000, registros=None):
+    """
+    Lanza peticiones POST concurrentes contra el servicio y mide la latencia
+
+    Cada conexión keep-alive envía sus peticiones una tras otra, así que
+    `conexiones` es el número de peticiones en vuelo.
+
+    Args:
+        url (str): endpoint, p. ej. http://127.0.0.1:8080/calcular
+        conexiones (int): conexiones simultáneas
+        peticiones (int): peticiones en total
+        registros (list): cuerpos a enviar por turnos (por defecto, los perfiles del benchmark)
+
+    Returns:
+        dict con peticiones, errores, segundos, peticiones_por_segundo y
+        latencias p50, p90, p99 y máxima en ms
+    """
+    if registros is None:
+        from benchmark import PERFILES
+        registros = list(PERFILES.values())
+    partes = urlsplit(url)
+    destino = partes.path + (f"?{partes.query}" if partes.query else '')
+    cuerpos = [json.dumps(registro).encode('utf-8') for registro in registros]
+    peticiones_cuerpo = [
+        (
+            f"POST {destino} HTTP/1.1\r\nHost: {partes.netloc}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(cuerpo)}\r\n\r\n"
+        ).encode('ascii') + cuerpo
+        for cuerpo in cuerpos
+    ]
+
+    latencias = []
+    errores = 0
+    siguiente = 0
+
+    async def conexion():
+        nonlocal errores, siguiente
+        lector, escritor = await asyncio.open_connection(partes.hostname, partes.port or 80)
+        try:
+            while siguiente < peticiones:
+                numero = siguiente
+                siguiente += 1
+                inicio = time.perf_counter()
+                escritor.write(peticiones_cuerpo[numero % len(peticiones_cuerpo)])
+                await escritor.drain()
+                estado = int((await lector.readline()).split()[1])
+                longitud = 0
+                while True:
+                    linea = await lector.readline()
+                    if linea in (b'\r\n', b''):
+                        break
+                    if linea.lower().startswith(b'content-length:'):
+                        longitud = int(linea.split(b':')[1])
+                await lector.readexactly(longitud)
+                latencias.append(time.perf_counter() - inicio)
+                if estado != 200:
+                    errores += 1
+        finally:
+            escritor.close()
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(conexion() for _ in range(conexiones)))
+    segundos = time.perf_counter() - inicio
+
+    latencias.sort()
+    percentil = lambda p: latencias[min(len(latencias) - 1, int(p * len(latencias)))] * 1000
+    return {
+        'peticiones': len(latencias),
+        'errores': errores,
+        'segundos': segundos,
+        'peticiones_por_segundo': len(latencias) / segundos,
+        'p50_ms': percentil(0.50),
+        'p90_ms': percentil(0.90),
+        'p99_ms': percentil(0.99),
+        'maxima_ms': latencias[-1] * 1000
+    }
+
+
+def ejecutar_carga(args):
+    """Comando `carga` de la línea de comandos"""
+    medida = asyncio.run(probar_carga(args.url, args.conexiones, args.peticiones))
+    print(
+        f"{medida['peticiones']:,} peticiones ({medida['errores']:,} con error) en {medida['segundos']:.2f} s: "
+        f"{medida['peticiones_por_segundo']:,.0f} peticiones/s"
+    )
+    print(
+        f"latencia p50 {medida['p50_ms']:.2f} ms, p90 {medida['p90_ms']:.2f} ms, "
+        f"p99 {medida['p99_ms']:.2f} ms, máxima {medida['maxima_ms']:.2f} ms"
+    )
+    return 1 if medida['errores'] else 0
@@ -0,0 +1,86 @@
+"""
+Configuración de pytest
+Los módulos del proyecto están en la raíz del repositorio; `perfiles` da los
+perfiles aleatorios con los que se comparan los motores.
+"""
+
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deducciones_autonomicas import ESCALAS_AUTONOMICAS
+from reglas import EJERCICIOS
+
+
+def perfil_aleatorio(aleatorio):
+    """
+    Dict del formulario con valores aleatorios de todos los apartados
+
+    Cada campo falta (y toma su valor por defecto) con probabilidad 0,1; los
+    importes van redondeados al céntimo, como los de un formulario real.
+    """
+    r = aleatorio
+    importe = lambda maximo: round(r.uniform(0, maximo), 2)
+    datos = {
+        'ejercicio': r.choice(EJERCICIOS),
+        'comunidad': r.choice(list(ESCALAS_AUTONOMICAS) + ['Desconocida']),
+        'estado_civil': r.choice([None, 'soltero', 'casado']),
+        'edad': r.randint(18, 90),
+        'discapacidad': r.random() < 0.2,
+        'grado_discapacidad': r.randint(33, 100),
+        'familia_numerosa': r.random() < 0.3,
+        'familia_numerosa_especial': r.random() < 0.3,
+        'hijos_menores_3': r.randint(0, 3),
+        'hijos_mayores_3': r.randint(0, 4),
+        'hijos_con_discapacidad': r.randint(0, 1),
+        'nacimiento_ultimo_ano': r.random() < 0.3,
+        'ascendientes_mayores_65_a_cargo': r.randint(0, 2),
+        'ascendientes_mayores_75_a_cargo': r.randint(0, 2),
+        'salario': r.choice([0, importe(20000), importe(400000)]),
+        'retenciones': importe(20000),
+        'es_autonomo': r.random() < 0.3,
+        'regimen_autonomo': r.choice([None, 'estimacion_directa_simplificada', 'estimacion_directa_normal']),
+        'ingresos_autonomo': importe(100000),
+        'gastos_autonomo': importe(50000),
+        'pagos_fraccionados_autonomo': importe(5000),
+        'mutualidad': importe(3000),
+        'alquiler_ingresos': r.choice([0, importe(30000)]),
+        'alquiler_gastos': importe(1000),
+        'ibi': importe(800),
+        'gastos_comunidad': importe(1000),
+        'seguro_hogar': importe(300),
+        'reparaciones': importe(2000),
+        'intereses_hipoteca': importe(3000),
+        'valor_construccion_alquiler': r.choice([0, importe(200000)]),
+        'valor_compra_inmueble': importe(300000),
+        'arrendatario_menor_30': r.random() < 0.5,
+        'tiene_segunda_vivienda': r.random() < 0.3,
+        'valor_catastral_segunda': importe(200000),
+        'valor_catastral_revisado': r.random() < 0.5,
+        'dividendos': importe(20000),
+        'intereses': importe(5000),
+        'ganancias': r.choice([0, importe(500000)]),
+        'perdidas_patrimoniales': importe(10000),
+        'perdidas_pendientes_anos_anteriores': importe(5000),
+        'plan_pensiones': importe(3000),
+        'pensiones_compensatorias': importe(2000),
+        'vivienda_habitual': r.random() < 0.3,
+        'vivienda_importe': importe(12000),
+        'donaciones': r.choice([0, importe(150), importe(2000)]),
+        'donacion_plurianual': r.random() < 0.5,
+        'maternidad': r.random() < 0.5,
+        'alquiler_vivienda_habitual_pagado': r.choice([0, importe(12000)]),
+        'gastos_guarderia': r.choice([0, importe(3000)]),
+    }
+    return {campo: valor for campo, valor in datos.items() if r.random() >= 0.1}
+
+
+@pytest.fixture(scope='session')
+def perfiles():
+    """300 perfiles aleatorios (siempre los mismos)"""
+    aleatorio = random.Random(2024)
+    return [perfil_aleatorio(aleatorio) for _ in range(300)]
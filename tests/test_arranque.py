@@ -0,0 +1,65 @@
+"""
+Presupuesto de arranque de app.py
+Importa la aplicación en un proceso nuevo bajo `python -X importtime` y
+compara los tiempos acumulados con PRESUPUESTO de arranque.py.
+"""
+
+import subprocess
+import sys
+
+from arranque import DIRECTORIO_APP, MARCA_APP, MODULOS_PESADOS, PRESUPUESTO, leer_importtime
+
+# Holgura sobre el presupuesto: el proceso de los tests comparte la máquina
+MARGEN = 1.5
+
+# Streamlit se importa antes de la marca: el presupuesto de importaciones es
+# el de lo que carga app.py por su cuenta
+_PROGRAMA = f'''
+import sys
+import streamlit
+print({MARCA_APP!r}, file=sys.stderr, flush=True)
+import app
+'''
+
+
+def _importar_app():
+    proceso = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _PROGRAMA],
+        cwd=DIRECTORIO_APP, capture_output=True, text=True, encoding='utf-8'
+    )
+    assert proceso.returncode == 0, proceso.stderr[-2000:]
+    _, _, despues = proceso.stderr.partition(MARCA_APP)
+    return leer_importtime(despues)
+
+
+def test_leer_importtime():
+    texto = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |     estilos\n"
+        "import time:       300 |        450 |   historial\n"
+        "import time:      5000 |       5570 | app\n"
+        "otra línea\n"
+    )
+    assert leer_importtime(texto) == [
+        ('estilos', 120, 120, 2),
+        ('historial', 300, 450, 1),
+        ('app', 5000, 5570, 0),
+    ]
+
+
+def test_importar_app_cabe_en_el_presupuesto():
+    importaciones = _importar_app()
+    acumulado = {modulo: tiempo for modulo, _, tiempo, nivel in importaciones if nivel == 0}
+    assert 'app' in acumulado
+
+    # Lo que importa app.py directamente (Streamlit ya está cargado)
+    propias = sum(tiempo for _, _, tiempo, nivel in importaciones if nivel == 1) / 1000
+    presupuesto = PRESUPUESTO['calculadora']
+    assert propias <= presupuesto['importaciones'] * MARGEN
+    # Importar app.py ejecuta la página inicial entera
+    assert acumulado['app'] / 1000 <= presupuesto['primera'] * MARGEN
+
+
+def test_importar_app_no_carga_el_motor():
+    cargados = {modulo for modulo, _, _, _ in _importar_app()}
+    assert not cargados & set(MODULOS_PESADOS)
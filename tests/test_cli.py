@@ -0,0 +1,107 @@
+"""
+Comandos batch, stream, convertir e informes de irpf.py, de ida y vuelta
+por ficheros temporales
+"""
+
+import csv
+import json
+import zipfile
+
+import pytest
+
+from irpf import main
+from renta import calcular_renta_total
+
+REGISTROS = 60
+
+
+@pytest.fixture
+def entrada(tmp_path, perfiles):
+    """Fichero JSONL con los primeros REGISTROS perfiles, con 'id'"""
+    ruta = tmp_path / 'registros.jsonl'
+    with open(ruta, 'w', encoding='utf-8') as fichero:
+        for numero, datos in enumerate(perfiles[:REGISTROS]):
+            fichero.write(json.dumps({'id': f'R{numero:03d}', **datos}, ensure_ascii=False) + '\n')
+    return ruta
+
+
+def _leer_csv(ruta):
+    with open(ruta, newline='', encoding='utf-8') as fichero:
+        return list(csv.DictReader(fichero))
+
+
+def test_batch_igual_que_calcular(tmp_path, entrada, perfiles):
+    salida = tmp_path / 'resultados.csv'
+    assert main(['batch', str(entrada), str(salida)]) == 0
+
+    filas = _leer_csv(salida)
+    assert [fila['registro'] for fila in filas] == [f'R{numero:03d}' for numero in range(REGISTROS)]
+    for fila, datos in zip(filas, perfiles):
+        resultado = calcular_renta_total(datos, detalle=False)
+        assert float(fila['cuota_diferencial']) == pytest.approx(
+            resultado['cuota_diferencial']['diferencial'], abs=0.01
+        )
+        assert float(fila['base_imponible_general']) == pytest.approx(
+            resultado['resumen']['base_imponible_general'], abs=0.01
+        )
+
+
+@pytest.mark.parametrize('motor', ['escalar', 'vectorial_centimos', 'escalar_centimos'])
+def test_batch_mismos_resultados_con_cada_motor(tmp_path, entrada, motor):
+    vectorial = tmp_path / 'vectorial.csv'
+    otro = tmp_path / f'{motor}.csv'
+    assert main(['batch', str(entrada), str(vectorial)]) == 0
+    assert main(['batch', str(entrada), str(otro), '--motor', motor]) == 0
+
+    for fila, fila_motor in zip(_leer_csv(vectorial), _leer_csv(otro), strict=True):
+        assert fila['registro'] == fila_motor['registro']
+        assert float(fila['cuota_diferencial']) == pytest.approx(float(fila_motor['cuota_diferencial']), abs=0.05)
+
+
+def test_stream_igual_que_batch(tmp_path, entrada):
+    lote = tmp_path / 'batch.csv'
+    flujo = tmp_path / 'stream.csv'
+    assert main(['batch', str(entrada), str(lote)]) == 0
+    assert main(['stream', str(entrada), str(flujo), '--bloque', '7']) == 0
+    assert flujo.read_bytes() == lote.read_bytes()
+
+
+def test_convertir_y_calcular_binario(tmp_path, entrada):
+    binario = tmp_path / 'registros.irpfbin'
+    desde_jsonl = tmp_path / 'jsonl.csv'
+    desde_binario = tmp_path / 'binario.csv'
+    assert main(['convertir', str(entrada), str(binario)]) == 0
+    assert main(['batch', str(entrada), str(desde_jsonl)]) == 0
+    assert main(['batch', str(binario), str(desde_binario)]) == 0
+    assert desde_binario.read_bytes() == desde_jsonl.read_bytes()
+
+
+def test_informes(tmp_path, entrada, perfiles):
+    archivo = tmp_path / 'informes.zip'
+    assert main(['informes', str(entrada), str(archivo), '--progreso', '0']) == 0
+
+    with zipfile.ZipFile(archivo) as zip_informes:
+        nombres = zip_informes.namelist()
+        assert len(nombres) == REGISTROS
+        assert nombres[0] == 'informe_00000001_R000.html'
+        informe = zip_informes.read(nombres[0]).decode('utf-8')
+    importe = calcular_renta_total(perfiles[0], detalle=False)['cuota_diferencial']['importe']
+    assert f"{importe:,.2f} €" in informe
+
+
+def test_registros_fallidos(tmp_path, entrada):
+    with open(entrada, 'a', encoding='utf-8') as fichero:
+        fichero.write(json.dumps({'id': 'MAL', 'salario': 'mucho'}) + '\n')
+    salida = tmp_path / 'resultados.csv'
+    errores = tmp_path / 'errores.jsonl'
+    main(['batch', str(entrada), str(salida), '--errores', str(errores)])
+
+    assert len(_leer_csv(salida)) == REGISTROS
+    fallidos = [json.loads(linea) for linea in errores.read_text(encoding='utf-8').splitlines()]
+    assert [fallido['registro'] for fallido in fallidos] == ['MAL']
+
+
+@pytest.mark.parametrize('comando', ['batch', 'convertir', 'informes'])
+def test_entrada_inexistente(tmp_path, capsys, comando):
+    assert main([comando, str(tmp_path / 'no_existe.jsonl'), str(tmp_path / 'salida')]) == 2
+    assert 'Traceback' not in capsys.readouterr().err
@@ -0,0 +1,128 @@
+"""
+Equivalencia de los motores de cálculo
+El motor escalar (renta.py), el vectorial (renta_vectorizada.py) y el de
+céntimos (renta_centimos.py) tienen que dar las mismas cifras para los
+mismos perfiles; y cada modo del motor escalar, el mismo resultado.
+"""
+
+import pytest
+
+from contribuyente import DatosContribuyente, como_contribuyente
+from renta import calcular_renta_total, comparar_comunidades, recalcular_renta
+from renta_centimos import calcular_renta_batch_centimos, calcular_renta_centimos
+from renta_vectorizada import calcular_renta_batch, columnas_desde_registros
+
+# Cifra de calcular_renta_batch -> (sección, clave) del resultado escalar
+CIFRAS_ESCALARES = {
+    'rendimiento_trabajo_neto': ('rendimiento_trabajo', 'neto'),
+    'rendimiento_actividades': ('rendimiento_actividades', 'neto'),
+    'rendimiento_capital_inmobiliario': ('rendimiento_capital_inmobiliario', 'neto_final'),
+    'imputacion_rentas': ('imputacion_rentas', 'importe'),
+    'rendimiento_capital_mobiliario': ('rendimiento_capital_mobiliario', 'total'),
+    'ganancias_patrimoniales': ('ganancias_patrimoniales', 'ganancias_final'),
+    'perdidas_pendientes_compensar': ('ganancias_patrimoniales', 'perdidas_pendientes_compensar'),
+    'reducciones_base': ('reducciones_base', 'total'),
+    'minimo_personal_familiar': ('minimo_personal_familiar', 'total'),
+    'base_imponible_general': ('resumen', 'base_imponible_general'),
+    'base_imponible_ahorro': ('resumen', 'base_imponible_ahorro'),
+    'base_liquidable_general': ('resumen', 'base_liquidable_general'),
+    'base_gravamen_general': ('resumen', 'base_gravamen_general'),
+    'cuota_integra_estatal': ('cuotas_integras', 'estatal_total'),
+    'cuota_integra_autonomica': ('cuotas_integras', 'autonomica_total'),
+    'cuota_integra_total': ('cuotas_integras', 'total'),
+    'deducciones_estatal': ('deducciones', 'total_estatal'),
+    'deducciones_autonomica': ('deducciones', 'total_autonomica'),
+    'cuota_liquida_estatal': ('cuotas_liquidas', 'estatal'),
+    'cuota_liquida_autonomica': ('cuotas_liquidas', 'autonomica'),
+    'cuota_liquida_total': ('cuotas_liquidas', 'total'),
+    'total_pagado': ('cuota_diferencial', 'total_pagado'),
+    'cuota_diferencial': ('cuota_diferencial', 'diferencial'),
+    'tipo_medio': ('resumen', 'tipo_medio'),
+    'tipo_marginal': ('resumen', 'tipo_marginal'),
+    'tipo_marginal_ahorro': ('resumen', 'tipo_marginal_ahorro'),
+}
+
+# Diferencia máxima entre el motor en céntimos y el de coma flotante: el de
+# céntimos redondea cada importe intermedio al céntimo
+TOLERANCIA_CENTIMOS = 0.05
+
+
+def _cifra_escalar(resultado, cifra):
+    seccion, clave = CIFRAS_ESCALARES[cifra]
+    if seccion not in resultado:
+        return 0.0
+    return resultado[seccion][clave]
+
+
+def test_todas_las_cifras_comparadas(perfiles):
+    assert set(calcular_renta_batch(columnas_desde_registros(perfiles[:1]))) == set(CIFRAS_ESCALARES)
+
+
+def test_vectorial_igual_que_escalar(perfiles):
+    lote = calcular_renta_batch(columnas_desde_registros(perfiles))
+    for i, datos in enumerate(perfiles):
+        resultado = calcular_renta_total(datos, detalle=False)
+        for cifra, valores in lote.items():
+            assert valores[i] == pytest.approx(_cifra_escalar(resultado, cifra), rel=1e-9, abs=1e-6), (i, cifra)
+
+
+def test_centimos_igual_que_vectorial(perfiles):
+    columnas = columnas_desde_registros(perfiles)
+    euros = calcular_renta_batch(columnas)
+    centimos = calcular_renta_batch_centimos(columnas)
+    for cifra, valores in centimos.items():
+        if cifra.startswith('tipo'):
+            assert valores == pytest.approx(euros[cifra], abs=0.01), cifra
+        else:
+            assert abs(valores / 100 - euros[cifra]).max() <= TOLERANCIA_CENTIMOS, cifra
+
+
+def test_centimos_escalar_igual_que_lote(perfiles):
+    lote = calcular_renta_batch_centimos(columnas_desde_registros(perfiles))
+    for i, datos in enumerate(perfiles):
+        for cifra, valor in calcular_renta_centimos(datos).items():
+            assert valor == pytest.approx(lote[cifra][i], rel=1e-12, abs=0), (i, cifra)
+
+
+def test_resumen_igual_que_detalle(perfiles):
+    for datos in perfiles:
+        assert dict(calcular_renta_total(datos, detalle=False)) == calcular_renta_total(datos)
+
+
+def test_registro_igual_que_dict(perfiles):
+    for datos in perfiles:
+        registro = DatosContribuyente.desde_dict(datos)
+        assert como_contribuyente(datos) == registro
+        desde_registro = calcular_renta_total(registro)
+        desde_dict = calcular_renta_total(datos)
+        assert desde_registro.pop('datos_entrada') == registro.a_dict()
+        assert desde_dict.pop('datos_entrada') == datos
+        assert desde_registro == desde_dict
+
+
+def test_recalcular_igual_que_calcular(perfiles):
+    for datos in perfiles[:100]:
+        base = calcular_renta_total(datos, detalle=False)
+        for cambios in ({'salario': 45000.0}, {'comunidad': 'Cataluña', 'hijos_menores_3': 2}, {'ganancias': 0.0}):
+            esperado = calcular_renta_total({**datos, **cambios})
+            assert recalcular_renta(base, cambios, detalle=True) == esperado
+
+
+def test_comparar_comunidades_igual_que_calcular(perfiles):
+    for datos in perfiles[:20]:
+        filas = comparar_comunidades(datos)
+        assert [fila['posicion'] for fila in filas] == list(range(1, len(filas) + 1))
+        for fila in filas:
+            resultado = calcular_renta_total({**datos, 'comunidad': fila['comunidad']}, detalle=False)
+            assert fila['cuota_diferencial'] == resultado['cuota_diferencial']['diferencial']
+            assert fila['tipo_marginal'] == resultado['resumen']['tipo_marginal']
+
+
+def test_copia_no_comparte_secciones(perfiles):
+    resultado = calcular_renta_total(perfiles[0], detalle=False)
+    copia = resultado.copia()
+    copia['resumen']['tipo_medio'] = -1
+    copia['deducciones']['total_estatal'] = -1
+    assert resultado['resumen']['tipo_medio'] != -1
+    assert resultado['deducciones']['total_estatal'] != -1
+    assert dict(resultado.copia()) == dict(resultado)
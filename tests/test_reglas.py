@@ -0,0 +1,60 @@
+"""
+Escalas de cada ejercicio
+Fija los tramos que salen de datos_reglas/ para que un cambio en un TOML (o
+en la herencia entre ejercicios) no pase desapercibido.
+"""
+
+import pytest
+
+from reglas import EJERCICIOS, reglas_ejercicio
+
+INF = float('inf')
+
+ESCALA_ESTATAL_GENERAL = [
+    (12450, 0.095), (20200, 0.12), (35200, 0.15), (60000, 0.185), (300000, 0.225), (INF, 0.235)
+]
+
+# Escala del ahorro de cada ejercicio (la estatal y la autonómica son iguales)
+ESCALAS_AHORRO = {
+    2023: [(6000, 0.095), (50000, 0.105), (200000, 0.115), (300000, 0.135), (INF, 0.14)],
+    2024: [(6000, 0.095), (50000, 0.105), (200000, 0.115), (300000, 0.13), (INF, 0.145)],
+    2025: [(6000, 0.095), (50000, 0.105), (200000, 0.115), (300000, 0.135), (INF, 0.15)],
+}
+
+ESCALA_MADRID = [(12450, 0.09), (17707, 0.11), (33007, 0.135), (INF, 0.215)]
+
+
+def test_ejercicios():
+    assert EJERCICIOS == tuple(ESCALAS_AHORRO)
+
+
+@pytest.mark.parametrize('ejercicio', sorted(ESCALAS_AHORRO))
+def test_escala_estatal_general(ejercicio):
+    assert list(reglas_ejercicio(ejercicio).estatal_general) == ESCALA_ESTATAL_GENERAL
+
+
+@pytest.mark.parametrize('ejercicio', sorted(ESCALAS_AHORRO))
+def test_escalas_ahorro(ejercicio):
+    reglas = reglas_ejercicio(ejercicio)
+    assert list(reglas.ahorro_estatal) == ESCALAS_AHORRO[ejercicio]
+    assert list(reglas.ahorro_autonomica) == ESCALAS_AHORRO[ejercicio]
+
+
+@pytest.mark.parametrize('ejercicio', sorted(ESCALAS_AHORRO))
+def test_escalas_autonomicas(ejercicio):
+    # 2023 y 2025 heredan las escalas autonómicas de 2024
+    reglas = reglas_ejercicio(ejercicio)
+    assert list(reglas.escalas_autonomicas['Madrid']) == ESCALA_MADRID
+    assert reglas.tablas['escalas_autonomicas'] == reglas_ejercicio(2024).tablas['escalas_autonomicas']
+
+
+@pytest.mark.parametrize('ejercicio', sorted(ESCALAS_AHORRO))
+def test_escalas_combinadas(ejercicio):
+    reglas = reglas_ejercicio(ejercicio)
+    for base in (0, 5000, 25000, 75000, 250000, 400000):
+        esperada = reglas.ahorro_estatal.cuota(base) + reglas.ahorro_autonomica.cuota(base)
+        assert reglas.ahorro_combinada.cuota(base) == pytest.approx(esperada)
+        for comunidad, escala in reglas.escalas_autonomicas.items():
+            combinada = reglas.general_combinada(comunidad)
+            esperada = reglas.estatal_general.cuota(base) + escala.cuota(base)
+            assert combinada.cuota(base) == pytest.approx(esperada)